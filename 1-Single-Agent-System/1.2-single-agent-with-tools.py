@@ -10,6 +10,9 @@ from autogen_agentchat.ui import Console
 from autogen_ext.models.azure import AzureAIChatCompletionClient
 from azure.core.credentials import AzureKeyCredential
 
+from report_sink import ReportSink
+from semantic_cache import SemanticCache, run_cached
+
 
 load_dotenv(os.path.join("..", ".env"))
 
@@ -43,7 +46,11 @@ def serper_web_search(query: str) -> str:
 
     
 
-def write_report(content: str, filename: str) -> str:
+# Reports are written atomically, off the event loop, into the reports directory.
+report_sink = ReportSink()
+
+
+async def write_report(content: str, filename: str) -> str:
     """
     Write contents to a file, in the form of a report.
 
@@ -55,9 +62,8 @@ def write_report(content: str, filename: str) -> str:
         str: Status of the file writing operation.
     """
     try:
-        with open(filename, "w") as file:
-            file.write(content)
-        return f"Report written to: {filename}"
+        path = await report_sink.write(filename, content)
+        return f"Report written to: {path}"
     except Exception as e:
         return f"Error: {str(e)}"
 
@@ -89,12 +95,16 @@ async def main() -> None:
         system_message="You are a Career Mentor Agent with deep expertise in career development, professional growth, and industry trends. Your goal is to provide thoughtful, strategic, and actionable advice to help users navigate career challenges, make informed decisions, and achieve long-term success. Use the tools at your disposal whenever required. Offer clear, empathetic guidance based on your knowledge, considering the user's background and goals. If the question is outside the domain of career development, politely redirect the user to a more appropriate topic.",
     )
 
+    # Answers to earlier tasks, looked up by meaning, so near-identical tasks are answered from the cache.
+    semantic_cache = SemanticCache(collection_name="career_mentor")
+
     # Run the agent and stream the messages to the console.
 
     task = input("Enter your task: ")  # Get the user input for the task.
 
     # For single-turn conversation, you can use the following code:
-    await Console(career_mentor_agent.run_stream(task=task))
+    await run_cached(semantic_cache, task, lambda task: Console(career_mentor_agent.run_stream(task=task)))
+    print(semantic_cache.stats.report())
 
     # # For multi-turn conversation, you can use the following code:
     # while True:
@@ -12,6 +12,9 @@ from autogen_agentchat.ui import Console
 from autogen_ext.models.azure import AzureAIChatCompletionClient
 from azure.core.credentials import AzureKeyCredential
 
+from report_sink import ReportSink
+from semantic_cache import CacheHit, SemanticCache, run_cached
+
 
 load_dotenv(os.path.join("..", ".env"))
 
@@ -44,7 +47,11 @@ def serper_web_search(query: str) -> str:
     return response.text
     
 
-def write_report(content: str, filename: str) -> str:
+# Reports are written atomically, off the event loop, into the reports directory.
+report_sink = ReportSink()
+
+
+async def write_report(content: str, filename: str) -> str:
     """
     Write contents to a file, in the form of a report.
 
@@ -56,9 +63,8 @@ def write_report(content: str, filename: str) -> str:
         str: Status of the file writing operation.
     """
     try:
-        with open(filename, "w", encoding="utf-8") as file:
-            file.write(content)
-        return f"Content written to: {filename}"
+        path = await report_sink.write(filename, content)
+        return f"Content written to: {path}"
     except Exception as e:
         return f"Error: {str(e)}"
 
@@ -98,6 +104,9 @@ async def main() -> None:
         termination_condition=termination_condition,
     )
 
+    # Answers to earlier tasks, looked up by meaning, so near-identical tasks are answered from the cache.
+    semantic_cache = SemanticCache(collection_name="career_mentor")
+
     # Run the agent and stream the messages to the console.
 
     task = input("Enter your task: ")  # Get the user input for the task.
@@ -106,14 +115,22 @@ async def main() -> None:
     # await Console(team.run_stream(task=task))
 
     # For multi-turn conversation, you can use the following code:
+    # (the first task is answered from the cache if a similar one was answered before; follow-ups depend on the conversation, so they always run)
+    first_task = task
+    result = await run_cached(semantic_cache, task, lambda task: Console(team.run_stream(task=task)))
     while True:
-        stream = team.run_stream(task=task)
-        await Console(stream)
-
         # Get the user response.
         task = input("\nContinue the conversation (type 'exit' to leave): ")
         if task.lower().strip() == "exit":
             break
+
+        if isinstance(result, CacheHit):
+            # The team never saw the cached answer, so pass it along with the follow-up.
+            task = semantic_cache.follow_up(task, first_task, result.messages)
+        stream = team.run_stream(task=task)
+        result = await Console(stream)
+
+    print(semantic_cache.stats.report())
     
     await model_client.close()
 
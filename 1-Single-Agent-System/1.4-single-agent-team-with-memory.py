@@ -5,14 +5,26 @@ import json
 from dotenv import load_dotenv
 import asyncio
 
-from autogen_agentchat.agents import AssistantAgent
-from autogen_agentchat.conditions import TextMessageTermination
-from autogen_agentchat.teams import RoundRobinGroupChat
-from autogen_core.memory import MemoryContent, MemoryMimeType
-from autogen_ext.memory.chromadb import ChromaDBVectorMemory, PersistentChromaDBVectorMemoryConfig
-from autogen_agentchat.ui import Console
-from autogen_ext.models.azure import AzureAIChatCompletionClient
-from azure.core.credentials import AzureKeyCredential
+from lazy_imports import lazy_from, preload
+from memory_writeback import MemoryWriteBack
+from report_sink import ReportSink
+from semantic_cache import CacheHit, SemanticCache, run_cached
+
+# The heavy dependencies are only imported when first used (and preloaded in the background while the user types),
+# so the prompt shows up right away. Equivalent to `from <module> import <name>`.
+AssistantAgent = lazy_from("autogen_agentchat.agents", "AssistantAgent")
+TextMessageTermination = lazy_from("autogen_agentchat.conditions", "TextMessageTermination")
+RoundRobinGroupChat = lazy_from("autogen_agentchat.teams", "RoundRobinGroupChat")
+MemoryContent = lazy_from("autogen_core.memory", "MemoryContent")
+MemoryMimeType = lazy_from("autogen_core.memory", "MemoryMimeType")
+ChromaDBVectorMemory = lazy_from("autogen_ext.memory.chromadb", "ChromaDBVectorMemory")
+PersistentChromaDBVectorMemoryConfig = lazy_from("autogen_ext.memory.chromadb", "PersistentChromaDBVectorMemoryConfig")
+CachedMemory = lazy_from("memory_cache", "CachedMemory")
+memories_fingerprint = lazy_from("memory_cache", "memories_fingerprint")
+MiniLMEmbeddingFunction = lazy_from("embedding_warmup", "MiniLMEmbeddingFunction")
+Console = lazy_from("autogen_agentchat.ui", "Console")
+AzureAIChatCompletionClient = lazy_from("autogen_ext.models.azure", "AzureAIChatCompletionClient")
+AzureKeyCredential = lazy_from("azure.core.credentials", "AzureKeyCredential")
 
 
 load_dotenv(os.path.join("..", ".env"))
@@ -46,7 +58,11 @@ def serper_web_search(query: str) -> str:
     return response.text
     
 
-def write_report(content: str, filename: str) -> str:
+# Reports are written atomically, off the event loop, into the reports directory.
+report_sink = ReportSink()
+
+
+async def write_report(content: str, filename: str) -> str:
     """
     Write contents to a file, in the form of a report.
 
@@ -58,9 +74,8 @@ def write_report(content: str, filename: str) -> str:
         str: Status of the file writing operation.
     """
     try:
-        with open(filename, "w", encoding="utf-8") as file:
-            file.write(content)
-        return f"Content written to: {filename}"
+        path = await report_sink.write(filename, content)
+        return f"Content written to: {path}"
     except Exception as e:
         return f"Error: {str(e)}"
 
@@ -70,9 +85,14 @@ def write_report(content: str, filename: str) -> str:
 # Define the memory for the agent
 
 async def populate_memory():
-    print("Populating memory...")
+    # The memory vectorizes the text with Chroma's default "all-MiniLM-L6-v2" ONNX Model, which it loads itself
+    # (ChromaDBVectorMemory doesn't take an embedding function): adding the memories below loads it, in the background.
+    # (First run may take som time to download the model)
+    # The semantic cache's copy of the model runs on a session shared by every `MiniLMEmbeddingFunction`, from a graph
+    # optimized once & cached on disk: load it as well, so the cache lookup of the task only costs its embedding.
+    await asyncio.to_thread(MiniLMEmbeddingFunction().warmup)
+
     # Initialize ChromaDB memory with custom config
-    # (First run may take som time to download the "all-MiniLM-L6-v2" ONNX Model used to vectorize the text)
     chroma_user_memory = ChromaDBVectorMemory(
         config=PersistentChromaDBVectorMemoryConfig(
             collection_name="preferences",
@@ -114,6 +134,13 @@ async def populate_memory():
 
 
 async def main() -> None:
+    # Populate the memory in the background, while the user types the task.
+    print("Populating memory in the background...")
+    memory_loading = asyncio.create_task(populate_memory())
+    preload(AssistantAgent, RoundRobinGroupChat, Console, AzureAIChatCompletionClient)
+
+    task = await asyncio.to_thread(input, "Enter your task: ")  # Get the user input for the task.
+
     # Create the Client
     model_client = AzureAIChatCompletionClient(
         model="gpt-4o-mini",
@@ -128,7 +155,15 @@ async def main() -> None:
         },
     )
 
-    chroma_user_memory = await populate_memory()  # Populate the memory with initial content.
+    chroma_user_memory = await memory_loading  # The memory, populated with initial content.
+
+    # The preferences the user states along the way are added to the memory in the background, in batches,
+    # so the next turns retrieve them without any turn waiting on the writes.
+    memory_writeback = MemoryWriteBack(chroma_user_memory)
+    memory_writeback.start()
+
+    # Retrievals are cached by query, so a query already answered (and the memory unchanged since) isn't embedded again.
+    cached_memory = CachedMemory(chroma_user_memory)
 
     # Define an AssistantAgent with the model, tools & system message
     # The system message instructs the agent via natural language.
@@ -138,7 +173,7 @@ async def main() -> None:
         tools=[serper_web_search, write_report],
         # We remove the reflect_on_tool_use here because that generates a text message, which would be considered as a termination condition.
         system_message="You are a Career Mentor Agent with deep expertise in career development, professional growth, and industry trends. Your goal is to provide thoughtful, strategic, and actionable advice to help users navigate career challenges, make informed decisions, and achieve long-term success. Use the tools at your disposal whenever required. Offer clear, empathetic guidance based on your knowledge, considering the user's background and goals. If the question is outside the domain of career development, politely redirect the user to a more appropriate topic.",
-        memory=[chroma_user_memory],
+        memory=[cached_memory],
     )
 
     # Termination condition that stops the task if the agent responds with a text message.
@@ -150,20 +185,38 @@ async def main() -> None:
         termination_condition=termination_condition,
     )
 
-    task = input("Enter your task: ")  # Get the user input for the task.
+    # Answers to earlier tasks, looked up by meaning, so near-identical tasks are answered from the cache.
+    # They depend on the memories retrieved for the task as well: they have their own collection (1.2 & 1.3 answer
+    # without memories), and are only reused for the same memories. Retrieving them here caches them for the agent.
+    semantic_cache = SemanticCache(collection_name="career_mentor_memory", embedding_function=MiniLMEmbeddingFunction())
+    memories = memories_fingerprint(await cached_memory.query(task))
 
     # # For single-turn conversation, you can use the following code:
     # await Console(team.run_stream(task=task))
 
     # For multi-turn conversation, you can use the following code:
+    # (the first task is answered from the cache if a similar one was answered before; follow-ups depend on the conversation, so they always run)
+    first_task = task
+    result = await run_cached(semantic_cache, task, lambda task: Console(team.run_stream(task=task)), context=memories)
+    memory_writeback.submit(first_task)
     while True:
-        stream = team.run_stream(task=task)
-        await Console(stream)
-
-        # Get the user response.
-        task = input("\nContinue the conversation (type 'exit' to leave): ")
+        # Get the user response (off the event loop, so the memory writes go on while the user types).
+        task = await asyncio.to_thread(input, "\nContinue the conversation (type 'exit' to leave): ")
         if task.lower().strip() == "exit":
             break
+        user_message = task
+
+        if isinstance(result, CacheHit):
+            # The team never saw the cached answer, so pass it along with the follow-up.
+            task = semantic_cache.follow_up(task, first_task, result.messages)
+        stream = team.run_stream(task=task)
+        result = await Console(stream)
+        memory_writeback.submit(user_message)
+
+    await memory_writeback.close()
+    print(semantic_cache.stats.report())
+    print(memory_writeback.stats.report())
+    print(cached_memory.stats.report())
 
     await chroma_user_memory.clear()
     await chroma_user_memory.close()
@@ -5,19 +5,25 @@ import json
 from dotenv import load_dotenv
 import asyncio
 
-from autogen_agentchat.agents import AssistantAgent
-from autogen_agentchat.conditions import TextMessageTermination
-from autogen_agentchat.teams import RoundRobinGroupChat
-from autogen_ext.tools.langchain import LangChainToolAdapter
-from autogen_agentchat.ui import Console
-from autogen_ext.models.azure import AzureAIChatCompletionClient
-from azure.core.credentials import AzureKeyCredential
-
-from langchain_community.document_loaders import PyPDFLoader
-from langchain_community.vectorstores import Chroma
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain.tools.retriever import create_retriever_tool
+from lazy_imports import lazy_from, preload
+
+# The heavy dependencies are only imported when first used (and preloaded in the background while the user types),
+# so the prompt shows up right away. Equivalent to `from <module> import <name>`.
+AssistantAgent = lazy_from("autogen_agentchat.agents", "AssistantAgent")
+TextMessageTermination = lazy_from("autogen_agentchat.conditions", "TextMessageTermination")
+RoundRobinGroupChat = lazy_from("autogen_agentchat.teams", "RoundRobinGroupChat")
+LangChainToolAdapter = lazy_from("autogen_ext.tools.langchain", "LangChainToolAdapter")
+Console = lazy_from("autogen_agentchat.ui", "Console")
+AzureAIChatCompletionClient = lazy_from("autogen_ext.models.azure", "AzureAIChatCompletionClient")
+AzureKeyCredential = lazy_from("azure.core.credentials", "AzureKeyCredential")
+
+PyPDFLoader = lazy_from("langchain_community.document_loaders", "PyPDFLoader")
+Chroma = lazy_from("langchain_community.vectorstores", "Chroma")
+RecursiveCharacterTextSplitter = lazy_from("langchain_text_splitters", "RecursiveCharacterTextSplitter")
+create_retriever_tool = lazy_from("langchain.tools.retriever", "create_retriever_tool")
+EagerToolsChatCompletionClient = lazy_from("eager_tools", "EagerToolsChatCompletionClient")
+ToolCallStreamTransport = lazy_from("eager_tools", "ToolCallStreamTransport")
+MiniLMEmbeddings = lazy_from("embedding_warmup", "MiniLMEmbeddings")
 
 
 load_dotenv(os.path.join("..", ".env"))
@@ -27,35 +33,57 @@ load_dotenv(os.path.join("..", ".env"))
 # Define the LangChain Tool for RAG using ChromaDB
 
 async def get_rag_tool():
-    # Populate the ChromaDB with initial content.
-    print("Loading documents into the vector store...")
+    # The embedding model (all-MiniLM-L6-v2) runs on ONNX Runtime, from a graph optimized once & cached on disk.
+    # Load it in the background first, so the first query only costs its own embedding.
+    # (First run will download the model & may take a while)
+    embeddings = MiniLMEmbeddings()
+    await asyncio.to_thread(embeddings.warmup)
+
+    # The vector store is persisted, so the documents are only split & embedded when they are new or modified.
+    vectorstore = Chroma(
+        collection_name="rag-chroma",
+        embedding_function=embeddings,
+        persist_directory=os.path.join(".", ".chromadb_rag"),
+    )
+    indexed = {
+        (metadata["source"], metadata.get("modified_at"))
+        for metadata in vectorstore.get(include=["metadatas"])["metadatas"]
+    }
 
-    files = os.listdir(os.path.join(os.path.dirname(__file__), "documents"))
+    # Populate the ChromaDB with the content of the new or modified documents.
+    documents_dir = os.path.join(os.path.dirname(__file__), "documents")
     pages = []
+    present = set()
 
-    for file in files:
+    for file in os.listdir(documents_dir):
         if file.endswith(".pdf"):
-            file_path = os.path.join(os.path.dirname(__file__), "documents", file)
+            file_path = os.path.join(documents_dir, file)
+            present.add(file_path)
+            modified_at = os.path.getmtime(file_path)
+            if (file_path, modified_at) in indexed:
+                continue
+            # Drop the chunks of the previous version of the document (if any).
+            vectorstore.delete(where={"source": file_path})
             loader = PyPDFLoader(file_path)
 
             async for page in loader.alazy_load():
+                page.metadata["modified_at"] = modified_at
                 pages.append(page)
 
-    # This RecursiveCharacterTextSplitter splits a large text into smaller, manageable chunks that fit within the model's context window. 
-    # It uses a set of characters to recursively split the text until the chunks are within the specified size.
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=1000, chunk_overlap=200
-    )
-    doc_splits = text_splitter.split_documents(pages)
+    # Drop the chunks of the documents that were removed from the folder.
+    for source in {source for source, _ in indexed} - present:
+        vectorstore.delete(where={"source": source})
 
-    # Add to vectorDB
-    vectorstore = Chroma.from_documents(
-        documents=doc_splits,
-        collection_name="rag-chroma",
-        embedding=HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2"),     # First run will download the model & may tak a while
-    )
+    if pages:
+        # This RecursiveCharacterTextSplitter splits a large text into smaller, manageable chunks that fit within the model's context window. 
+        # It uses a set of characters to recursively split the text until the chunks are within the specified size.
+        text_splitter = RecursiveCharacterTextSplitter(
+            chunk_size=1000, chunk_overlap=200
+        )
+        doc_splits = text_splitter.split_documents(pages)
 
-    print("Vector Store populated with contents from the PDF file.\n")
+        # Add to vectorDB
+        await asyncio.to_thread(vectorstore.add_documents, doc_splits)
 
     retriever = vectorstore.as_retriever()
 
@@ -74,6 +102,13 @@ async def get_rag_tool():
 
 
 async def main() -> None:
+    # Load the documents into the vector store in the background, while the user types the task.
+    print("Loading documents into the vector store in the background...")
+    rag_tool_loading = asyncio.create_task(get_rag_tool())
+    preload(AssistantAgent, RoundRobinGroupChat, Console, AzureAIChatCompletionClient, LangChainToolAdapter, ToolCallStreamTransport)
+
+    task = await asyncio.to_thread(input, "Enter your task: ")  # Get the user input for the task.
+
     # Create the Client
     model_client = AzureAIChatCompletionClient(
         model="gpt-4o-mini",
@@ -86,17 +121,23 @@ async def main() -> None:
             "vision": True,
             "family": "unknown",
         },
+        # Shows the streamed tool calls to the agent's `EagerToolsChatCompletionClient` as they arrive.
+        transport=ToolCallStreamTransport(),
     )
     
-    rag_tool = await get_rag_tool()
+    rag_tool = await rag_tool_loading
+    print("Vector Store populated with contents from the PDF file.\n")
+    # The retrieval starts as soon as the model has streamed the query, before the end of its message.
+    eager_client = EagerToolsChatCompletionClient(model_client, [LangChainToolAdapter(rag_tool)])
 
     # Define an AssistantAgent with the model, tools & system message
     # The system message instructs the agent via natural language.
     rag_agent = AssistantAgent(
         name="rag_agent",
-        model_client=model_client,
-        # Create the LangChain tool adapter for the RAG tool.
-        tools=[LangChainToolAdapter(rag_tool)],
+        model_client=eager_client,
+        # The LangChain tool adapter for the RAG tool, started early.
+        tools=eager_client.tools,
+        model_client_stream=True,
         system_message="You are a research assistant agent. You will be provided with a tool to retrieve documents from a vector database. Use this tool to answer th user's questions. If you cannot find the answer, please respond with 'I don't know'.",
     )
 
@@ -109,8 +150,6 @@ async def main() -> None:
         termination_condition=termination_condition,
     )
 
-    task = input("Enter your task: ")  # Get the user input for the task.
-
     # # For single-turn conversation, you can use the following code:
     # await Console(team.run_stream(task=task))
 
@@ -0,0 +1,36 @@
+from functools import lru_cache
+from importlib.metadata import version
+from typing import Any
+
+
+# The versions of autogen-ext whose `ChromaDBVectorMemory` internals `chroma_collection` knows.
+SUPPORTED_AUTOGEN_EXT = "0.4."
+
+
+@lru_cache(maxsize=None)
+def _check_autogen_ext() -> None:
+    autogen_ext_version = version("autogen-ext")
+    if not autogen_ext_version.startswith(SUPPORTED_AUTOGEN_EXT):
+        raise RuntimeError(
+            f"chroma_collection() supports autogen-ext {SUPPORTED_AUTOGEN_EXT}x, not {autogen_ext_version}: "
+            "check the internals of ChromaDBVectorMemory, and update it."
+        )
+
+
+def chroma_collection(memory: Any) -> Any:
+    """
+    The Chroma collection of a `ChromaDBVectorMemory` (created if needed), for what its public API doesn't do,
+    e.g. counting the memories, or adding a batch of them with their embeddings.
+
+    The memory doesn't expose its collection, so it is read from the memory's private attributes: this is the only
+    place that does, and it refuses the versions of autogen-ext it wasn't written for, rather than guessing.
+
+    Args:
+        memory (ChromaDBVectorMemory): The memory.
+
+    Returns:
+        Collection: The memory's Chroma collection.
+    """
+    _check_autogen_ext()
+    memory._ensure_initialized()
+    return memory._collection
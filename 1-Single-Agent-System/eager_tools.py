@@ -0,0 +1,292 @@
+import json
+import time
+import asyncio
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Any, AsyncGenerator, Callable, Dict, List, Mapping, Optional, Sequence, Tuple, Union
+
+from autogen_core import CancellationToken
+from autogen_core.models import ChatCompletionClient, CreateResult, LLMMessage, ModelCapabilities, ModelInfo, RequestUsage
+from autogen_core.tools import BaseTool, FunctionTool, Tool, ToolSchema
+from azure.core.pipeline.transport import AioHttpTransport
+
+
+@dataclass
+class EagerStats:
+    """How many tool calls started while the model was still streaming, and the time it saved."""
+
+    started_early: int = 0
+    used_early: int = 0
+    discarded: int = 0
+    saved_seconds: float = 0.0
+
+    def report(self) -> str:
+        return (
+            f"Eager tool calls: {self.started_early} started while streaming, {self.used_early} used, "
+            f"{self.discarded} discarded. Tool latency overlapped with generation: {self.saved_seconds:.1f} s."
+        )
+
+
+def _call_key(name: str, arguments: Mapping[str, Any]) -> Tuple[str, str]:
+    return name, json.dumps(arguments, sort_keys=True)
+
+
+class EagerToolDispatcher:
+    """
+    Starts the tool calls of one agent as soon as their arguments have been streamed, instead of after the model's
+    whole message.
+
+    The tool-call deltas of the streamed completion are accumulated, and once the arguments of a call are a complete
+    JSON object that validates against the tool's arguments, the tool starts running in the background, linked to the
+    cancellation token of the model call (i.e. of the run). When the agent then executes the call, the `EagerTool`
+    picks up the running (or finished) call instead of starting it again, and the agent gathers the results in order,
+    as usual.
+
+    Only give it tools without side effects (e.g. searches & retrievals): if the stream fails after a call was started,
+    the call has run anyway.
+
+    Args:
+        tools (Sequence[BaseTool]): The tools that may start early.
+        stats (EagerStats, optional): The stats to add to, e.g. shared by the dispatchers of all agents.
+    """
+
+    def __init__(self, tools: Sequence[BaseTool[Any, Any]], stats: Optional[EagerStats] = None):
+        self.tools = {tool.name: tool for tool in tools}
+        self.stats = stats or EagerStats()
+        self._started: Dict[Tuple[str, str], List[Tuple[asyncio.Task, float]]] = {}
+        self._cancellation_token: Optional[CancellationToken] = None
+        # The server-sent events not fully received yet, and the tool calls of the streamed message.
+        self._buffer = b""
+        self._calls: Dict[Any, Dict[str, Any]] = {}
+
+    def begin(self, cancellation_token: Optional[CancellationToken]) -> None:
+        """A new completion starts streaming: the calls of the previous one that weren't claimed are discarded."""
+        self.discard()
+        self._cancellation_token = cancellation_token
+        self._buffer = b""
+        self._calls = {}
+
+    def start(self, name: str, arguments: str) -> bool:
+        """Start a call, if its arguments are complete and valid. Returns whether it was started."""
+        tool = self.tools.get(name)
+        if tool is None:
+            return False
+        try:
+            args = json.loads(arguments) if arguments else {}
+            if not isinstance(args, dict):
+                return False
+            tool.args_type().model_validate(args)
+        except ValueError:
+            # Incomplete JSON, or invalid arguments: the agent will report the error, as usual.
+            return False
+        cancellation_token = self._cancellation_token or CancellationToken()
+        task = asyncio.create_task(tool.run_json(args, cancellation_token))
+        # Cancelling the run cancels the calls it started early, like the ones the agent starts.
+        cancellation_token.link_future(task)
+        self._started.setdefault(_call_key(name, args), []).append((task, time.monotonic()))
+        self.stats.started_early += 1
+        return True
+
+    def claim(self, name: str, arguments: Mapping[str, Any]) -> Union[Tuple[asyncio.Task, float], None]:
+        """The call started early with these arguments (if any), with the time it started."""
+        started = self._started.get(_call_key(name, arguments))
+        if not started:
+            return None
+        return started.pop(0)
+
+    def discard(self) -> None:
+        """Cancel the calls that were started early but never claimed (e.g. the stream was cut short)."""
+        for started in self._started.values():
+            for task, _ in started:
+                if not task.done():
+                    task.cancel()
+                self.stats.discarded += 1
+        self._started.clear()
+
+    def feed(self, data: bytes) -> None:
+        """Read the bytes of a streamed completion (server-sent events), starting the tool calls whose arguments are complete."""
+        self._buffer += data
+        *lines, self._buffer = self._buffer.split(b"\n")
+        for line in lines:
+            line = line.strip()
+            if not line.startswith(b"data:") or line[5:].strip() == b"[DONE]":
+                continue
+            try:
+                update = json.loads(line[5:])
+            except ValueError:
+                continue
+            for choice in update.get("choices") or []:
+                for delta in (choice.get("delta") or {}).get("tool_calls") or []:
+                    index = delta.get("index", delta.get("id"))
+                    function = delta.get("function") or {}
+                    call = self._calls.setdefault(index, {"name": "", "arguments": "", "started": False})
+                    call["name"] += function.get("name") or ""
+                    call["arguments"] += function.get("arguments") or ""
+                    if not call["started"] and call["arguments"].rstrip().endswith("}"):
+                        call["started"] = self.start(call["name"], call["arguments"])
+
+
+class EagerTool(BaseTool[Any, Any]):
+    """
+    A tool that uses the result of its call started early by the `EagerToolDispatcher`, if any,
+    and otherwise runs as usual.
+
+    Args:
+        tool (BaseTool): The tool to wrap.
+        dispatcher (EagerToolDispatcher): The dispatcher that starts the calls early.
+    """
+
+    def __init__(self, tool: BaseTool[Any, Any], dispatcher: EagerToolDispatcher):
+        super().__init__(tool.args_type(), tool.return_type(), tool.name, tool.description)
+        self.tool = tool
+        self.dispatcher = dispatcher
+
+    @property
+    def schema(self) -> ToolSchema:
+        return self.tool.schema
+
+    async def run(self, args: Any, cancellation_token: CancellationToken) -> Any:
+        return await self.tool.run(args, cancellation_token)
+
+    async def run_json(self, args: Mapping[str, Any], cancellation_token: CancellationToken) -> Any:
+        claimed = self.dispatcher.claim(self.name, args)
+        if claimed is None:
+            return await self.tool.run_json(args, cancellation_token)
+        task, started_at = claimed
+        cancellation_token.link_future(task)
+        claimed_at = time.monotonic()
+        result = await task
+        self.dispatcher.stats.used_early += 1
+        # The part of the call that ran while the model was still streaming.
+        self.dispatcher.stats.saved_seconds += min(claimed_at, time.monotonic()) - started_at
+        return result
+
+    def return_value_as_string(self, value: Any) -> str:
+        return self.tool.return_value_as_string(value)
+
+
+# The dispatcher of the completion being streamed, while its stream is read (in the task reading it).
+_streaming_to: ContextVar[Optional[EagerToolDispatcher]] = ContextVar("eager_tools_streaming_to", default=None)
+
+
+class _TeeingResponse:
+    # A streamed HTTP response, whose bytes are also fed to a dispatcher as they are read.
+    def __init__(self, response: Any, dispatcher: EagerToolDispatcher):
+        self._response = response
+        self._dispatcher = dispatcher
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._response, name)
+
+    async def iter_bytes(self, **kwargs: Any) -> AsyncGenerator[bytes, None]:
+        async for data in self._response.iter_bytes(**kwargs):
+            self._dispatcher.feed(data)
+            yield data
+
+
+class ToolCallStreamTransport(AioHttpTransport):
+    """
+    The HTTP transport to give an `AzureAIChatCompletionClient` (its `transport` argument), so that the
+    `EagerToolsChatCompletionClient`s streaming from it see the tool calls as they arrive. The autogen client only
+    shows them once the whole message has streamed.
+    """
+
+    async def send(self, request: Any, *, stream: bool = False, **kwargs: Any) -> Any:
+        response = await super().send(request, stream=stream, **kwargs)
+        dispatcher = _streaming_to.get()
+        if stream and dispatcher is not None:
+            return _TeeingResponse(response, dispatcher)
+        return response
+
+
+class EagerToolsChatCompletionClient(ChatCompletionClient):
+    """
+    The model client of one agent, which starts the agent's tool calls as soon as their arguments have streamed
+    (see `EagerToolDispatcher`), while the model is still writing the rest of its message. Give the agent its
+    `tools` instead of the original ones, and `model_client_stream=True`.
+
+    The streams are read through the `ToolCallStreamTransport` of the underlying `AzureAIChatCompletionClient`(s):
+    without it, the tools simply start when the agent executes them.
+
+    Args:
+        model_client (ChatCompletionClient): The agent's model client, e.g. an `AzureAIChatCompletionClient`,
+            or the agent's client of a `ModelRouter`.
+        tools: The tools that may start early, or functions (as given to an agent).
+        stats (EagerStats, optional): The stats to add to, e.g. shared by the clients of all agents.
+    """
+
+    def __init__(
+        self,
+        model_client: ChatCompletionClient,
+        tools: Sequence[Union[BaseTool[Any, Any], Callable[..., Any]]],
+        stats: Optional[EagerStats] = None,
+    ):
+        tools = [tool if isinstance(tool, BaseTool) else FunctionTool(tool, description=tool.__doc__ or "") for tool in tools]
+        self.model_client = model_client
+        self.dispatcher = EagerToolDispatcher(tools, stats)
+        self.tools = [EagerTool(tool, self.dispatcher) for tool in tools]
+
+    async def create(
+        self,
+        messages: Sequence[LLMMessage],
+        *,
+        tools: Sequence[Tool | ToolSchema] = [],
+        json_output: Optional[bool] = None,
+        extra_create_args: Mapping[str, Any] = {},
+        cancellation_token: Optional[CancellationToken] = None,
+    ) -> CreateResult:
+        # Not streamed: the calls are all known at once, and the agent runs them as usual.
+        return await self.model_client.create(
+            messages, tools=tools, json_output=json_output, extra_create_args=extra_create_args, cancellation_token=cancellation_token
+        )
+
+    async def create_stream(
+        self,
+        messages: Sequence[LLMMessage],
+        *,
+        tools: Sequence[Tool | ToolSchema] = [],
+        json_output: Optional[bool] = None,
+        extra_create_args: Mapping[str, Any] = {},
+        cancellation_token: Optional[CancellationToken] = None,
+    ) -> AsyncGenerator[Union[str, CreateResult], None]:
+        self.dispatcher.begin(cancellation_token)
+        stream = self.model_client.create_stream(
+            messages, tools=tools, json_output=json_output, extra_create_args=extra_create_args, cancellation_token=cancellation_token
+        )
+        try:
+            while True:
+                # Only set while the stream is read, so the caller's other calls aren't teed to this agent.
+                reading = _streaming_to.set(self.dispatcher)
+                try:
+                    chunk = await stream.__anext__()
+                except StopAsyncIteration:
+                    return
+                finally:
+                    _streaming_to.reset(reading)
+                yield chunk
+        finally:
+            await stream.aclose()
+
+    def count_tokens(self, messages: Sequence[LLMMessage], *, tools: Sequence[Tool | ToolSchema] = []) -> int:
+        return self.model_client.count_tokens(messages, tools=tools)
+
+    def remaining_tokens(self, messages: Sequence[LLMMessage], *, tools: Sequence[Tool | ToolSchema] = []) -> int:
+        return self.model_client.remaining_tokens(messages, tools=tools)
+
+    async def close(self) -> None:
+        self.dispatcher.discard()
+        await self.model_client.close()
+
+    def actual_usage(self) -> RequestUsage:
+        return self.model_client.actual_usage()
+
+    def total_usage(self) -> RequestUsage:
+        return self.model_client.total_usage()
+
+    @property
+    def capabilities(self) -> ModelCapabilities:  # type: ignore
+        return self.model_client.capabilities
+
+    @property
+    def model_info(self) -> ModelInfo:
+        return self.model_client.model_info
@@ -0,0 +1,153 @@
+import os
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from chromadb.api.types import Documents, EmbeddingFunction, Embeddings
+from lazy_imports import lazy_from, lazy_import
+
+# Imported on first use.
+np = lazy_import("numpy")
+ort = lazy_import("onnxruntime")
+Tokenizer = lazy_from("tokenizers", "Tokenizer")
+ONNXMiniLM_L6_V2 = lazy_from("chromadb.utils.embedding_functions.onnx_mini_lm_l6_v2", "ONNXMiniLM_L6_V2")
+
+
+# The number of threads of each embedding (unset lets ONNX Runtime use one per physical core).
+EMBEDDING_THREADS = int(os.getenv("EMBEDDING_THREADS", "0")) or None
+
+# The inference sessions & tokenizers, shared by every `MiniLMEmbeddingFunction` in the process,
+# so the session loaded in the background is the one the vector stores use.
+_sessions: Dict[Tuple[str, ...], Any] = {}
+_tokenizers: Dict[str, Any] = {}
+_lock = threading.Lock()
+
+
+def optimized_model_path(model_dir: str, provider: str) -> str:
+    # The optimized graph depends on the version of ONNX Runtime and on the execution provider.
+    return os.path.join(model_dir, "optimized", f"model.ort-{ort.__version__}.{provider}.onnx")
+
+
+def create_session(model_dir: str, providers: List[str], threads: Optional[int] = EMBEDDING_THREADS) -> Any:
+    """
+    Create an ONNX Runtime session for the model in `model_dir`, from its optimized graph.
+
+    The first time, the graph is optimized and saved next to the model, so later runs load it without
+    optimizing it again. Only the "extended" graph optimizations are saved, since the layout optimizations
+    of "all" are specific to the machine.
+
+    Args:
+        model_dir (str): The directory of `model.onnx`.
+        providers (List[str]): The execution providers, in order of preference.
+        threads (int, optional): The number of threads of each embedding.
+
+    Returns:
+        InferenceSession: The session.
+    """
+    optimized_path = optimized_model_path(model_dir, providers[0])
+    options = ort.SessionOptions()
+    options.log_severity_level = 3
+    if threads:
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+
+    if os.path.exists(optimized_path):
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_DISABLE_ALL
+        return ort.InferenceSession(optimized_path, providers=providers, sess_options=options)
+
+    # Save the optimized graph under a temporary name, then rename it: a run that is interrupted
+    # (or another process doing the same) never leaves a partial graph behind.
+    os.makedirs(os.path.dirname(optimized_path), exist_ok=True)
+    temp_path = f"{optimized_path}.{os.getpid()}.tmp"
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED
+    options.optimized_model_filepath = temp_path
+    session = ort.InferenceSession(os.path.join(model_dir, "model.onnx"), providers=providers, sess_options=options)
+    if os.path.exists(temp_path):
+        os.replace(temp_path, optimized_path)
+    return session
+
+
+def model_dir() -> str:
+    """
+    The directory of all-MiniLM-L6-v2, where Chroma's default embedding function keeps it. The first time,
+    the model is downloaded (by Chroma's embedding function).
+    """
+    directory = os.path.join(ONNXMiniLM_L6_V2.DOWNLOAD_PATH, ONNXMiniLM_L6_V2.EXTRACTED_FOLDER_NAME)
+    if not all(os.path.exists(os.path.join(directory, name)) for name in ("model.onnx", "tokenizer.json")):
+        ONNXMiniLM_L6_V2()(["download"])
+    return directory
+
+
+class MiniLMEmbeddingFunction(EmbeddingFunction[Documents]):
+    """
+    A Chroma embedding function for all-MiniLM-L6-v2, with the same embeddings as Chroma's default one, but on an
+    ONNX Runtime session (and tokenizer) shared by every instance in the process, loaded from a graph optimized once
+    & cached on disk. Give it to the vector stores that take an embedding function, e.g. the `SemanticCache`.
+
+    Args:
+        providers (List[str], optional): The execution providers, in order of preference; all the available ones
+            if not given.
+    """
+
+    def __init__(self, providers: Optional[List[str]] = None):
+        self.providers = providers
+
+    def load(self) -> Tuple[Any, Any]:
+        """The shared session & tokenizer, loaded (and the model downloaded) the first time."""
+        directory = model_dir()
+        providers = self.providers or ort.get_available_providers()
+        key = (directory, *providers)
+        with _lock:
+            if key not in _sessions:
+                _sessions[key] = create_session(directory, list(providers))
+            if directory not in _tokenizers:
+                tokenizer = Tokenizer.from_file(os.path.join(directory, "tokenizer.json"))
+                # Like Chroma's (and sentence-transformers'): 256 tokens.
+                tokenizer.enable_truncation(max_length=256)
+                tokenizer.enable_padding(pad_id=0, pad_token="[PAD]", length=256)
+                _tokenizers[directory] = tokenizer
+            return _sessions[key], _tokenizers[directory]
+
+    def __call__(self, input: Documents) -> Embeddings:
+        session, tokenizer = self.load()
+        embeddings = []
+        for i in range(0, len(input), 32):
+            encoded = tokenizer.encode_batch(list(input[i : i + 32]))
+            input_ids = np.array([e.ids for e in encoded], dtype=np.int64)
+            attention_mask = np.array([e.attention_mask for e in encoded], dtype=np.int64)
+            last_hidden_state = session.run(
+                None,
+                {"input_ids": input_ids, "attention_mask": attention_mask, "token_type_ids": np.zeros_like(input_ids)},
+            )[0]
+            # The mean of the token embeddings (without the padding), normalized.
+            mask = np.broadcast_to(np.expand_dims(attention_mask, -1), last_hidden_state.shape)
+            pooled = np.sum(last_hidden_state * mask, 1) / np.clip(mask.sum(1), a_min=1e-9, a_max=None)
+            norm = np.linalg.norm(pooled, axis=1)
+            norm[norm == 0] = 1e-12
+            embeddings.extend((pooled / norm[:, np.newaxis]).astype(np.float32))
+        return embeddings
+
+    def warmup(self) -> None:
+        """
+        Download (on the first run) and load the model, and embed a short text, so the first real embedding only
+        costs the inference itself. Run it in the background, e.g. while waiting for `input()`.
+        """
+        self(["warm up"])
+
+
+class MiniLMEmbeddings:
+    """
+    LangChain embeddings for all-MiniLM-L6-v2, on the shared ONNX Runtime session of `MiniLMEmbeddingFunction`,
+    instead of loading the model with PyTorch (`HuggingFaceEmbeddings`). The embeddings are the same.
+    """
+
+    def __init__(self):
+        self.embedding_function = MiniLMEmbeddingFunction()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [embedding.tolist() for embedding in self.embedding_function(texts)]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    def warmup(self) -> None:
+        self.embedding_function.warmup()
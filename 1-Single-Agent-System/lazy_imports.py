@@ -0,0 +1,104 @@
+import types
+import importlib
+import threading
+from typing import Any, Callable, Union
+
+
+_UNSET = object()
+
+
+class LazyModule(types.ModuleType):
+    """
+    A stand-in for a module, which imports it on first attribute access.
+
+    Args:
+        name (str): The full name of the module, e.g. "chromadb".
+    """
+
+    def __init__(self, name: str):
+        super().__init__(name)
+        self.__dict__["_module"] = None
+
+    def load(self) -> types.ModuleType:
+        module = self.__dict__["_module"]
+        if module is None:
+            module = importlib.import_module(self.__name__)
+            self.__dict__["_module"] = module
+        return module
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.load(), name)
+
+    def __dir__(self):
+        return dir(self.load())
+
+
+class LazyObject:
+    """
+    A stand-in for an object that is expensive to create (e.g. an embedding model, or a class from a heavy module),
+    which creates it on first use: attribute access, or a call.
+
+    Args:
+        factory (Callable[[], Any]): Creates the object. Called at most once, even from several threads.
+    """
+
+    def __init__(self, factory: Callable[[], Any]):
+        self.__dict__["_factory"] = factory
+        self.__dict__["_value"] = _UNSET
+        self.__dict__["_lock"] = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self.__dict__["_value"] is not _UNSET
+
+    def load(self) -> Any:
+        if self.__dict__["_value"] is _UNSET:
+            with self.__dict__["_lock"]:
+                if self.__dict__["_value"] is _UNSET:
+                    self.__dict__["_value"] = self.__dict__["_factory"]()
+        return self.__dict__["_value"]
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.load(), name)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        setattr(self.load(), name, value)
+
+    def __call__(self, *args: Any, **kwargs: Any) -> Any:
+        return self.load()(*args, **kwargs)
+
+
+def lazy_import(name: str) -> LazyModule:
+    """Get a module that is only imported when one of its attributes is used."""
+    return LazyModule(name)
+
+
+def lazy_from(module: str, name: str) -> LazyObject:
+    """
+    The lazy equivalent of `from <module> import <name>`: the module is only imported when the name is used.
+    It works for anything that is called or whose attributes are used, e.g. classes & functions,
+    but not for `isinstance()` checks.
+    """
+    return LazyObject(lambda: getattr(importlib.import_module(module), name))
+
+
+def preload(*objects: Union[LazyModule, LazyObject]) -> threading.Thread:
+    """
+    Load lazy modules & objects in a background thread, e.g. while waiting for the user's input,
+    so they are ready (or nearly) by the time they are used.
+
+    Returns:
+        threading.Thread: The (daemon) thread that loads them.
+    """
+
+    def load_all() -> None:
+        for obj in objects:
+            try:
+                obj.load()
+            except Exception:
+                # Leave the error to the first real use, where it can be handled.
+                pass
+
+    thread = threading.Thread(target=load_all, name="preload", daemon=True)
+    thread.start()
+    return thread
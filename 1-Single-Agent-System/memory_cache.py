@@ -0,0 +1,175 @@
+import re
+import time
+import hashlib
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Literal, Tuple
+
+from autogen_core import CancellationToken
+from autogen_core.memory import Memory, MemoryContent, MemoryQueryResult, UpdateContextResult
+from autogen_core.model_context import ChatCompletionContext
+from autogen_core.models import FunctionExecutionResultMessage, SystemMessage
+
+from chroma_memory import chroma_collection
+
+
+# What to do when the agent is invoked again right after its tool calls (within the same run):
+# - "query" (the default): retrieve with the tool results as the query, like the wrapped memory does (from the cache
+#   when the same results were already used as a query), so the agent gets the same memories as without the wrapper.
+# - "reuse": no retrieval; the memories retrieved for the user's message are added again.
+# - "skip": no retrieval and no memories; the ones retrieved for the user's message are still in the model context
+#   (unless it is bounded), but the ones the tool results would have retrieved are missing.
+ContinuationPolicy = Literal["skip", "reuse", "query"]
+
+
+def query_fingerprint(text: str) -> str:
+    """
+    The fingerprint of a memory query: its text, lowercased and with its whitespace collapsed, which the
+    embedding model (all-MiniLM-L6-v2 is uncased) doesn't tell apart. Queries with the same fingerprint
+    retrieve the same memories.
+    """
+    return hashlib.sha256(re.sub(r"\s+", " ", text).strip().lower().encode("utf-8")).hexdigest()
+
+
+def tool_results_fingerprint(message: FunctionExecutionResultMessage) -> str:
+    """
+    The fingerprint of tool results used as a memory query: the tools' names & results, without the call ids, which
+    differ on every call, so the same results called again (e.g. a repeated continuation) have the same fingerprint.
+    """
+    results = [f"{result.name}: {result.content}" for result in message.content]
+    return query_fingerprint("Tool results:\n" + "\n".join(results))
+
+
+def memories_fingerprint(memories: MemoryQueryResult) -> str:
+    """
+    The fingerprint of the memories retrieved for a query (in any order), e.g. to cache an answer that depends on them.
+    """
+    contents = sorted(str(memory.content) for memory in memories.results)
+    return hashlib.sha256("\n".join(contents).encode("utf-8")).hexdigest()
+
+
+@dataclass
+class MemoryCacheStats:
+    """How many retrievals the cache answered, skipped or passed on to the memory, and the time it saved."""
+
+    hits: int = 0
+    misses: int = 0
+    skipped: int = 0
+    reused: int = 0
+    query_seconds: float = 0.0
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses + self.skipped + self.reused
+        return (lookups - self.misses) / lookups if lookups else 0.0
+
+    def report(self) -> str:
+        average_query = self.query_seconds / self.misses if self.misses else 0.0
+        avoided = self.hits + self.skipped + self.reused
+        return (
+            f"Memory cache: {self.misses} retrieval(s), {self.hits} hit(s), {self.skipped} skipped & "
+            f"{self.reused} reused on tool continuations ({100 * self.hit_rate:.0f}% avoided).\n"
+            f"Average retrieval: {1000 * average_query:.1f} ms. Time saved: ~{avoided * average_query:.2f} s."
+        )
+
+
+class CachedMemory(Memory):
+    """
+    Wraps a `ChromaDBVectorMemory`, to avoid the retrievals (an embedding and a search) that wouldn't change the
+    memories the agent gets:
+
+    - The memories retrieved for a query are cached by the query's fingerprint, for as long as the memory
+      doesn't change (it is checked with the number of memories, so writes that bypass the wrapper, e.g. the
+      `MemoryWriteBack`, count as well).
+    - When the agent is invoked again after its tool calls, in the same run, its last message is the tool results.
+      By default, they are the query, as for the wrapped memory; "reuse" & "skip" avoid that retrieval, at the cost
+      of changing the memories the agent gets: see `ContinuationPolicy`.
+
+    The memories are added to the model context like the wrapped memory adds them.
+
+    Args:
+        memory (ChromaDBVectorMemory): The memory to wrap.
+        continuation (ContinuationPolicy): What to do on the invocations that follow tool calls.
+        max_entries (int): The number of queries kept in the cache.
+    """
+
+    component_type = "memory"
+
+    def __init__(self, memory: Any, continuation: ContinuationPolicy = "query", max_entries: int = 256):
+        self.memory = memory
+        self.continuation = continuation
+        self.max_entries = max_entries
+        self.stats = MemoryCacheStats()
+        self._cache: "OrderedDict[Tuple[str, int], MemoryQueryResult]" = OrderedDict()
+        # The memories retrieved for the last message that wasn't a tool result.
+        self._last = MemoryQueryResult(results=[])
+
+    def _version(self) -> int:
+        return chroma_collection(self.memory).count()
+
+    async def query(
+        self,
+        query: str | MemoryContent,
+        cancellation_token: CancellationToken | None = None,
+        **kwargs: Any,
+    ) -> MemoryQueryResult:
+        if kwargs or not isinstance(query, str):
+            return await self.memory.query(query, cancellation_token, **kwargs)
+        return await self._query(query, query_fingerprint(query), cancellation_token)
+
+    async def _query(
+        self, query: str, fingerprint: str, cancellation_token: CancellationToken | None = None
+    ) -> MemoryQueryResult:
+        key = (fingerprint, self._version())
+        result = self._cache.get(key)
+        if result is not None:
+            self._cache.move_to_end(key)
+            self.stats.hits += 1
+            return result
+        started = time.monotonic()
+        result = await self.memory.query(query, cancellation_token)
+        self.stats.query_seconds += time.monotonic() - started
+        self.stats.misses += 1
+        self._cache[key] = result
+        if len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+        return result
+
+    async def update_context(self, model_context: ChatCompletionContext) -> UpdateContextResult:
+        messages = await model_context.get_messages()
+        if not messages:
+            return UpdateContextResult(memories=MemoryQueryResult(results=[]))
+
+        last_message = messages[-1]
+        if isinstance(last_message, FunctionExecutionResultMessage) and self.continuation != "query":
+            if self.continuation == "skip":
+                self.stats.skipped += 1
+                return UpdateContextResult(memories=MemoryQueryResult(results=[]))
+            self.stats.reused += 1
+            query_results = self._last
+        else:
+            # The same query as the wrapped memory's. Tool results are cached by their content, without the call ids.
+            query_text = last_message.content if isinstance(last_message.content, str) else str(last_message)
+            if isinstance(last_message, FunctionExecutionResultMessage):
+                query_results = await self._query(query_text, tool_results_fingerprint(last_message))
+            else:
+                query_results = await self.query(query_text)
+                self._last = query_results
+
+        if query_results.results:
+            memory_strings = [f"{i}. {str(memory.content)}" for i, memory in enumerate(query_results.results, 1)]
+            memory_context = "\nRelevant memory content:\n" + "\n".join(memory_strings)
+            await model_context.add_message(SystemMessage(content=memory_context))
+
+        return UpdateContextResult(memories=query_results)
+
+    async def add(self, content: MemoryContent, cancellation_token: CancellationToken | None = None) -> None:
+        await self.memory.add(content, cancellation_token)
+
+    async def clear(self) -> None:
+        self._cache.clear()
+        self._last = MemoryQueryResult(results=[])
+        await self.memory.clear()
+
+    async def close(self) -> None:
+        await self.memory.close()
@@ -0,0 +1,200 @@
+import re
+import time
+import uuid
+import asyncio
+from dataclasses import dataclass
+from typing import Any, List, Optional
+
+from chroma_memory import chroma_collection
+from lazy_imports import lazy_from, lazy_import
+
+# Imported on first use, so importing this module doesn't slow down the startup.
+np = lazy_import("numpy")
+autogen_memory = lazy_import("autogen_core.memory")
+MiniLMEmbeddingFunction = lazy_from("embedding_warmup", "MiniLMEmbeddingFunction")
+
+
+# First-person statements about the user: preferences, goals, background & constraints, with what they are about
+# (a preference verb with nothing after it states nothing).
+PREFERENCE_PATTERN = re.compile(
+    r"\b(i|i'm|i am|i've|i have|i'd|i would|my)\b.{0,20}?\b("
+    r"prefer|rather|like|love|enjoy|hate|dislike|avoid|don't (like|want|enjoy)|want|would like|wish|hope|plan|aim|"
+    r"interested in|value|care about|looking for|background|experience|worked|work as|work at|work in|"
+    r"studied|degree|years|goal|priority|dream|passionate|good at|skilled|based in|live in|moving to"
+    r")\b(?=\s*\w)",
+    re.IGNORECASE,
+)
+
+# Questions & requests phrased as statements ("I want to know what you think about Go vs Rust.",
+# "I'd like you to compare them."): they ask the agent something, they don't tell it about the user.
+INQUIRY_PATTERN = re.compile(
+    r"\b(know|ask|asking|wonder|wondering|curious|understand|find out|hear|tell me|show me|explain|help me)\b|"
+    r"\b(want|like|need) you to\b|\byou (think|recommend|suggest|advise)\b|\byour (thoughts|opinion|view|advice|take)\b",
+    re.IGNORECASE,
+)
+
+
+def extract_preferences(text: str) -> List[str]:
+    """
+    The sentences of a user's message that state something about the user (a preference, a goal, their background),
+    e.g. "I'd rather stay in a technical role." Questions are left out, including the ones phrased as statements
+    (see `INQUIRY_PATTERN`): they ask, they don't tell.
+    """
+    facts = []
+    for sentence in re.split(r"(?<=[.!?])\s+|\n+", text):
+        sentence = sentence.strip(" -*\t")
+        if (
+            15 <= len(sentence) <= 300
+            and not sentence.endswith("?")
+            and PREFERENCE_PATTERN.search(sentence)
+            and not INQUIRY_PATTERN.search(sentence)
+        ):
+            facts.append(sentence)
+    return facts
+
+
+@dataclass
+class WriteBackStats:
+    """What the write-back learned from the conversation, and what its flushes cost (off the agent's turns)."""
+
+    candidates: int = 0
+    duplicates: int = 0
+    written: int = 0
+    failed: int = 0
+    batches: int = 0
+    flush_seconds: float = 0.0
+
+    def report(self) -> str:
+        return (
+            f"Memory write-back: {self.candidates} candidate fact(s), {self.written} written in {self.batches} batch(es), "
+            f"{self.duplicates} duplicate(s) skipped, {self.failed} failed. "
+            f"Time spent flushing (in the background): {self.flush_seconds:.2f} s."
+        )
+
+
+class MemoryWriteBack:
+    """
+    Learns the user's preferences from the conversation, and adds them to a `ChromaDBVectorMemory` in the background,
+    so the agent's next turns retrieve them, without any turn waiting on an embedding or a Chroma write.
+
+    - `submit()` takes the user's message of a finished turn, and queues the sentences that state something
+      about the user (see `extract_preferences`).
+    - The queue is flushed every `flush_interval` seconds, or as soon as it holds `batch_size` facts: the batch is
+      embedded at once, on a worker thread, and the facts at least `dedupe_threshold` similar (cosine) to a memory
+      (or to another fact of the batch) are dropped, so restating a preference doesn't store it twice.
+
+    Args:
+        memory (ChromaDBVectorMemory): The memory to add the facts to.
+        batch_size (int): The number of queued facts that triggers a flush.
+        flush_interval (float): The longest time a fact stays queued, in seconds.
+        dedupe_threshold (float): The cosine similarity from which a fact is a duplicate.
+        category (str): The category of the facts, in their metadata (like the seeded memories).
+        embedding_function (optional): The embedding function of the memory's collection; by default a
+            `MiniLMEmbeddingFunction`, which embeds like Chroma's default one (the one `ChromaDBVectorMemory` uses).
+    """
+
+    def __init__(
+        self,
+        memory: Any,
+        batch_size: int = 8,
+        flush_interval: float = 5.0,
+        dedupe_threshold: float = 0.9,
+        category: str = "preferences",
+        embedding_function: Optional[Any] = None,
+    ):
+        self.memory = memory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.dedupe_threshold = dedupe_threshold
+        self.category = category
+        self.embedding_function = embedding_function or MiniLMEmbeddingFunction()
+        self.stats = WriteBackStats()
+        self._pending: List[str] = []
+        self._wake = asyncio.Event()
+        self._flushing = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+
+    def start(self) -> None:
+        """Start flushing in the background."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def submit(self, message: str) -> int:
+        """
+        Queue the facts about the user in a message (without waiting for them to be written).
+
+        Returns:
+            int: The number of facts queued.
+        """
+        facts = [fact for fact in extract_preferences(message) if fact.casefold() not in {p.casefold() for p in self._pending}]
+        self.stats.candidates += len(facts)
+        self._pending.extend(facts)
+        if len(self._pending) >= self.batch_size:
+            self._wake.set()
+        return len(facts)
+
+    async def _run(self) -> None:
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self.flush()
+
+    async def flush(self) -> None:
+        """Write the queued facts now."""
+        async with self._flushing:
+            batch, self._pending = self._pending, []
+            if not batch:
+                return
+            started = time.monotonic()
+            try:
+                self.stats.written += await asyncio.to_thread(self._write, batch)
+            except Exception as e:
+                self.stats.failed += len(batch)
+                print(f"Memory write-back failed: {type(e).__name__}: {e}")
+            self.stats.batches += 1
+            self.stats.flush_seconds += time.monotonic() - started
+
+    def _write(self, facts: List[str]) -> int:
+        collection = chroma_collection(self.memory)
+        # One embedding pass for the whole batch, used both to find the duplicates and to store the facts.
+        embeddings = np.asarray(self.embedding_function(facts), dtype=np.float32)
+        embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+        nearest = (
+            collection.query(query_embeddings=embeddings.tolist(), n_results=1, include=["embeddings"])["embeddings"]
+            if collection.count()
+            else [[] for _ in facts]
+        )
+        kept: List[int] = []
+        for i, neighbours in enumerate(nearest):
+            candidates = [np.asarray(neighbour, dtype=np.float32) for neighbour in neighbours] + [embeddings[j] for j in kept]
+            if any(
+                float(embeddings[i] @ candidate) / float(np.linalg.norm(candidate)) >= self.dedupe_threshold
+                for candidate in candidates
+            ):
+                self.stats.duplicates += 1
+            else:
+                kept.append(i)
+        if kept:
+            collection.add(
+                ids=[str(uuid.uuid4()) for _ in kept],
+                documents=[facts[i] for i in kept],
+                embeddings=[embeddings[i].tolist() for i in kept],
+                metadatas=[
+                    {"category": self.category, "source": "conversation", "mime_type": str(autogen_memory.MemoryMimeType.TEXT)}
+                    for _ in kept
+                ],
+            )
+        return len(kept)
+
+    async def close(self) -> None:
+        """Stop flushing in the background, and write the facts still queued."""
+        self._closing = True
+        self._wake.set()
+        if self._task is not None:
+            await self._task
+            self._task = None
+        await self.flush()
@@ -0,0 +1,132 @@
+import os
+import asyncio
+import tempfile
+
+
+DEFAULT_REPORTS_DIR = os.getenv("REPORTS_DIR", "reports")
+
+
+class ReportStream:
+    """
+    Writes a report in chunks, as it streams from the model, to a temporary file next to the final one.
+
+    Small chunks (e.g. single tokens) are buffered and written in blocks of `block_size` characters, so the
+    thread pool isn't used once per token. Nothing is visible under the report's name until `commit()`,
+    which replaces the final file atomically; `abort()` discards the temporary file.
+
+    Args:
+        sink (ReportSink): The sink that created the stream.
+        path (str): The final path of the report.
+        strip_suffix (str): A marker (e.g. "TERMINATE") to remove from the end of the report. The last
+            characters are held back until `commit()`, so the marker never reaches the file.
+        block_size (int): The number of characters buffered before each write.
+    """
+
+    def __init__(self, sink: "ReportSink", path: str, strip_suffix: str = "", block_size: int = 64 * 1024):
+        self.sink = sink
+        self.path = path
+        self.strip_suffix = strip_suffix
+        self.block_size = block_size
+        self._buffer = ""
+        self._written = False
+        fd, self._temp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".", suffix=".part")
+        self._file = os.fdopen(fd, "w", encoding="utf-8")
+
+    async def write(self, chunk: str) -> None:
+        self._buffer += chunk
+        # Hold back enough characters to strip the marker (and the whitespace around it) at the end.
+        holdback = len(self.strip_suffix) + 16 if self.strip_suffix else 0
+        if len(self._buffer) - holdback >= self.block_size:
+            block, self._buffer = self._buffer[: len(self._buffer) - holdback], self._buffer[len(self._buffer) - holdback:]
+            await self._write_block(block)
+
+    async def _write_block(self, block: str) -> None:
+        self._written = self._written or bool(block)
+        await asyncio.to_thread(self._file.write, block)
+
+    async def commit(self) -> str:
+        """
+        Write the rest of the report, and move it to its final path.
+
+        Returns:
+            str: The path of the report.
+        """
+        tail = self._buffer.rstrip()
+        if self.strip_suffix and tail.endswith(self.strip_suffix):
+            tail = tail[: -len(self.strip_suffix)].rstrip()
+        if not self._written:
+            tail = tail.lstrip()
+        self._buffer = ""
+        await self._write_block(tail + "\n")
+
+        def finish() -> None:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+            # Temporary files are private to their owner; reports are readable like any other file.
+            os.chmod(self._temp_path, 0o644)
+            os.replace(self._temp_path, self.path)
+
+        await asyncio.to_thread(finish)
+        return self.path
+
+    async def abort(self) -> None:
+        def discard() -> None:
+            self._file.close()
+            if os.path.exists(self._temp_path):
+                os.remove(self._temp_path)
+
+        await asyncio.to_thread(discard)
+
+
+class ReportSink:
+    """
+    Writes reports into a single output directory, off the event loop.
+
+    - Every file operation runs in a thread pool, so writing a report never blocks the agents.
+    - Reports are written to a temporary file and renamed into place, so a report is either complete or absent.
+    - Filenames chosen by the model are confined to the output directory (no absolute paths or ".."), and can't
+      be hidden files, so a report never replaces another tool's files kept there (e.g. an index).
+
+    Args:
+        directory (str): The output directory.
+    """
+
+    def __init__(self, directory: str = DEFAULT_REPORTS_DIR):
+        self.directory = os.path.realpath(directory)
+        os.makedirs(self.directory, exist_ok=True)
+
+    def resolve(self, filename: str) -> str:
+        """
+        Get the path of a report in the output directory.
+
+        Raises:
+            ValueError: If the filename points outside of the output directory.
+        """
+        path = os.path.realpath(os.path.join(self.directory, filename))
+        if os.path.isabs(filename) or os.path.commonpath([path, self.directory]) != self.directory:
+            raise ValueError(f"Reports can only be written inside {self.directory}, not to {filename}")
+        if path == self.directory or os.path.basename(path).startswith("."):
+            raise ValueError(f"Invalid report filename: {filename}")
+        return path
+
+    def open_stream(self, filename: str, strip_suffix: str = "") -> ReportStream:
+        """Start writing a report in chunks. See `ReportStream`."""
+        path = self.resolve(filename)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return ReportStream(self, path, strip_suffix=strip_suffix)
+
+    async def write(self, filename: str, content: str, strip_suffix: str = "") -> str:
+        """
+        Write a whole report atomically.
+
+        Returns:
+            str: The path of the report.
+        """
+        stream = await asyncio.to_thread(self.open_stream, filename, strip_suffix)
+        try:
+            await stream.write(content)
+            return await stream.commit()
+        except BaseException:
+            await stream.abort()
+            raise
@@ -10,15 +10,22 @@ from autogen_agentchat.ui import Console
 from autogen_ext.models.azure import AzureAIChatCompletionClient
 from azure.core.credentials import AzureKeyCredential
 
-from autogen_ext.code_executors.local import LocalCommandLineCodeExecutor
 from autogen_ext.tools.code_execution import PythonCodeExecutionTool
 
+from code_sandbox import CachedCodeExecutor, FixedPointTermination, PythonSandboxPool
+from token_budget import TokenBudget, TokenBudgetTermination
+
 
 load_dotenv(os.path.join("..", ".env"))
 
 
+# A pool of pre-warmed Python workers, each with its own scratch directory & resource limits.
+# (Unlike LocalCommandLineCodeExecutor, this doesn't start a new interpreter for every run.)
+code_executor = PythonSandboxPool(work_dir="./code_executor", size=2, timeout=30, cpu_time_limit=10, memory_limit_mb=1024)
+
+# Reuse the result when the critic runs code that is unchanged, apart from whitespace or comments.
 python_code_executor_tool = PythonCodeExecutionTool(
-    LocalCommandLineCodeExecutor(work_dir="./code_executor"),
+    CachedCodeExecutor(code_executor, env={"python": sys.version}),
 )
 
 
@@ -52,8 +59,12 @@ async def main() -> None:
         reflect_on_tool_use=True,
     )
 
-    # Terminate the conversation if the critic agent mentions "TERMINATE" or if the conversation exceeds 6 messages (3 rounds)
-    termination_condition = TextMentionTermination("TERMINATE") | MaxMessageTermination(max_messages=6) 
+    # The token budget of the run (override it with the TOKEN_BUDGET / COST_BUDGET environment variables).
+    budget = TokenBudget.from_env(max_tokens=50_000)
+
+    # Terminate the conversation if the critic agent mentions "TERMINATE", if the code & its output stop changing between rounds,
+    # if the conversation exceeds 6 messages (3 rounds), or if the token budget is used up
+    termination_condition = TextMentionTermination("TERMINATE") | FixedPointTermination() | MaxMessageTermination(max_messages=6) | TokenBudgetTermination(budget)
 
     # Create a team with the career mentor agent and the termination condition.
     team = RoundRobinGroupChat(
@@ -61,11 +72,16 @@ async def main() -> None:
         termination_condition=termination_condition,
     )
 
+    # Start the sandbox workers now, so that they warm up while the user types the task.
+    await code_executor.start()
+
     # Run the agent and stream the messages to the console.
     
     task = input("Enter your task: ")           # Get the user input for the task.
     await Console(team.run_stream(task=task))
+    print(budget.report())
     
+    await code_executor.stop()
     await model_client.close()
 
 
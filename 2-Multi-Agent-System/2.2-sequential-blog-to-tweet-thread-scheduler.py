@@ -1,118 +1,229 @@
 import os
 import sys
-from typing import Any, Dict, Optional
+from typing import Awaitable, Callable, List, Optional
 from dotenv import load_dotenv
 import asyncio
+import argparse
 import json
-import requests
 
 from autogen_agentchat.agents import AssistantAgent
-from autogen_agentchat.conditions import TextMentionTermination, MaxMessageTermination
-from autogen_agentchat.teams import RoundRobinGroupChat
 from autogen_agentchat.ui import Console
 from autogen_ext.models.azure import AzureAIChatCompletionClient
+from autogen_core import CancellationToken
+from autogen_core.models import AssistantMessage, ChatCompletionClient, SystemMessage, UserMessage
 from azure.core.credentials import AzureKeyCredential
+from pydantic import BaseModel, Field
 
 from firecrawl import FirecrawlApp
 
+from blog_outline import parse_markdown, render_outline
+from model_router import ModelRouter
+from outbox import TypefullyOutbox
+from pipeline import Pipeline, Stage
+from token_budget import TokenBudget
+
 load_dotenv(os.path.join("..", ".env"))
 
+# Threads are queued here and delivered to Typefully in the background, so the agent never waits on the API.
+outbox = TypefullyOutbox(path="typefully_outbox.sqlite3")
+
 def scrape_website(url: str) -> str:
     """
-    Scrape the website content from the given URL.
+    Scrape the blog at the given URL, and outline it.
 
     Args:
-        url (str): The URL of the website to scrape.
+        url (str): The URL of the blog to scrape.
 
     Returns:
-        str: The scraped content from the website as markdown
+        str: The outline of the blog: its sections, each with an excerpt of its text, its code & its image URLs
     """
     app = FirecrawlApp(api_key=os.getenv("FIRECRAWL_API_KEY"))
     response = app.scrape_url(url=url, params={'formats': [ 'markdown' ], 'removeBase64Images': True})
     try:
-        return response["markdown"][:20000]
+        markdown = response["markdown"]
     except KeyError:
         return f"Error: {response}"
+    # The sections, code blocks & images are parsed locally, so the model gets a compact outline
+    # with the images already attached to their sections, instead of the raw markdown.
+    return render_outline(parse_markdown(markdown))
+
+
 
+class Tweet(BaseModel):
+    content: str
+    is_hook: bool = False
+    media_urls: List[str] = []
 
 
-def schedule_twitter_thread(thread_plan: str) -> Optional[Dict[str, Any]]:
+class ThreadPlan(BaseModel):
+    topic: str
+    tweets: List[Tweet] = Field(min_length=1)
+
+
+def schedule_twitter_thread(thread_plan: ThreadPlan) -> str:
     """
     Schedule a tweet thread using the given model and time.
 
+    The thread is only queued in the local outbox here; it is delivered to Typefully in the background.
+
     Args:
-        thread_plan (str): The JSON string containing the thread plan.
+        thread_plan (ThreadPlan): The validated thread plan.
 
     Returns:
         str: Confirmation message of the scheduled tweet.
     """
-    API_URL = "https://api.typefully.com/v1/drafts/"
-    HEADERS = {
-        "X-API-KEY": f"Bearer {os.getenv('TYPEFULLY_API_KEY')}"
+    # Convert to Typefully format
+    formatted_tweets = []
+    for tweet in thread_plan.tweets:
+        tweet_text = tweet.content
+        if tweet.media_urls:
+            tweet_text += f"\n{tweet.media_urls[0]}"
+        formatted_tweets.append(tweet_text)
+    
+    # You can split into multiple tweets by adding 4 consecutive newlines between tweets in the content.
+    thread_content = '\n\n\n\n'.join(formatted_tweets)
+    
+    # Schedule the thread
+    payload = {
+        "content": thread_content,
+        "schedule-date": "next-free-slot"
     }
 
-    try:
-        thread_json = json.loads(thread_plan)
+    key, queued = outbox.enqueue(payload)
+    if not queued:
+        return f"This thread was already queued for scheduling (id: {key})."
+    return f"Thread queued for scheduling (id: {key})."
 
-        print("######## Thread JSON: ", thread_json)
-        
-        # Convert to Typefully format
-        tweets = thread_json['tweets']
-        formatted_tweets = []
-        for tweet in tweets:
-            tweet_text = tweet['content']
-            if 'media_urls' in tweet and tweet['media_urls']:
-                tweet_text += f"\n{tweet['media_urls'][0]}"
-            formatted_tweets.append(tweet_text)
+
+# The thread planner replies in the model's JSON mode, and its reply is validated against `ThreadPlan`.
+TWITTER_THREAD_PLANNER_SYSTEM_MESSAGE = """You are a technical writer with years of experience in converting long technical blogs into Twitter threads. You have a talent for breaking longform content into bite-sized tweets that are engaging and informative. And identify relevant urls to media that can be associated with a tweet. 
         
-        # You can split into multiple tweets by adding 4 consecutive newlines between tweets in the content.
-        thread_content = '\n\n\n\n'.join(formatted_tweets)
+        Your goal is to create a Twitter thread plan based on the provided draft analysis. The thread should break down complex technical concepts into digestible, tweet-sized chunks.
+
+        The plan should include:
+        - A strong hook tweet that captures attention, it should be under 10 words, it must be same as the title of the blog
+        - Logical flow from basic to advanced concepts
+        - Code snippets or key technical highlights that fit Twitter's format
+        - Relevant urls to media that are associated with the key sections and must be associated with their corresponding tweets
+        - Clear takeaways for engineering audience
+
+        Focus on creating a narrative that technical audiences will find valuable while keeping each tweet concise, accessible and impactful.
+
         
-        # Schedule the thread
-        payload = {
-            "content": thread_content,
-            "schedule-date": "next-free-slot"
-        }
+        The expected output from you is a Twitter thread as a JSON object matching this JSON schema:
+        {schema}
+
+        Exactly one tweet, the first one, must have "is_hook" set to true.
+        """.format(schema=json.dumps(ThreadPlan.model_json_schema()))
+
 
+class StreamingJSONChecker:
+    """
+    Checks the structure of a JSON object while it is streamed, so that a malformed reply
+    (prose instead of JSON, mismatched brackets, text after the object) is caught as soon
+    as it goes wrong, instead of after the model has finished writing it.
+    """
+
+    def __init__(self):
+        self.stack = []
+        self.started = False
+        self.finished = False
+        self.in_string = False
+        self.escaped = False
+
+    def feed(self, chunk: str) -> None:
+        for char in chunk:
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == "\\":
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+            elif char.isspace():
+                continue
+            elif self.finished:
+                raise ValueError("Unexpected text after the end of the JSON object.")
+            elif not self.started:
+                if char != "{":
+                    raise ValueError("The reply must be a JSON object.")
+                self.started = True
+                self.stack.append("}")
+            elif char == '"':
+                self.in_string = True
+            elif char in "{[":
+                self.stack.append("}" if char == "{" else "]")
+            elif char in "}]":
+                if not self.stack or self.stack.pop() != char:
+                    raise ValueError(f"Mismatched '{char}' in the JSON object.")
+                self.finished = not self.stack
+
+
+async def plan_twitter_thread(
+    model_client: ChatCompletionClient, analysis: str, max_repairs: int = 2, budget: Optional[TokenBudget] = None
+) -> ThreadPlan:
+    """
+    Plan a Twitter thread from the blog analysis, as a validated `ThreadPlan`.
+
+    The reply is checked while it streams; a malformed reply is cut short and the model is asked to repair it.
+
+    Args:
+        model_client (ChatCompletionClient): The model client.
+        analysis (str): The technical analysis of the blog.
+        max_repairs (int): How many times the model may repair an invalid plan.
+        budget (TokenBudget, optional): The budget to record the usage of the model calls in.
+
+    Returns:
+        ThreadPlan: The thread plan.
+    """
+    messages = [
+        SystemMessage(content=TWITTER_THREAD_PLANNER_SYSTEM_MESSAGE),
+        UserMessage(content=analysis, source="blog_analyzer"),
+    ]
+    for _ in range(max_repairs + 1):
+        checker = StreamingJSONChecker()
+        output = ""
+        stream = model_client.create_stream(messages, json_output=True)
         try:
-            response = requests.post(API_URL, json=payload, headers=HEADERS)
-            response.raise_for_status()
-            return response.json()
-        except requests.exceptions.RequestException as e:
-            print(f"Error: {e}")
-            return None
-            
-    except Exception as e:
-        print(f"Error: {str(e)}")
-        return None
-
-
-async def main() -> None:
-    # Create the Client
-    model_client = AzureAIChatCompletionClient(
-        model="gpt-4o-mini",
-        endpoint="https://models.inference.ai.azure.com",
-        # To authenticate with the model you will need to generate a personal access token (PAT) in your GitHub settings.
-        credential=AzureKeyCredential(os.getenv("GITHUB_TOKEN")),
-        model_info={
-            "json_output": True,
-            "function_calling": True,
-            "vision": True,
-            "family": "unknown",
-        },
-    )
+            async for chunk in stream:
+                if isinstance(chunk, str):
+                    output += chunk
+                    checker.feed(chunk)
+                else:
+                    if isinstance(chunk.content, str):
+                        output = chunk.content
+                    if budget is not None:
+                        budget.record("twitter_thread_planner", chunk.usage)
+            return ThreadPlan.model_validate_json(output)
+        except ValueError as e:
+            # Pydantic's ValidationError is a ValueError too.
+            error = e
+        finally:
+            await stream.aclose()
+
+        messages += [
+            AssistantMessage(content=output, source="twitter_thread_planner"),
+            UserMessage(content=f"That thread plan is invalid: {error}\nReply with the corrected thread plan, as a JSON object only.", source="user"),
+        ]
+    raise ValueError(f"The thread planner did not produce a valid thread plan: {error}")
 
+
+def create_blog_analyzer(model_client: ChatCompletionClient, budget: TokenBudget) -> AssistantAgent:
+    """
+    Create the blog analyzer agent. The scraped blog gets shorter as the token budget runs out.
+    """
     blog_analyzer = AssistantAgent(
         name="blog_analyzer",
         model_client=model_client,
         # tools=[read_from_file],
-        tools=[scrape_website],
+        tools=[budget.limit_output(scrape_website)],
         reflect_on_tool_use=True,
         system_message="""You are a technical writer with years of experience writing, editing and reviewing technical blogs. You have a talent for understanding and documenting technical concepts. Your job is to scrape the content of a blog from the given URL & then analyze its contents to create a developer-focused technical overview
+        The scraping tool returns an outline of the blog: its sections, each with an excerpt of its text, its code and the exact URLs of its images.
         1. Map out the core idea that the blog discusses
         2. Identify key sections and what each section is about
-        3. For each section, extract all URLs that appear inside image markdown syntax ![](image_url)
-        4. You must associate these identified image urls to their correspoinding sections, so that we can use them with the tweets as media pieces
+        3. For each section, keep the image URLs listed under it exactly as given
+        4. You must associate these image urls to their correspoinding sections, so that we can use them with the tweets as media pieces
         Focus on details that are important for a comprehensive understanding of the blog.
         
         The expected output from you is a technical analysis containing:
@@ -124,66 +235,129 @@ async def main() -> None:
         """,
     )
 
-    twitter_thread_planner = AssistantAgent(
-        name="twitter_thread_planner",
-        model_client=model_client,
-        system_message="""You are a technical writer with years of experience in converting long technical blogs into Twitter threads. You have a talent for breaking longform content into bite-sized tweets that are engaging and informative. And identify relevant urls to media that can be associated with a tweet. 
-        
-        Your goal is to create a Twitter thread plan based on the provided draft analysis. The thread should break down complex technical concepts into digestible, tweet-sized chunks.
+    return blog_analyzer
 
-        The plan should include:
-        - A strong hook tweet that captures attention, it should be under 10 words, it must be same as the title of the blog
-        - Logical flow from basic to advanced concepts
-        - Code snippets or key technical highlights that fit Twitter's format
-        - Relevant urls to media that are associated with the key sections and must be associated with their corresponding tweets
-        - Clear takeaways for engineering audience
 
-        Focus on creating a narrative that technical audiences will find valuable while keeping each tweet concise, accessible and impactful.
+async def run_batch(router: ModelRouter, urls: List[str], workers_per_stage: int = 4, queue_size: int = 4) -> None:
+    """
+    Convert many blogs into Twitter threads, with the analyzer, the planner & the scheduler working as a pipeline.
 
-        
-        The expected output from you is a Twitter thread with tweets in the following JSON format:
-        {
-            "topic": <A catchy title>,
-            "tweets": [
-                {
-                    "content": <content of the tweet>,
-                    "is_hook": <true if the tweet is a hook tweet, false otherwise>
-                    "media_urls": [<urls to media that are associated with the tweet, whenever possible>]
-                },
-                {
-                    "content": <content of the tweet>,
-                    "is_hook": <true if the tweet is a hook tweet, false otherwise>
-                    "media_urls": [<urls to media that are associated with the tweet, whenever possible>]
-                },
-                ...
-            ]
-        }
-        """,
-    )
+    Each step is a stage with its own pool of workers, and the stages are joined by bounded queues,
+    so scraping blog N+1 overlaps with planning the thread of blog N and scheduling the thread of blog N-1.
 
-    tweet_scheduler = AssistantAgent(
-        name="tweet_scheduler",
-        model_client=model_client,
-        tools=[schedule_twitter_thread],
-        reflect_on_tool_use=True,
-        system_message="""You are a social media manager with years of experience in scheduling tweets. Your task is to schedule the tweets for the given Twitter thread plan. Use the tools at your disposal to accomplish this. Once the tweets are scheduled, reply with 'TERMINATE'""",
-    )
+    The batch shares one token budget (override it with the TOKEN_BUDGET / COST_BUDGET environment variables):
+    once it is used up, the remaining blogs fail instead of being analyzed.
+    """
+    budget = TokenBudget.from_env(max_tokens=60_000 * len(urls))
+
+    def make_analyzer() -> Callable[[str], Awaitable[str]]:
+        # Every worker gets its own agent, since agents keep their conversation state.
+        agent = create_blog_analyzer(router.client("blog_analyzer"), budget)
 
-    # Terminate the conversation if the tweet scheduler agent mentions "TERMINATE" or if the conversation exceeds 4 messages (1 round)
-    termination_condition = TextMentionTermination("TERMINATE") | MaxMessageTermination(max_messages=4) 
+        async def analyze(url: str) -> str:
+            if budget.exhausted:
+                raise RuntimeError("Token budget reached")
+            await agent.on_reset(CancellationToken())
+            result = await agent.run(task=url)
+            budget.record_messages(result.messages)
+            return result.messages[-1].content
+        return analyze
 
-    team = RoundRobinGroupChat(
-        [blog_analyzer, twitter_thread_planner, tweet_scheduler],
-        termination_condition=termination_condition,
+    def make_planner() -> Callable[[str], Awaitable[ThreadPlan]]:
+        async def plan(analysis: str) -> ThreadPlan:
+            return await plan_twitter_thread(router.client("twitter_thread_planner"), analysis, budget=budget)
+        return plan
+
+    def make_scheduler() -> Callable[[ThreadPlan], Awaitable[str]]:
+        async def schedule(thread_plan: ThreadPlan) -> str:
+            return schedule_twitter_thread(thread_plan)
+        return schedule
+
+    pipeline = Pipeline(
+        [
+            Stage("blog_analyzer", make_analyzer, workers=workers_per_stage),
+            Stage("thread_planner", make_planner, workers=workers_per_stage),
+            # Scheduling only queues the thread in the local outbox, so one worker keeps up.
+            Stage("tweet_scheduler", make_scheduler, workers=1),
+        ],
+        queue_size=queue_size,
     )
+    items = await pipeline.run(urls)
+
+    for item in items:
+        status = f"failed at {item.failed_stage}: {item.error}" if item.error else item.value
+        print(f"{item.input}: {status}")
+    print()
+    print(pipeline.report())
+    print(budget.report())
+    print(router.report())
 
 
+async def run_single(router: ModelRouter) -> None:
+    # The token budget of the run (override it with the TOKEN_BUDGET / COST_BUDGET environment variables).
+    budget = TokenBudget.from_env(max_tokens=60_000)
+    blog_analyzer = create_blog_analyzer(router.client("blog_analyzer"), budget)
+
     # Run the agent and stream the messages to the console.
     
     task = input("Enter the blog URL: ")
-    await Console(team.run_stream(task=task))
-    
-    await model_client.close()
+    analysis = await Console(blog_analyzer.run_stream(task=task))
+    budget.record_messages(analysis.messages)
+
+    # The planner replies with a validated thread plan, which is scheduled directly, without another model call.
+    print("---------- twitter_thread_planner ----------")
+    thread_plan = await plan_twitter_thread(router.client("twitter_thread_planner"), analysis.messages[-1].content, budget=budget)
+    print(thread_plan.model_dump_json(indent=2))
+
+    print("---------- tweet_scheduler ----------")
+    print(schedule_twitter_thread(thread_plan))
+    print(budget.report())
+    print(router.report())
+
+
+def create_model_client(model: str) -> AzureAIChatCompletionClient:
+    """Create the client of a model tier."""
+    return AzureAIChatCompletionClient(
+        model=model,
+        endpoint="https://models.inference.ai.azure.com",
+        # To authenticate with the model you will need to generate a personal access token (PAT) in your GitHub settings.
+        credential=AzureKeyCredential(os.getenv("GITHUB_TOKEN")),
+        model_info={
+            "json_output": True,
+            "function_calling": True,
+            "vision": True,
+            "family": "unknown",
+        },
+    )
+
+
+async def main(args: argparse.Namespace) -> None:
+    # Every call goes to the small tier (gpt-4o-mini) unless the MODEL_ROUTES environment variable routes it to a larger one,
+    # e.g. MODEL_ROUTES="blog_analyzer:tool_result=large" for the analysis of the scraped blog.
+    # A thread plan that doesn't validate is repaired by the larger model.
+    router = ModelRouter.from_env(
+        create_model_client,
+        validators={"twitter_thread_planner": lambda result: bool(ThreadPlan.model_validate_json(result.content))},
+    )
+
+    # Deliver the queued threads in the background while the agents work.
+    dispatcher = asyncio.create_task(outbox.dispatch_forever())
+
+    if args.batch:
+        # Batch mode: one blog URL per line in the given file.
+        with open(args.batch, "r", encoding="utf-8") as f:
+            urls = [line.strip() for line in f if line.strip() and not line.startswith("#")]
+        await run_batch(router, urls, workers_per_stage=args.workers, queue_size=args.queue_size)
+    else:
+        await run_single(router)
+
+    if not await outbox.drain(timeout=60):
+        print(f"{outbox.pending_count()} thread(s) are still waiting for delivery; they will be retried on the next run.")
+    dispatcher.cancel()
+    await asyncio.gather(dispatcher, return_exceptions=True)
+
+    router.export()
+    await router.close()
 
 
 if __name__ == "__main__":
@@ -191,10 +365,16 @@ if __name__ == "__main__":
     if sys.platform == "win32":
         asyncio.set_event_loop_policy(asyncio.WindowsProactorEventLoopPolicy())
 
-    asyncio.run(main())
+    parser = argparse.ArgumentParser(description="Convert blogs into Twitter threads & schedule them.")
+    parser.add_argument("--batch", help="A file with one blog URL per line, to process as a pipeline instead of asking for a single URL.")
+    parser.add_argument("--workers", type=int, default=4, help="Workers per pipeline stage in batch mode.")
+    parser.add_argument("--queue-size", type=int, default=4, help="Capacity of the queue in front of each pipeline stage in batch mode.")
+
+    asyncio.run(main(parser.parse_args()))
 
 # ------------------------------------------------
 # Example tasks to test the agent's response.
 # ------------------------------------------------
 # 1. https://nmn.gl/blog/ai-and-learning
-# 2. https://huyenchip.com/2025/01/07/agents.html
\ No newline at end of file
+# 2. https://huyenchip.com/2025/01/07/agents.html
+# 3. [Batch] python 2.2-sequential-blog-to-tweet-thread-scheduler.py --batch blog_urls.txt
\ No newline at end of file
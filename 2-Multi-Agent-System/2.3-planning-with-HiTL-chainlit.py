@@ -0,0 +1,56 @@
+"""
+The system design team of 2.3, in a Chainlit chat: the task is the user's first message, the system analyst's
+questions are asked in the chat (with `ChainlitInput`), and the discussion & the design document are shown there.
+
+Run it with:
+    chainlit run 2.3-planning-with-HiTL-chainlit.py
+"""
+
+import os
+import importlib.util
+from typing import AsyncGenerator
+
+import chainlit as cl
+from autogen_agentchat.base import TaskResult
+from autogen_agentchat.messages import AgentEvent, ChatMessage, TextMessage, ToolCallRequestEvent
+
+from async_input import HITL_TIMEOUT, ChainlitInput
+
+
+# The 2.3 script, whose file name isn't a module name.
+_spec = importlib.util.spec_from_file_location(
+    "planning_with_hitl", os.path.join(os.path.dirname(os.path.abspath(__file__)), "2.3-planning-with-HiTL-system-design.py")
+)
+planning_with_hitl = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(planning_with_hitl)
+
+# How long the system analyst waits for an answer in the chat, in seconds (HITL_TIMEOUT, or 5 minutes).
+CHAT_TIMEOUT = HITL_TIMEOUT or 300
+
+
+async def show_in_chat(stream: AsyncGenerator[AgentEvent | ChatMessage | TaskResult, None]) -> TaskResult:
+    """Send the agents' messages of a team's stream to the chat, and return the team's result."""
+    result = None
+    async for msg in stream:
+        if isinstance(msg, TextMessage) and msg.source not in ("user", "user_proxy"):
+            # The user's own messages are already in the chat.
+            await cl.Message(content=f"[{msg.source}]\n{msg.content}", author=msg.source).send()
+        elif isinstance(msg, ToolCallRequestEvent):
+            await cl.Message(
+                content=f"[{msg.source}]\n **Tool calls requested:**\n- " + "\n- ".join(f"{tool.name}: {tool.arguments}" for tool in msg.content),
+                author=msg.source,
+            ).send()
+        elif isinstance(msg, TaskResult):
+            result = msg
+    return result
+
+
+@cl.on_message  # type: ignore
+async def chat(message: cl.Message) -> None:
+    # Each message is the task of a new design; the answers to the analyst's questions are collected by `ChainlitInput`.
+    user_input = ChainlitInput(timeout=CHAT_TIMEOUT, default=planning_with_hitl.DEFAULT_REQUIREMENTS_ANSWER)
+    path = await planning_with_hitl.main(message.content, user_input, show_in_chat)
+    await cl.Message(
+        content=f"Design document written to: {path}",
+        elements=[cl.File(name=os.path.basename(path), path=path)],
+    ).send()
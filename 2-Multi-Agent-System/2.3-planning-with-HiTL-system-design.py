@@ -12,23 +12,149 @@ import sys
 from dotenv import load_dotenv
 import asyncio
 import uuid
+from typing import Any, AsyncGenerator, Awaitable, Callable, List, Optional, Sequence
 
 from autogen_agentchat.agents import AssistantAgent, UserProxyAgent
+from autogen_agentchat.base import TaskResult
 from autogen_agentchat.conditions import TextMentionTermination, MaxMessageTermination
+from autogen_agentchat.messages import AgentEvent, ChatMessage, ModelClientStreamingChunkEvent, TextMessage
 from autogen_agentchat.teams import RoundRobinGroupChat, SelectorGroupChat
 from autogen_agentchat.ui import Console
+from autogen_core import CancellationToken
+from autogen_core.models import ChatCompletionClient, UserMessage
 from autogen_ext.models.azure import AzureAIChatCompletionClient
 from azure.core.credentials import AzureKeyCredential
 
+from async_input import HITL_TIMEOUT, TerminalInput
+from design_index import DesignIndex
+from model_router import ModelRouter
+from prompt_cache import PrefixCachingChatCompletionClient, PrefixStats
+from report_sink import ReportSink
+from selector import PlanFollowingSelector, SelectorModelClient
+from speculation import Speculation
+from token_budget import TokenBudget, TokenBudgetTermination, stopped_by_budget, summarize_run
+
 load_dotenv(os.path.join("..", ".env"))
 
+# Full-text & vector index over the reports of earlier runs
+design_index = DesignIndex("system_design_docs")
+
+
+async def search_past_designs(query: str) -> str:
+    """
+    Search the design documents of previously designed systems, to reuse their architecture decisions.
+
+    Args:
+        query (str): The system, component or design decision to look for.
+
+    Returns:
+        str: The most relevant sections of past design documents.
+    """
+    try:
+        sections = await asyncio.to_thread(design_index.search, query)
+    except Exception as e:
+        return f"Error: {str(e)}"
+    if not sections:
+        return "No past designs found."
+    return "\n\n".join(
+        f"[{section['filename']}] {section['heading']}\n{section['content'][:2000]}" for section in sections
+    )
+
+
+
+async def tee_report(
+    stream: AsyncGenerator[AgentEvent | ChatMessage | TaskResult, None],
+    sink: ReportSink,
+    filename: str,
+    source: str = "report_writer",
+) -> AsyncGenerator[AgentEvent | ChatMessage | TaskResult, None]:
+    """
+    Pass a team's stream through, while writing the report to a file chunk by chunk, as the report writer streams it.
+
+    The report only replaces its file when the run ends with the report writer's message; otherwise,
+    the last message of the run is written instead (like before).
+
+    Args:
+        stream: The stream of the team's `run_stream()`.
+        sink (ReportSink): The sink to write the report to.
+        filename (str): The name of the report.
+        source (str): The name of the agent that writes the report.
+    """
+    report, complete = None, False
+    try:
+        async for message in stream:
+            if isinstance(message, ModelClientStreamingChunkEvent) and message.source == source:
+                if report is None or complete:
+                    # The report writer started a new message: only its latest one is the report.
+                    if report is not None:
+                        await report.abort()
+                    report, complete = await asyncio.to_thread(sink.open_stream, filename, "TERMINATE"), False
+                await report.write(message.content)
+            elif isinstance(message, TextMessage) and message.source == source and report is not None:
+                complete = True
+            elif isinstance(message, TaskResult):
+                last = message.messages[-1] if message.messages else None
+                if report is not None and complete and last is not None and last.source == source:
+                    await report.commit()
+                else:
+                    if report is not None:
+                        await report.abort()
+                    if last is not None:
+                        await sink.write(filename, str(last.content).strip(), strip_suffix="TERMINATE")
+                report = None
+            yield message
+    finally:
+        if report is not None:
+            await report.abort()
+
+
+async def draft_design(task: str, agents: Sequence[AssistantAgent], budget: TokenBudget) -> List[TextMessage]:
+    """
+    Draft the plan & the architecture from the user's task alone, while the user answers the analyst's questions.
+
+    Each agent builds on the drafts of the previous ones, and is reset afterwards, so that the design team starts afresh.
+
+    Returns:
+        List[TextMessage]: The drafts, as the messages of their agents.
+    """
+    messages = [TextMessage(
+        content=f"Design a {task}. The detailed requirements are still being gathered: assume the usual ones for such a system, and state your assumptions.",
+        source="user",
+    )]
+    drafts: List[TextMessage] = []
+    try:
+        for agent in agents:
+            result = await agent.run(task=messages + drafts)
+            budget.record_messages(result.messages)
+            drafts.append(TextMessage(content=str(result.messages[-1].content), source=agent.name))
+    finally:
+        for agent in agents:
+            await agent.on_reset(CancellationToken())
+    return drafts
+
+
+async def drafts_hold(model_client: ChatCompletionClient, drafts: List[TextMessage], requirements: str, budget: TokenBudget) -> bool:
+    """Whether the drafts made before the requirements were known still fit them."""
+    prompt = (
+        "A plan and an architecture were drafted before the requirements of the system were known.\n\n"
+        f"Requirements:\n{requirements}\n\n"
+        + "\n\n".join(f"Draft by {draft.source}:\n{draft.content}" for draft in drafts)
+        + "\n\nDo the drafts fit the requirements? Gaps are fine, since the rest of the team will fill them in. "
+        "Reply with KEEP if they fit, or DISCARD if a requirement contradicts them."
+    )
+    result = await model_client.create([UserMessage(content=prompt, source="user")])
+    budget.record("speculation_check", result.usage)
+    return isinstance(result.content, str) and result.content.strip().upper().startswith("KEEP")
+
 
+# How often the agents' calls repeat their static prefix (system messages & tools), over all the model tiers.
+prefix_stats = PrefixStats()
 
 
-async def main() -> None:
-    # Create the Client
+def create_model_client(model: str) -> PrefixCachingChatCompletionClient:
+    """Create the client of a model tier."""
     model_client = AzureAIChatCompletionClient(
-        model="gpt-4o-mini",
+        model=model,
         endpoint="https://models.inference.ai.azure.com",
         # To authenticate with the model you will need to generate a personal access token (PAT) in your GitHub settings.
         credential=AzureKeyCredential(os.getenv("GITHUB_TOKEN")),
@@ -39,52 +165,99 @@ async def main() -> None:
             "family": "unknown",
         },
     )
+    # The requests are sent unchanged; their static prefix is hashed (and sent as a prefix-cache hint, if PROMPT_CACHE_HINT
+    # names the provider's parameter), and its token count is kept locally.
+    return PrefixCachingChatCompletionClient(model_client, stats=prefix_stats)
+
+
+# The answer to the system analyst's questions when the user doesn't answer in time.
+DEFAULT_REQUIREMENTS_ANSWER = "No further requirements: make reasonable assumptions."
+
+
+async def main(
+    task: Optional[str] = None,
+    user_input: Optional[Any] = None,
+    show: Callable[[AsyncGenerator[AgentEvent | ChatMessage | TaskResult, None]], Awaitable[TaskResult]] = Console,
+) -> str:
+    """
+    Gather the requirements of a system with the user, design it with the design team, and write the design document.
+
+    Args:
+        task (str, optional): The system to design. Asked in the terminal if not given.
+        user_input (optional): Asks the user the system analyst's questions, e.g. a `TerminalInput` (the default)
+            or a `ChainlitInput`.
+        show (Callable): Shows the teams' streams to the user, and returns their result, e.g. `Console` (the default).
+
+    Returns:
+        str: The path of the design document.
+    """
+    # Every call goes to the small tier (gpt-4o-mini) unless the MODEL_ROUTES environment variable routes it to a larger one,
+    # e.g. MODEL_ROUTES="report_writer=large,budget_summary=large" for the design document.
+    # A speaker selection that doesn't name exactly one agent is retried with the larger model.
+    design_agent_names = ["planning_agent", "senior_software_architect", "uiux_expert", "security_specialist", "devops_engineer", "report_writer"]
+    router = ModelRouter.from_env(
+        create_model_client,
+        validators={"selector": lambda result: sum(name in result.content for name in design_agent_names) == 1},
+    )
+
+    # The token budget of the whole session, shared by both teams (override it with the TOKEN_BUDGET / COST_BUDGET environment variables).
+    budget = TokenBudget.from_env(max_tokens=250_000)
+    budget_termination = TokenBudgetTermination(budget)
+    search_tool = budget.limit_output(search_past_designs)
 
     system_analyst = AssistantAgent(
         name="system_analyst",
         description = "A system analyst who ensures a complete understanding of system requirements before proceeding with design.",
-        model_client=model_client,
+        model_client=router.client("system_analyst"),
         system_message="You are a thorough system analyst who ensures a complete understanding of system requirements before proceeding with design. You are proficient in asking the right 2-3 questions to understand the functional & non-functional requirements of a problem, as well as summarize them. You **must** reply 'TERMINATE' when you have all the required information for the system.",
     )
 
+    # The user answers without blocking the event loop, so the design can be drafted meanwhile.
+    # Without an answer within HITL_TIMEOUT seconds (if set), the analyst goes on with its own assumptions.
+    if user_input is None:
+        user_input = TerminalInput(timeout=HITL_TIMEOUT, default=DEFAULT_REQUIREMENTS_ANSWER)
     user_proxy = UserProxyAgent(
         name = "user_proxy",
         description = "A user proxy who represents the user's needs and preferences.",
-        input_func=input
+        input_func=user_input.ask
     )
 
     senior_software_architect = AssistantAgent(
         name="senior_software_architect",
         description = "A senior software architect who designs the high-level architecture of the system",
-        model_client=model_client,
-        system_message="You are a skilled software architect who creates robust and scalable high-level system architectures. You have deep knowledge of large-scale systems, focusing on the 'why' behind various design decisions by evaluating tradeoffs effectively. You are also an expert in representing complex system in easy-to-understand diagrams with Mermaid. You also have a solid understanding of data storage technologies & system interface design. You must create a robust, scalable high-level design of the software based on the requirement (with an architcture diagram), the tradeoffs considered while arriving at the design, along with the potential tech stack. Optimize for brevity. Do NOT suggest anything beyond your expertise.",
+        model_client=router.client("senior_software_architect"),
+        tools=[search_tool],
+        reflect_on_tool_use=True,
+        system_message="You are a skilled software architect who creates robust and scalable high-level system architectures. You have deep knowledge of large-scale systems, focusing on the 'why' behind various design decisions by evaluating tradeoffs effectively. You are also an expert in representing complex system in easy-to-understand diagrams with Mermaid. You also have a solid understanding of data storage technologies & system interface design. You must create a robust, scalable high-level design of the software based on the requirement (with an architcture diagram), the tradeoffs considered while arriving at the design, along with the potential tech stack. Search past designs of similar systems first, and reuse their decisions where they fit. Optimize for brevity. Do NOT suggest anything beyond your expertise.",
     )
 
     uiux_expert = AssistantAgent(
         name="uiux_expert",
         description = "A UI/UX expert who designs the user interface and experience.",
-        model_client=model_client,
+        model_client=router.client("uiux_expert"),
         system_message="You are a UI/UX expert who designs user interfaces and experiences. You are aware of the best practices of design thinking & are proficient in creating user-friendly designs that enhance usability and accessibility. You must build on the previous discussion & create intuitive, accessible interfaces for the system that enhance user experience. You must Optimize for brevity. Do NOT suggest anything beyond your expertise.",
     )
 
     security_specialist = AssistantAgent(
         name="security_specialist",
         description = "A security specialist who ensures the system is secure.",
-        model_client=model_client,
+        model_client=router.client("security_specialist"),
         system_message="You are a security specialist who ensures the system is secure. You are proficient in identifying potential vulnerabilities and suggesting best practices for securing systems. You have expertise in authentication, authorization, encryption, and secure communication protocols, and can design security monitoring and incident response mechanisms. You must build on the previous discussion & identify vulnerabilities and suggest security measures throughout the system design. Optimize for brevity. Do NOT suggest anything beyond your expertise.",
     )
 
     devops_engineer = AssistantAgent(
         name="devops_engineer",
         description = "A DevOps engineer who ensures the system is deployable and maintainable.",
-        model_client=model_client,
+        model_client=router.client("devops_engineer"),
         system_message="You are a DevOps engineer who designs for operability, reliability, and maintainability. You are proficient in CI/CD practices, infrastructure as code, and monitoring systems. You bring expertise in containerization, orchestration, and cloud technologies, ensuring systems are designed with scalability, fault tolerance, and observability in mind from the beginning. You must build on the previous discussion & suggest the most optimal deployment, maintenance & telemetry strategies for the system. Optimize for brevity. Do NOT suggest anything beyond your expertise.",
     )
 
     planning_agent = AssistantAgent(
     "planning_agent",
     description="An agent for planning tasks and delegating them to other agents. This agent must be called first",
-    model_client=model_client,
+    model_client=router.client("planning_agent"),
+    tools=[search_tool],
+    reflect_on_tool_use=True,
     system_message="""
     You are a planning agent.
     Your job is to break down complex tasks into smaller, manageable subtasks.
@@ -96,6 +269,7 @@ async def main() -> None:
     - report_writer: A report writer who writes the final report or software design document.
 
     You only plan and delegate tasks - you do not execute them yourself.
+    Before planning, search past designs of similar systems: where they already cover a part of the task, plan fewer subtasks.
 
     When assigning tasks, use this format:
     1. <agent> : <task>
@@ -106,19 +280,39 @@ async def main() -> None:
     report_writer = AssistantAgent(
         name="report_writer",
         description = "A report writer who writes the final report or software design document.",
-        model_client=model_client,
+        model_client=router.client("report_writer"),
+        # Stream the report, so it can be written to the file as it is generated.
+        model_client_stream=True,
         system_message="You are an experienced technical report writer, proficient in consolidating deep technical discussions into well-structured & articulare design documents. Respond by consolidating the entire deep technical discussion into well-structured & articulate design document in markdown format and end the response with 'TERMINATE'",
     )
 
     requirments_team = RoundRobinGroupChat(
         [system_analyst, user_proxy],
-        termination_condition=TextMentionTermination("TERMINATE") | MaxMessageTermination(max_messages=4)
+        termination_condition=TextMentionTermination("TERMINATE") | MaxMessageTermination(max_messages=4) | budget_termination
     )
 
-    task = input("What kind of system do you wish to design? ")
-    requirements = await Console(requirments_team.run_stream(task=task))
+    # Bring the index of past designs up to date while the requirements are gathered
+    index_sync = asyncio.create_task(asyncio.to_thread(design_index.sync))
+
+    if task is None:
+        task = await TerminalInput().ask("What kind of system do you wish to design? ")
+
+    # As soon as the user is asked about the requirements, the planner & the architect draft the design from the task alone.
+    # The drafts are kept if they fit the final requirements, and the design team then starts after them.
+    async def draft() -> List[TextMessage]:
+        await index_sync
+        return await draft_design(task, [planning_agent, senior_software_architect], budget)
 
-    software_design_task =  f"Design a {task} with the following requirements:\n{requirements.messages[-1].content.strip('TERMINATE').strip()}"
+    speculation = Speculation(draft)
+    user_input.on_prompt = lambda prompt: speculation.start()
+    requirements = await show(requirments_team.run_stream(task=task))
+
+    requirements_text = requirements.messages[-1].content.strip('TERMINATE').strip()
+    software_design_task =  f"Design a {task} with the following requirements:\n{requirements_text}"
+    drafts = await speculation.resolve(
+        lambda drafts: drafts_hold(router.client("speculation_check"), drafts, requirements_text, budget)
+    )
+    print(speculation.stats.report())
 
 
     selector_prompt = """Select an agent to perform task.
@@ -135,30 +329,59 @@ Only select one agent.
 
 
     # Terminate the conversation if the tweet scheduler agent mentions "TERMINATE" or if the conversation exceeds 10 messages
-    termination_condition = TextMentionTermination("TERMINATE") | MaxMessageTermination(max_messages=25)
+    termination_condition = TextMentionTermination("TERMINATE") | MaxMessageTermination(max_messages=25) | budget_termination
+
+    design_agents = [
+        planning_agent,
+        senior_software_architect,
+        uiux_expert,
+        security_specialist,
+        devops_engineer,
+        report_writer
+    ]
+
+    # Follow the planner's assignments with deterministic rules, and only ask the model to select the next speaker
+    # when the rules can't decide (with a window of the history, rather than all of it).
+    selector = PlanFollowingSelector([agent.name for agent in design_agents], planner="planning_agent", finisher="report_writer")
 
     software_design_team = SelectorGroupChat(
-        [
-            planning_agent,
-            senior_software_architect,
-            uiux_expert,
-            security_specialist,
-            devops_engineer,
-            report_writer
-        ],
-        model_client=model_client,
+        design_agents,
+        model_client=SelectorModelClient(router.client("selector"), selector.stats),
         selector_prompt=selector_prompt,
+        selector_func=selector,
         termination_condition=termination_condition,
     )
 
-    result = await Console(software_design_team.run_stream(task=software_design_task))
-
-    # Write to a file
+    # Write the report to a file as it streams
     id = str(uuid.uuid4())
-    with open(os.path.join("system_design_docs", f"system_design_report_{id}.md"), "w") as f:
-        f.write(result.messages[-1].content.strip("TERMINATE").strip())
+    report_sink = ReportSink("system_design_docs")
+    filename = f"system_design_report_{id}.md"
+    await index_sync
+    design_task = [TextMessage(content=software_design_task, source="user")] + (drafts or [])
+    result = await show(tee_report(software_design_team.run_stream(task=design_task), report_sink, filename))
+
+    # If the budget ran out before the report was written, write it from the discussion so far with one last call
+    # (from the budget's reserve).
+    if stopped_by_budget(result.stop_reason):
+        print("---------- budget_summary ----------")
+        report = await summarize_run(
+            router.client("budget_summary"), software_design_task, result.messages, budget,
+            instruction="Consolidate the discussion so far into a well-structured design document in markdown format.",
+        )
+        print(report)
+        await report_sink.write(filename, report)
+    print(selector.stats.report())
+    print(budget.report())
+    print(router.report())
+    print(prefix_stats.report())
+    router.export()
+    print(f"Report written to: {report_sink.resolve(filename)}")
+
+    # Add the report to the index of past designs
+    await asyncio.to_thread(design_index.add, report_sink.resolve(filename))
     
-    await model_client.close()
+    await router.close()
+    return report_sink.resolve(filename)
 
 
 if __name__ == "__main__":
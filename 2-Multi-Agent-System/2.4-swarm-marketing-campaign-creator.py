@@ -3,20 +3,66 @@ import sys
 from dotenv import load_dotenv
 import asyncio
 import json
-import requests
+import aiohttp
+from typing import AsyncGenerator
 
 from autogen_agentchat.agents import AssistantAgent
+from autogen_agentchat.base import TaskResult
 from autogen_agentchat.conditions import TextMentionTermination, MaxMessageTermination
+from autogen_agentchat.messages import AgentEvent, ChatMessage, HandoffMessage, TextMessage
 from autogen_agentchat.teams import Swarm
 from autogen_agentchat.ui import Console
 from autogen_ext.models.azure import AzureAIChatCompletionClient
 from azure.core.credentials import AzureKeyCredential
 
-from firecrawl import FirecrawlApp
+from content_extraction import extract_content
+from eager_tools import EagerStats, EagerToolsChatCompletionClient, ToolCallStreamTransport
+from model_router import ModelRouter, model_tiers
+from prefetch import ScrapePrefetcher
+from prompt_cache import PrefixCachingChatCompletionClient, PrefixStats
+from token_budget import TokenBudget, TokenBudgetTermination, stopped_by_budget, summarize_run
 
 load_dotenv(os.path.join("..", ".env"))
 
-def serper_web_search(query: str) -> str:
+SERPER_API_URL = os.getenv("SERPER_API_URL", "https://google.serper.dev")
+FIRECRAWL_API_URL = os.getenv("FIRECRAWL_API_URL", "https://api.firecrawl.dev")
+
+
+async def fetch_markdown(url: str) -> str:
+    """Scrape a page as markdown with Firecrawl."""
+    headers = {"Authorization": f"Bearer {os.getenv('FIRECRAWL_API_KEY', '')}", "Content-Type": "application/json"}
+    payload = {"url": url, "formats": ["markdown"], "removeBase64Images": True}
+    async with aiohttp.ClientSession() as session:
+        async with session.post(f"{FIRECRAWL_API_URL}/v1/scrape", headers=headers, json=payload) as response:
+            if response.status != 200:
+                raise RuntimeError(f"{response.status} - {await response.text()}")
+            data = await response.json()
+    if not data.get("success") or "markdown" not in data.get("data", {}):
+        raise RuntimeError(str(data))
+    return data["data"]["markdown"]
+
+
+# While the model reads the search results, the top results are scraped in the background (SCRAPE_PREFETCH=0 disables it).
+prefetcher = ScrapePrefetcher(fetch_markdown, top_n=3, enabled=os.getenv("SCRAPE_PREFETCH", "1") == "1")
+
+
+async def cancel_prefetches_per_turn(
+    stream: AsyncGenerator[AgentEvent | ChatMessage | TaskResult, None],
+) -> AsyncGenerator[AgentEvent | ChatMessage | TaskResult, None]:
+    """
+    Pass the team's messages through, and cancel the prefetches left when an agent is done (with its reply
+    or handoff), so they don't keep fetching, and holding the budget, while the next agent works.
+
+    The summary of a tool call doesn't end anything: the agent speaks again, e.g. to scrape the pages its search
+    prefetched.
+    """
+    async for message in stream:
+        if isinstance(message, (TextMessage, HandoffMessage)) and message.source != "user":
+            await prefetcher.cancel()
+        yield message
+
+
+async def serper_web_search(query: str) -> str:
     """
     Perform a web search using the Serper API and return the results.
 
@@ -26,44 +72,50 @@ def serper_web_search(query: str) -> str:
     Returns:
         str: The search results in JSON format.
     """
-    url = "https://google.serper.dev/search"
+    url = f"{SERPER_API_URL}/search"
     payload = json.dumps({
         "q": query,
         "gl": "in"
     })
     headers = {
-    'X-API-KEY': os.getenv("SERPER_API_KEY"),
+    'X-API-KEY': os.getenv("SERPER_API_KEY", ""),
     'Content-Type': 'application/json'
     }
-    response = requests.request("POST", url, headers=headers, data=payload)
-    if response.status_code != 200:
-        return f"Error: {response.status_code} - {response.text}"
-    return response.text
+    async with aiohttp.ClientSession() as session:
+        async with session.post(url, headers=headers, data=payload) as response:
+            text = await response.text()
+            if response.status != 200:
+                return f"Error: {response.status} - {text}"
+    prefetcher.prefetch_from_search(text)
+    return text
 
 
-def scrape_website(url: str) -> str:
+async def scrape_website(url: str, query: str = "") -> str:
     """
     Scrape the website content from the given URL.
 
     Args:
         url (str): The URL of the website to scrape.
+        query (str): What you are looking for on the page (e.g. "pricing plans and target audience"), to get its most relevant parts.
 
     Returns:
-        str: The scraped content from the website as markdown
+        str: The main content of the website as markdown, without menus, banners & footers
     """
-    app = FirecrawlApp(api_key=os.getenv("FIRECRAWL_API_KEY"))
-    response = app.scrape_url(url=url, params={'formats': [ 'markdown' ], 'removeBase64Images': True})
-    try:
-        return response["markdown"][:20000]
-    except KeyError:
-        return f"Error: {response}"
+    markdown = await prefetcher.get(url)
+    if markdown is None:
+        try:
+            markdown = await fetch_markdown(url)
+        except Exception as e:
+            return f"Error: {str(e)}"
+    # Strip the boilerplate locally, and keep the blocks most relevant to the query, within ~3000 tokens.
+    return extract_content(markdown, query=query, max_tokens=3000, url=url)
 
 
 
-async def main() -> None:
-    # Create the Client
-    model_client = AzureAIChatCompletionClient(
-        model="gpt-4o-mini",
+def create_model_client(model: str) -> AzureAIChatCompletionClient:
+    """Create the client of a model tier."""
+    return AzureAIChatCompletionClient(
+        model=model,
         endpoint="https://models.inference.ai.azure.com",
         # To authenticate with the model you will need to generate a personal access token (PAT) in your GitHub settings.
         credential=AzureKeyCredential(os.getenv("GITHUB_TOKEN")),
@@ -73,12 +125,38 @@ async def main() -> None:
             "vision": True,
             "family": "unknown",
         },
+        # Shows the streamed tool calls to the agents' `EagerToolsChatCompletionClient`s as they arrive.
+        transport=ToolCallStreamTransport(),
     )
 
+
+async def main() -> None:
+    # The model tiers (override them with the MODEL_TIERS environment variable).
+    tiers = [(tier, create_model_client(model)) for tier, model in model_tiers()]
+
+    # The token budget of the run (override it with the TOKEN_BUDGET / COST_BUDGET environment variables).
+    # As it runs out, the scraped pages & search results get shorter.
+    budget = TokenBudget.from_env(max_tokens=200_000)
+    tools = [budget.limit_output(serper_web_search), budget.limit_output(scrape_website)]
+
+    # Every call goes to the small tier (gpt-4o-mini) unless the MODEL_ROUTES environment variable routes it to a larger one,
+    # e.g. MODEL_ROUTES="chief_marketing_strategist=large,budget_summary=large" for the marketing strategy.
+    # The requests are sent unchanged; their static prefix is hashed (and sent as a prefix-cache hint, if PROMPT_CACHE_HINT
+    # names the provider's parameter), and its token count is kept locally.
+    prefix_stats = PrefixStats()
+    router = ModelRouter([(tier, PrefixCachingChatCompletionClient(client, stats=prefix_stats)) for tier, client in tiers])
+
+    # The researching agents stream their replies, and each search or scrape starts as soon as its arguments have streamed,
+    # while the model is still writing the next calls of the same message (one dispatcher per agent, with shared stats).
+    eager_stats = EagerStats()
+    lead_marketing_analyst_client = EagerToolsChatCompletionClient(router.client("lead_marketing_analyst"), tools, eager_stats)
+    creative_content_creator_client = EagerToolsChatCompletionClient(router.client("creative_content_creator"), tools, eager_stats)
+
     lead_marketing_analyst = AssistantAgent(
         name="lead_marketing_analyst",
-        model_client=model_client,
-        tools=[serper_web_search, scrape_website],
+        model_client=lead_marketing_analyst_client,
+        tools=lead_marketing_analyst_client.tools,
+        model_client_stream=True,
         system_message="""As the Lead Market Analyst at a premier digital marketing firm, you specialize in dissecting online business landscapes.
 
         Your goal is to conduct amazing analysis of the products and competitors, providing in-depth insights to guide marketing strategies.
@@ -94,7 +172,7 @@ async def main() -> None:
 
     chief_marketing_strategist = AssistantAgent(
         name="chief_marketing_strategist",
-        model_client=model_client,
+        model_client=router.client("chief_marketing_strategist"),
         system_message="""You are the Chief Marketing Strategist at a leading digital marketing agency, known for crafting bespoke strategies that drive success. 
         
         Your goal is to synthesize amazing insights from product analysis to formulate incredible marketing strategies.
@@ -113,8 +191,9 @@ async def main() -> None:
 
     creative_content_creator = AssistantAgent(
         name="creative_content_creator",
-        model_client=model_client,
-        tools=[serper_web_search, scrape_website],
+        model_client=creative_content_creator_client,
+        tools=creative_content_creator_client.tools,
+        model_client_stream=True,
         system_message="""As a Creative Content Creator at a top-tier digital marketing agency, you excel in crafting narratives that resonate with audiences. Your expertise lies in turning marketing strategies into engaging stories and visual content that capture attention and inspire action.
 
         Your goal is to develop compelling and innovative content for social media campaigns, with a focus on creating high-impact ad copies.
@@ -134,7 +213,7 @@ async def main() -> None:
         """,
     )
 
-    termination_condition = TextMentionTermination("TERMINATE") | MaxMessageTermination(max_messages=10) 
+    termination_condition = TextMentionTermination("TERMINATE") | MaxMessageTermination(max_messages=10) | TokenBudgetTermination(budget)
 
     team = Swarm(
         [lead_marketing_analyst, chief_marketing_strategist, creative_content_creator],
@@ -145,9 +224,26 @@ async def main() -> None:
     # Run the agent and stream the messages to the console.
     
     task = input("Enter the customer and the project details: ")
-    await Console(team.run_stream(task=task))
+    result = await Console(cancel_prefetches_per_turn(team.run_stream(task=task)))
+    # Cancel the prefetches of a turn cut short (e.g. by the budget).
+    await prefetcher.cancel()
+    print(prefetcher.stats.report())
+    print(eager_stats.report())
+
+    # If the budget ran out before the campaign was complete, make one last call (from the budget's reserve)
+    # to turn the work done so far into the campaign.
+    if stopped_by_budget(result.stop_reason):
+        print("---------- budget_summary ----------")
+        print(await summarize_run(
+            router.client("budget_summary"), task, result.messages, budget,
+            instruction="Consolidate the research, strategy & content so far into the marketing campaign (ideas, then copies).",
+        ))
+    print(budget.report())
+    print(router.report())
+    print(prefix_stats.report())
+    router.export()
     
-    await model_client.close()
+    await router.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,163 @@
+import os
+import sys
+import queue
+import asyncio
+import threading
+from collections import deque
+from typing import Callable, Deque, Optional
+
+from autogen_core import CancellationToken
+
+
+# How long to wait for an answer by default (in seconds, 0 to wait forever).
+HITL_TIMEOUT = float(os.getenv("HITL_TIMEOUT", "0"))
+
+
+class _StdinReader:
+    # Reads the lines of stdin on a daemon thread, one per question, for all the `TerminalInput`s.
+
+    def __init__(self):
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._prompts: "queue.Queue[str]" = queue.Queue()
+        self._waiting: Deque[asyncio.Future] = deque()
+        self._reading = False
+        self._thread: Optional[threading.Thread] = None
+        self._buffer = b""
+
+    def _read_line(self) -> Optional[str]:
+        # Read from the file descriptor rather than `sys.stdin`, whose lock a blocked daemon thread
+        # would still hold when the interpreter shuts down.
+        while b"\n" not in self._buffer:
+            chunk = os.read(sys.stdin.fileno(), 4096)
+            if not chunk:
+                line, self._buffer = self._buffer, b""
+                return line.decode("utf-8", errors="replace") if line else None
+            self._buffer += chunk
+        line, _, self._buffer = self._buffer.partition(b"\n")
+        return line.decode("utf-8", errors="replace").rstrip("\r")
+
+    def _read_lines(self) -> None:
+        while True:
+            prompt = self._prompts.get()
+            print(prompt, end="", flush=True)
+            self._reading = True
+            line = self._read_line()
+            self._reading = False
+            self._loop.call_soon_threadsafe(self._deliver, line)
+
+    def _deliver(self, line: Optional[str]) -> None:
+        # The line answers the oldest question still waiting.
+        while self._waiting:
+            future = self._waiting.popleft()
+            if not future.done():
+                future.set_result(line)
+                return
+
+    def ask(self, prompt: str) -> asyncio.Future:
+        """The future answer to the prompt (None at the end of stdin)."""
+        if self._thread is None:
+            self._loop = asyncio.get_running_loop()
+            # A daemon thread, so a question left unanswered doesn't keep the process alive.
+            self._thread = threading.Thread(target=self._read_lines, name="terminal-input", daemon=True)
+            self._thread.start()
+        self._waiting = deque(future for future in self._waiting if not future.done())
+        if self._reading and not self._waiting:
+            # The reader is still waiting for the answer to a question that timed out: it answers this one.
+            print(prompt, end="", flush=True)
+        else:
+            self._prompts.put(prompt)
+        future = self._loop.create_future()
+        self._waiting.append(future)
+        return future
+
+
+_stdin_reader = _StdinReader()
+
+
+class TerminalInput:
+    """
+    Asks the user in the terminal without blocking the event loop: the prompt is answered on a reader thread,
+    while the agents (and anything else on the loop, e.g. streaming or speculative work) keep running.
+
+    Without an answer within `timeout` seconds, the default answer is used. A line typed after that
+    goes to the next question, if one is waiting, and is dropped otherwise.
+
+    Give `ask` to a `UserProxyAgent` as its `input_func` (the agent only awaits coroutine functions).
+
+    Args:
+        timeout (float, optional): How long to wait for an answer, in seconds. Defaults to waiting forever.
+        default (str): The answer used when the user doesn't answer in time (or stdin is closed).
+        on_prompt (Callable[[str], None], optional): Called with each prompt, as the user is asked.
+    """
+
+    def __init__(self, timeout: Optional[float] = None, default: str = "", on_prompt: Optional[Callable[[str], None]] = None):
+        self.timeout = timeout
+        self.default = default
+        self.on_prompt = on_prompt
+
+    async def ask(self, prompt: str = "", cancellation_token: Optional[CancellationToken] = None) -> str:
+        """
+        Ask the user.
+
+        Args:
+            prompt (str): The prompt.
+            cancellation_token (CancellationToken, optional): Cancels the question.
+
+        Returns:
+            str: The answer, or the default answer if the user didn't answer in time.
+        """
+        if self.on_prompt is not None:
+            self.on_prompt(prompt)
+        future = _stdin_reader.ask(prompt)
+        if cancellation_token is not None:
+            cancellation_token.link_future(future)
+        try:
+            line = await asyncio.wait_for(future, self.timeout or None)
+        except asyncio.TimeoutError:
+            print(f"\n(No answer after {self.timeout:g} s, going on with: {self.default or '(empty)'})")
+            return self.default
+        return self.default if line is None else line
+
+    async def __call__(self, prompt: str = "", cancellation_token: Optional[CancellationToken] = None) -> str:
+        return await self.ask(prompt, cancellation_token)
+
+
+class ChainlitInput:
+    """
+    Asks the user in a Chainlit app, with Chainlit's `AskUserMessage`: the question shows up in the chat,
+    and the agents wait for the reply without blocking the server.
+
+    Give `ask` to a `UserProxyAgent` as its `input_func`, inside a Chainlit session (e.g. in an `on_message` handler).
+
+    Args:
+        timeout (float): How long to wait for an answer, in seconds.
+        default (str): The answer used when the user doesn't answer in time.
+        author (str): The author of the question in the chat.
+        on_prompt (Callable[[str], None], optional): Called with each prompt, as the user is asked.
+    """
+
+    def __init__(self, timeout: float = 300, default: str = "", author: str = "user_proxy", on_prompt: Optional[Callable[[str], None]] = None):
+        self.timeout = timeout
+        self.default = default
+        self.author = author
+        self.on_prompt = on_prompt
+
+    async def ask(self, prompt: str = "", cancellation_token: Optional[CancellationToken] = None) -> str:
+        import chainlit as cl
+
+        if self.on_prompt is not None:
+            self.on_prompt(prompt)
+        question = asyncio.ensure_future(
+            cl.AskUserMessage(content=prompt or "Your answer:", author=self.author, timeout=int(self.timeout)).send()
+        )
+        if cancellation_token is not None:
+            cancellation_token.link_future(question)
+        response = await question
+        if not response:
+            await cl.Message(content=f"No answer after {self.timeout:g} s, going on with: {self.default or '(empty)'}", author=self.author).send()
+            return self.default
+        return response["output"]
+
+    async def __call__(self, prompt: str = "", cancellation_token: Optional[CancellationToken] = None) -> str:
+        return await self.ask(prompt, cancellation_token)
+
@@ -0,0 +1,209 @@
+import re
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+
+# ATX headings ("## Title"), and the underlines of setext headings ("Title\n=====").
+HEADING_PATTERN = re.compile(r"^(#{1,6})\s+(.*?)\s*#*\s*$")
+SETEXT_PATTERN = re.compile(r"^(=+|-+)\s*$")
+FENCE_PATTERN = re.compile(r"^\s*(```|~~~)\s*([\w+-]*)")
+
+# Markdown images, "![alt](url "title")", also when wrapped in a link, and HTML images.
+IMAGE_PATTERN = re.compile(r"!\[([^\]]*)\]\(\s*<?([^)\s>]+)>?(?:\s+[\"'][^\"']*[\"'])?\s*\)")
+HTML_IMAGE_PATTERN = re.compile(r"<img\b[^>]*?\bsrc=[\"']([^\"']+)[\"'][^>]*>", re.IGNORECASE)
+HTML_ALT_PATTERN = re.compile(r"\balt=[\"']([^\"']*)[\"']", re.IGNORECASE)
+
+# Links are reduced to their text in the excerpts.
+LINK_PATTERN = re.compile(r"\[([^\]]*)\]\([^)]*\)")
+
+
+@dataclass
+class Image:
+    url: str
+    alt: str = ""
+
+
+@dataclass
+class CodeBlock:
+    language: str
+    code: str
+
+
+@dataclass
+class Section:
+    """A section of the blog: a heading, and everything up to the next heading."""
+
+    level: int
+    heading: str
+    paragraphs: List[str] = field(default_factory=list)
+    images: List[Image] = field(default_factory=list)
+    code_blocks: List[CodeBlock] = field(default_factory=list)
+
+    @property
+    def text(self) -> str:
+        return "\n".join(self.paragraphs)
+
+    def is_empty(self) -> bool:
+        return not (self.paragraphs or self.images or self.code_blocks)
+
+
+@dataclass
+class BlogOutline:
+    title: str
+    sections: List[Section]
+
+    @property
+    def images(self) -> List[Image]:
+        return [image for section in self.sections for image in section.images]
+
+
+def _add_images(section: Section, line: str) -> str:
+    """Attach the images of a line to the section, and return the line without them."""
+    seen = {image.url for image in section.images}
+    for alt, url in IMAGE_PATTERN.findall(line):
+        if url not in seen:
+            section.images.append(Image(url=url, alt=alt.strip()))
+            seen.add(url)
+    for match in HTML_IMAGE_PATTERN.finditer(line):
+        url = match.group(1)
+        if url not in seen:
+            alt = HTML_ALT_PATTERN.search(match.group(0))
+            section.images.append(Image(url=url, alt=alt.group(1).strip() if alt else ""))
+            seen.add(url)
+    line = HTML_IMAGE_PATTERN.sub("", IMAGE_PATTERN.sub("", line))
+    # A link around an image leaves "[](link)" behind.
+    return LINK_PATTERN.sub(lambda m: m.group(1), line).strip()
+
+
+def parse_markdown(markdown: str) -> BlogOutline:
+    """
+    Parse the markdown of a blog into its sections, with the images & code blocks of each section attached to it.
+
+    Args:
+        markdown (str): The markdown of the blog, e.g. as scraped by Firecrawl.
+
+    Returns:
+        BlogOutline: The title of the blog (its first top-level heading) and its sections.
+    """
+    sections = [Section(level=0, heading="")]
+    paragraph: List[str] = []
+    fence: Optional[str] = None
+    code: List[str] = []
+    language = ""
+
+    def end_paragraph() -> None:
+        if paragraph:
+            sections[-1].paragraphs.append(" ".join(paragraph))
+            paragraph.clear()
+
+    lines = markdown.splitlines()
+    underline = False
+    for index, line in enumerate(lines):
+        if underline:
+            # The underline of the setext heading just added.
+            underline = False
+            continue
+        if fence is not None:
+            if line.strip().startswith(fence):
+                sections[-1].code_blocks.append(CodeBlock(language=language, code="\n".join(code)))
+                fence, code = None, []
+            else:
+                code.append(line)
+            continue
+
+        fence_match = FENCE_PATTERN.match(line)
+        if fence_match:
+            end_paragraph()
+            fence, language = fence_match.group(1), fence_match.group(2)
+            continue
+
+        heading_match = HEADING_PATTERN.match(line)
+        next_line = lines[index + 1] if index + 1 < len(lines) else ""
+        # A "---" under a line of a paragraph can't be told apart from a thematic break, so only "===" ends one.
+        is_setext = bool(line.strip()) and SETEXT_PATTERN.match(next_line) and (not paragraph or next_line.strip().startswith("="))
+        if heading_match or (is_setext and not IMAGE_PATTERN.search(line)):
+            end_paragraph()
+            if heading_match:
+                level, heading = len(heading_match.group(1)), heading_match.group(2)
+            else:
+                level, heading = (1 if next_line.strip().startswith("=") else 2), line.strip()
+                underline = True
+            section = Section(level=level, heading="")
+            section.heading = _add_images(section, heading)
+            sections.append(section)
+            continue
+        if SETEXT_PATTERN.match(line) or line.strip() in ("***", "___"):
+            # A thematic break.
+            end_paragraph()
+            continue
+
+        text = _add_images(sections[-1], line)
+        if text:
+            paragraph.append(text)
+        else:
+            end_paragraph()
+    end_paragraph()
+    if fence is not None and code:
+        sections[-1].code_blocks.append(CodeBlock(language=language, code="\n".join(code)))
+
+    sections = [section for section in sections if section.heading or not section.is_empty()]
+    title = next((section.heading for section in sections if section.level == 1), sections[0].heading if sections else "")
+    return BlogOutline(title=title, sections=sections)
+
+
+def _excerpt(text: str, limit: int) -> str:
+    if len(text) <= limit:
+        return text
+    cut = text[:limit]
+    # End on a sentence, or at least on a word.
+    end = max(cut.rfind(". "), cut.rfind("? "), cut.rfind("! "))
+    if end > limit // 2:
+        return cut[: end + 1] + " …"
+    return cut.rsplit(" ", 1)[0] + " …"
+
+
+def render_outline(outline: BlogOutline, max_chars: int = 6000, code_lines: int = 6) -> str:
+    """
+    Render the outline compactly, for the model: each section's heading, an excerpt of its text,
+    the first lines of its code blocks, and the exact URLs of its images.
+
+    The excerpts share what is left of `max_chars` after the headings, images & code,
+    so every section is represented, however long the blog.
+
+    Args:
+        outline (BlogOutline): The outline.
+        max_chars (int): The target size of the rendered outline.
+        code_lines (int): The number of lines shown of each code block.
+
+    Returns:
+        str: The outline, as markdown.
+    """
+    parts = []
+    for number, section in enumerate(outline.sections, start=1):
+        lines = [f"{'#' * max(section.level, 2)} [{number}] {section.heading or '(Introduction)'}"]
+        for block in section.code_blocks:
+            code = block.code.strip().splitlines()
+            shown = "\n".join(code[:code_lines]) + (f"\n# … ({len(code) - code_lines} more lines)" if len(code) > code_lines else "")
+            lines.append(f"```{block.language}\n{shown}\n```")
+        if section.images:
+            lines.append("Images of this section:")
+            lines.extend(f"- {image.url}" + (f" ({image.alt})" if image.alt else "") for image in section.images)
+        parts.append(lines)
+
+    fixed = sum(len(line) + 1 for lines in parts for line in lines) + len(outline.title) + 32
+    texts = [section.text for section in outline.sections]
+    available = max(max_chars - fixed, 0)
+    # Give every section an equal share, and hand what short sections don't use to the longer ones.
+    limits = [0] * len(texts)
+    remaining = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+    while remaining:
+        share = available // len(remaining)
+        i = remaining.pop(0)
+        limits[i] = min(len(texts[i]), share)
+        available -= limits[i]
+
+    rendered = [f"Blog title: {outline.title}" if outline.title else "Blog outline"]
+    for lines, text, limit in zip(parts, texts, limits):
+        excerpt = _excerpt(text, limit) if limit else ""
+        rendered.append("\n".join(lines[:1] + ([excerpt] if excerpt else []) + lines[1:]))
+    return "\n\n".join(rendered)
@@ -0,0 +1,443 @@
+import os
+import sys
+import ast
+import json
+import shutil
+import asyncio
+import hashlib
+from dataclasses import dataclass
+from typing import Dict, List, Mapping, Optional, Sequence, Tuple
+
+from autogen_agentchat.base import TerminationCondition
+from autogen_agentchat.messages import AgentEvent, ChatMessage, StopMessage, ToolCallExecutionEvent, ToolCallRequestEvent
+from autogen_core import CancellationToken
+from autogen_core.code_executor import CodeBlock, CodeExecutor, CodeResult
+
+
+# Modules that are imported once when a worker starts, so that snippets using them don't pay the import cost.
+DEFAULT_PRELOAD = ("math", "json", "re", "random", "itertools", "functools", "collections", "typing", "datetime", "decimal", "fractions", "statistics", "heapq", "bisect")
+
+
+# The loop that runs inside each worker process.
+# The protocol is one JSON line per request on a private copy of stdin, and one JSON line per response on a private copy of stdout.
+# The snippet itself sees an empty stdin, and everything it writes to stdout/stderr (including from subprocesses) is captured to a file.
+WORKER_SOURCE = r"""
+import os, sys, ast, json, types, signal, shutil, builtins, traceback, importlib
+
+scratch_dir, capture_path, config = sys.argv[1], sys.argv[2], json.loads(sys.argv[3])
+
+if config["memory_limit_mb"]:
+    try:
+        import resource
+        limit = config["memory_limit_mb"] * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    except (ImportError, ValueError, OSError):
+        pass
+
+for name in config["preload"]:
+    try:
+        importlib.import_module(name)
+    except ImportError:
+        pass
+
+requests = os.fdopen(os.dup(0), "r", encoding="utf-8")
+responses = os.fdopen(os.dup(1), "w", encoding="utf-8")
+devnull = os.open(os.devnull, os.O_RDONLY)
+os.dup2(devnull, 0)
+
+class CPUTimeExceeded(BaseException):
+    pass
+
+def on_cpu_limit(signum, frame):
+    raise CPUTimeExceeded()
+
+has_cpu_timer = hasattr(signal, "setitimer")
+if has_cpu_timer:
+    signal.signal(signal.SIGPROF, on_cpu_limit)
+
+os.makedirs(scratch_dir, exist_ok=True)
+os.chdir(scratch_dir)
+
+# The process state that snippets could change for the snippets after them.
+stdio = sys.stdin, sys.stdout, sys.stderr
+builtins_state = dict(vars(builtins))
+
+def module_state():
+    # The attributes of each module: rebinding or deleting one shows up, new (lazily set) ones don't.
+    return {
+        name: (module, dict(vars(module)))
+        for name, module in list(sys.modules.items())
+        # This loop's own globals change on every run, and the builtins are put back separately.
+        if isinstance(module, types.ModuleType) and name not in ("__main__", "builtins")
+    }
+
+modules = module_state()
+
+def patches_modules(tree, namespace):
+    # Assignments to the attributes of a module (e.g. `math.pi = 3`, `setattr(json, ...)`) in the snippet,
+    # including to the modules it imported itself, which the snapshot doesn't know yet.
+    for node in ast.walk(tree):
+        targets = []
+        if isinstance(node, (ast.Assign, ast.Delete)):
+            targets = node.targets
+        elif isinstance(node, (ast.AugAssign, ast.AnnAssign)):
+            targets = [node.target]
+        elif isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in ("setattr", "delattr") and node.args:
+            targets = [ast.Attribute(value=node.args[0], attr="", ctx=ast.Store())]
+        for target in targets:
+            while isinstance(target, (ast.Attribute, ast.Subscript)):
+                target = target.value
+                if isinstance(target, ast.Name) and isinstance(namespace.get(target.id, getattr(builtins, target.id, None)), types.ModuleType):
+                    return True
+    return False
+
+def restore_modules():
+    # Put back the modules and module attributes the snippet replaced, so this loop can still answer;
+    # returns whether there were any.
+    changed = False
+    for name, (module, attributes) in modules.items():
+        if sys.modules.get(name) is not module:
+            sys.modules[name] = module
+            changed = True
+        current = vars(module)
+        if any(key not in current or current[key] is not value for key, value in attributes.items()):
+            current.update(attributes)
+            changed = True
+    return changed
+
+for line in requests:
+    request = json.loads(line)
+    exit_code = 0
+    capture = os.open(capture_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC)
+    saved = os.dup(1), os.dup(2)
+    os.dup2(capture, 1)
+    os.dup2(capture, 2)
+    if has_cpu_timer and config["cpu_time_limit"]:
+        signal.setitimer(signal.ITIMER_PROF, config["cpu_time_limit"])
+    namespace = {"__name__": "__main__"}
+    tree = None
+    try:
+        tree = compile(request["code"], "<sandbox>", "exec", ast.PyCF_ONLY_AST)
+        exec(compile(tree, "<sandbox>", "exec"), namespace)
+    except SystemExit as e:
+        exit_code = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+    except CPUTimeExceeded:
+        print("CPU time limit exceeded", file=sys.stderr)
+        exit_code = 124
+    except BaseException:
+        # Skip this loop's own frame, so the traceback starts at the snippet.
+        error_type, error, tb = sys.exc_info()
+        traceback.print_exception(error_type, error, tb.tb_next)
+        exit_code = 1
+    finally:
+        if has_cpu_timer:
+            signal.setitimer(signal.ITIMER_PROF, 0)
+        # Put back what the snippet may have replaced: the standard streams, the builtins and the modules.
+        recycle = (sys.stdin, sys.stdout, sys.stderr) != stdio or vars(builtins) != builtins_state
+        sys.stdin, sys.stdout, sys.stderr = stdio
+        current = vars(builtins)
+        if current != builtins_state:
+            current.clear()
+            current.update(builtins_state)
+        recycle = restore_modules() or recycle
+        try:
+            sys.stdout.flush()
+            sys.stderr.flush()
+        except (ValueError, OSError):
+            # The snippet closed them: this worker can't be reused.
+            recycle = True
+        os.dup2(saved[0], 1)
+        os.dup2(saved[1], 2)
+        for fd in (*saved, capture):
+            os.close(fd)
+
+    # Leave a clean scratch directory for the next snippet.
+    os.chdir(scratch_dir)
+    for entry in os.listdir(scratch_dir):
+        path = os.path.join(scratch_dir, entry)
+        shutil.rmtree(path, ignore_errors=True) if os.path.isdir(path) else os.remove(path)
+
+    # Patches can't be put back reliably (e.g. objects holding a patched function, modules the snippet imported
+    # and patched), so after one the worker is replaced rather than reused.
+    recycle = recycle or (tree is not None and patches_modules(tree, namespace))
+    modules.update({name: state for name, state in module_state().items() if name not in modules})
+
+    with open(capture_path, "r", encoding="utf-8", errors="replace") as f:
+        output = f.read()
+    responses.write(json.dumps({"exit_code": exit_code, "output": output, "recycle": recycle}) + "\n")
+    responses.flush()
+"""
+
+
+@dataclass
+class TransientResult(CodeResult):
+    """The result of a run that didn't finish (a timeout, or a worker crash): running the code again may not give it."""
+
+
+class _SandboxWorker:
+    """A pre-warmed Python process with its own scratch directory."""
+
+    def __init__(self, index: int, work_dir: str, config: dict):
+        self.scratch_dir = os.path.abspath(os.path.join(work_dir, f"worker-{index}"))
+        self.capture_path = self.scratch_dir + ".out"
+        self.config = config
+        self.process: Optional[asyncio.subprocess.Process] = None
+        self.runs = 0
+        self.recycle = False
+
+    async def start(self) -> None:
+        os.makedirs(self.scratch_dir, exist_ok=True)
+        self.process = await asyncio.create_subprocess_exec(
+            sys.executable, "-c", WORKER_SOURCE, self.scratch_dir, self.capture_path, json.dumps(self.config),
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            limit=64 * 1024 * 1024,
+        )
+        self.runs = 0
+        self.recycle = False
+
+    async def stop(self) -> None:
+        if self.process is not None and self.process.returncode is None:
+            self.process.kill()
+            await self.process.wait()
+        self.process = None
+
+    async def run(self, code: str) -> CodeResult:
+        self.process.stdin.write((json.dumps({"code": code}) + "\n").encode("utf-8"))
+        await self.process.stdin.drain()
+        line = await self.process.stdout.readline()
+        self.runs += 1
+        if not line:
+            # The process died, e.g. it hit the memory limit or the snippet called os._exit().
+            await self.stop()
+            with open(self.capture_path, "r", encoding="utf-8", errors="replace") as f:
+                output = f.read()
+            return TransientResult(exit_code=1, output=output + "\nThe sandbox worker exited unexpectedly.")
+        response = json.loads(line)
+        # The snippet changed the worker's modules, builtins or standard streams: it must not run anything else.
+        self.recycle = self.recycle or response.get("recycle", False)
+        return CodeResult(exit_code=response["exit_code"], output=response["output"])
+
+
+class PythonSandboxPool(CodeExecutor):
+    """
+    Executes Python code on a pool of pre-warmed worker processes.
+
+    Unlike `LocalCommandLineCodeExecutor`, which starts a fresh interpreter for every run and shares one
+    work directory, each worker here is started once, has the common modules already imported, and gets
+    its own scratch directory. Snippets therefore run in tens of milliseconds, and concurrent runs can't clash.
+
+    Args:
+        work_dir (str): The directory under which the workers' scratch directories are created.
+        size (int): The number of worker processes.
+        timeout (float): Wall-clock seconds a snippet may run before its worker is killed & replaced.
+        cpu_time_limit (float): CPU seconds a snippet may use (where the platform supports it).
+        memory_limit_mb (int): Address-space limit of each worker (where the platform supports it).
+        preload (Sequence[str]): Modules to import when a worker starts.
+        max_runs_per_worker (int): Runs after which a worker is replaced, so state leaked by snippets doesn't pile up.
+            A worker is also replaced right after a snippet that patched an imported module or a builtin, or replaced
+            sys.stdout/sys.stderr (the streams and builtins are put back, but the worker isn't trusted anymore).
+    """
+
+    def __init__(
+        self,
+        work_dir: str = "./code_executor",
+        size: int = 2,
+        timeout: float = 30,
+        cpu_time_limit: float = 10,
+        memory_limit_mb: int = 1024,
+        preload: Sequence[str] = DEFAULT_PRELOAD,
+        max_runs_per_worker: int = 50,
+    ):
+        self.work_dir = work_dir
+        self.size = size
+        self.timeout = timeout
+        self.max_runs_per_worker = max_runs_per_worker
+        self._config = {"cpu_time_limit": cpu_time_limit, "memory_limit_mb": memory_limit_mb, "preload": list(preload)}
+        self._workers: List[_SandboxWorker] = []
+        self._idle: Optional[asyncio.Queue] = None
+
+    async def start(self) -> None:
+        """Start the worker processes. Called on the first run if not called explicitly."""
+        self._workers = [_SandboxWorker(i, self.work_dir, self._config) for i in range(self.size)]
+        await asyncio.gather(*(worker.start() for worker in self._workers))
+        self._idle = asyncio.Queue()
+        for worker in self._workers:
+            self._idle.put_nowait(worker)
+
+    async def stop(self) -> None:
+        """Stop the worker processes and remove their scratch directories."""
+        await asyncio.gather(*(worker.stop() for worker in self._workers))
+        for worker in self._workers:
+            shutil.rmtree(worker.scratch_dir, ignore_errors=True)
+            if os.path.exists(worker.capture_path):
+                os.remove(worker.capture_path)
+        self._workers = []
+        self._idle = None
+
+    async def restart(self) -> None:
+        await self.stop()
+        await self.start()
+
+    async def execute_code_blocks(self, code_blocks: List[CodeBlock], cancellation_token: CancellationToken) -> CodeResult:
+        if self._idle is None:
+            await self.start()
+
+        worker = await self._idle.get()
+        try:
+            outputs = []
+            exit_code = 0
+            for code_block in code_blocks:
+                if code_block.language.lower() not in ("python", "py", "python3"):
+                    return CodeResult(exit_code=1, output=f"Unsupported language: {code_block.language}")
+                if worker.process is None or worker.recycle or worker.runs >= self.max_runs_per_worker:
+                    await worker.stop()
+                    await worker.start()
+
+                run = asyncio.ensure_future(asyncio.wait_for(worker.run(code_block.code), timeout=self.timeout))
+                cancellation_token.link_future(run)
+                try:
+                    result = await run
+                except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+                    # The worker is in an unknown state, so replace it before handing it back.
+                    await worker.stop()
+                    await worker.start()
+                    if isinstance(e, asyncio.CancelledError):
+                        raise
+                    return TransientResult(exit_code=124, output="\n".join(outputs + ["Timeout"]))
+
+                outputs.append(result.output)
+                exit_code = result.exit_code
+                if exit_code != 0:
+                    if isinstance(result, TransientResult):
+                        return TransientResult(exit_code=exit_code, output="\n".join(outputs))
+                    break
+            return CodeResult(exit_code=exit_code, output="\n".join(outputs))
+        finally:
+            if worker.recycle and worker.process is not None:
+                # Replaced in the background, so this run's result isn't held up by the new worker's startup.
+                asyncio.create_task(self._replace(worker))
+            else:
+                self._idle.put_nowait(worker)
+
+    async def _replace(self, worker: _SandboxWorker) -> None:
+        idle = self._idle
+        try:
+            await worker.stop()
+            await worker.start()
+        finally:
+            # A worker that failed to start is started again on its next use.
+            if idle is self._idle and idle is not None:
+                idle.put_nowait(worker)
+
+
+def code_fingerprint(code: str, stdin: str = "", env: Optional[Mapping[str, str]] = None) -> str:
+    """
+    Hash code by its syntax tree, so that changes to whitespace or comments don't change the hash.
+
+    Args:
+        code (str): The Python code.
+        stdin (str): The input given to the code.
+        env (Mapping[str, str], optional): The environment the code runs in.
+
+    Returns:
+        str: The fingerprint of the code, its input and its environment.
+    """
+    try:
+        normalized = ast.dump(ast.parse(code), include_attributes=False)
+    except SyntaxError:
+        # Code that doesn't parse is still hashed, just less forgivingly.
+        normalized = "\n".join(line.rstrip() for line in code.strip().splitlines())
+    data = json.dumps({"code": normalized, "stdin": stdin, "env": dict(sorted((env or {}).items()))})
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+class CachedCodeExecutor(CodeExecutor):
+    """
+    Wraps a code executor, and reuses the result of code that was already run instead of running it again.
+
+    Results are keyed by `code_fingerprint`, so code that only differs in whitespace or comments is a hit.
+    Timeouts and worker crashes (`TransientResult`) are not cached, since running the code again may not repeat them.
+
+    Args:
+        executor (CodeExecutor): The executor that runs the code on a cache miss.
+        env (Mapping[str, str], optional): The environment the code runs in; it is part of the cache key.
+    """
+
+    def __init__(self, executor: CodeExecutor, env: Optional[Mapping[str, str]] = None):
+        self.executor = executor
+        self.env = dict(env or {})
+        self.cache: Dict[str, CodeResult] = {}
+        self.hits = 0
+        self.misses = 0
+
+    async def execute_code_blocks(self, code_blocks: List[CodeBlock], cancellation_token: CancellationToken) -> CodeResult:
+        key = code_fingerprint(
+            "\n".join(f"# {block.language}\n{block.code}" for block in code_blocks),
+            env=self.env,
+        )
+        if key in self.cache:
+            self.hits += 1
+            return self.cache[key]
+
+        self.misses += 1
+        result = await self.executor.execute_code_blocks(code_blocks, cancellation_token)
+        if not isinstance(result, TransientResult) and result.exit_code != 124:
+            self.cache[key] = result
+        return result
+
+    async def restart(self) -> None:
+        await self.executor.restart()
+
+
+class FixedPointTermination(TerminationCondition):
+    """
+    Terminate the conversation when a round of code execution runs the same code and gets the same output as the previous one.
+
+    At that point, the coder and the critic are going around in circles, and further rounds only cost model calls.
+
+    Args:
+        tool_name (str): The name of the code execution tool.
+    """
+
+    def __init__(self, tool_name: str = "CodeExecutor"):
+        self.tool_name = tool_name
+        self._terminated = False
+        self._pending: Dict[str, str] = {}
+        self._last_round: Optional[Tuple[Tuple[str, str], ...]] = None
+
+    @property
+    def terminated(self) -> bool:
+        return self._terminated
+
+    async def __call__(self, messages: Sequence[AgentEvent | ChatMessage]) -> StopMessage | None:
+        for message in messages:
+            if isinstance(message, ToolCallRequestEvent):
+                for call in message.content:
+                    if call.name == self.tool_name:
+                        try:
+                            code = json.loads(call.arguments).get("code", "")
+                        except json.JSONDecodeError:
+                            code = call.arguments
+                        self._pending[call.id] = code_fingerprint(code)
+            elif isinstance(message, ToolCallExecutionEvent):
+                current_round = tuple(
+                    (self._pending.pop(result.call_id), hashlib.sha256(result.content.encode("utf-8")).hexdigest())
+                    for result in message.content
+                    if result.call_id in self._pending
+                )
+                if not current_round:
+                    continue
+                if current_round == self._last_round:
+                    self._terminated = True
+                    return StopMessage(
+                        content="Fixed point reached: the code and its output did not change since the previous round.",
+                        source="FixedPointTermination",
+                    )
+                self._last_round = current_round
+        return None
+
+    async def reset(self) -> None:
+        self._terminated = False
+        self._pending = {}
+        self._last_round = None
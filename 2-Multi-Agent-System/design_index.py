@@ -0,0 +1,212 @@
+import os
+import re
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional
+
+import chromadb
+
+
+# Name of the full-text index database, and of the vector store directory, kept inside the reports directory.
+FTS_FILENAME = ".design_index.sqlite3"
+VECTORS_DIRNAME = ".design_index_chroma"
+
+# Reports are indexed per section (one per markdown heading), so a search returns the relevant part of a design.
+SECTION_PATTERN = re.compile(r"^(?=#{1,3} )", re.MULTILINE)
+
+# Constant of the reciprocal rank fusion of the full-text & vector rankings.
+RRF_K = 60
+
+
+class DesignIndex:
+    """
+    A local full-text & vector index over the system design reports, for reusing past designs.
+
+    - Each report is split into its sections, which are indexed in SQLite FTS5 (keyword search, BM25)
+      and in a persistent Chroma collection (semantic search, with Chroma's default embeddings).
+    - A search runs both, and merges the two rankings with reciprocal rank fusion.
+    - Indexing is incremental: only new or modified reports are (re)indexed.
+
+    Args:
+        directory (str): The directory of the reports.
+        use_vectors (bool): Whether to also keep a vector index. Without it, only full-text search is used.
+        embedding_function (optional): The Chroma embedding function; Chroma's default (all-MiniLM-L6-v2) if not given.
+    """
+
+    def __init__(self, directory: str = "system_design_docs", use_vectors: bool = True, embedding_function: Optional[Any] = None):
+        self.directory = os.path.realpath(directory)
+        os.makedirs(self.directory, exist_ok=True)
+        self.fts_path = os.path.join(self.directory, FTS_FILENAME)
+        self.use_vectors = use_vectors
+        self.embedding_function = embedding_function
+        self._collection: Optional[Any] = None
+        # The index is written from a thread pool; serialize the writes.
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS reports (filename TEXT PRIMARY KEY, modified_at REAL NOT NULL, size INTEGER NOT NULL, vectors INTEGER NOT NULL)")
+            if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'sections'").fetchone():
+                # An index of an earlier version, whose sections were only kept in the FTS table: rebuild it.
+                conn.execute("DROP TABLE sections")
+                conn.execute("DELETE FROM reports")
+            # The sections are kept in a regular table, so they are fetched (by id) & deleted (by report) through its
+            # indexes; the full-text index only indexes them (FTS5 external content), and is kept in sync by triggers.
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS section_texts "
+                "(id INTEGER PRIMARY KEY, section_id TEXT NOT NULL UNIQUE, filename TEXT NOT NULL, heading TEXT NOT NULL, content TEXT NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS section_texts_filename ON section_texts (filename)")
+            conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS section_search USING fts5(heading, content, content='section_texts', content_rowid='id')")
+            conn.execute(
+                "CREATE TRIGGER IF NOT EXISTS section_texts_insert AFTER INSERT ON section_texts BEGIN "
+                "INSERT INTO section_search (rowid, heading, content) VALUES (new.id, new.heading, new.content); END"
+            )
+            conn.execute(
+                "CREATE TRIGGER IF NOT EXISTS section_texts_delete AFTER DELETE ON section_texts BEGIN "
+                "INSERT INTO section_search (section_search, rowid, heading, content) VALUES ('delete', old.id, old.heading, old.content); END"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.fts_path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    @property
+    def collection(self):
+        # Created on first use, since loading the embedding model takes a while.
+        if self._collection is None:
+            client = chromadb.PersistentClient(path=os.path.join(self.directory, VECTORS_DIRNAME))
+            kwargs = {"embedding_function": self.embedding_function} if self.embedding_function is not None else {}
+            self._collection = client.get_or_create_collection("system_designs", metadata={"hnsw:space": "cosine"}, **kwargs)
+        return self._collection
+
+    @staticmethod
+    def split_sections(text: str) -> List[Dict[str, str]]:
+        sections = []
+        for part in SECTION_PATTERN.split(text):
+            part = part.strip()
+            if not part:
+                continue
+            first_line = part.splitlines()[0]
+            heading = first_line.lstrip("#").strip() if first_line.startswith("#") else ""
+            sections.append({"heading": heading, "content": part})
+        return sections
+
+    def add(self, path: str) -> int:
+        """
+        Index a report, replacing its previous version in the index (if any).
+
+        Args:
+            path (str): The path of the report.
+
+        Returns:
+            int: The number of sections indexed.
+        """
+        path = os.path.realpath(path)
+        filename = os.path.relpath(path, self.directory)
+        with open(path, encoding="utf-8", errors="replace") as f:
+            sections = self.split_sections(f.read())
+        stat = os.stat(path)
+
+        with self._lock:
+            self._remove(filename)
+            ids = [f"{filename}#{i}" for i in range(len(sections))]
+            # The vectors are added first: if embedding fails, the report isn't marked as indexed, and the next sync retries it.
+            if self.use_vectors and sections:
+                self.collection.add(
+                    ids=ids,
+                    documents=[section["content"] for section in sections],
+                    metadatas=[{"filename": filename, "heading": section["heading"]} for section in sections],
+                )
+            with self._connect() as conn:
+                conn.executemany(
+                    "INSERT INTO section_texts (section_id, filename, heading, content) VALUES (?, ?, ?, ?)",
+                    [(id, filename, section["heading"], section["content"]) for id, section in zip(ids, sections)],
+                )
+                conn.execute(
+                    "INSERT OR REPLACE INTO reports (filename, modified_at, size, vectors) VALUES (?, ?, ?, ?)",
+                    (filename, stat.st_mtime, stat.st_size, int(self.use_vectors)),
+                )
+        return len(sections)
+
+    def _remove(self, filename: str) -> None:
+        with self._connect() as conn:
+            conn.execute("DELETE FROM section_texts WHERE filename = ?", (filename,))
+            conn.execute("DELETE FROM reports WHERE filename = ?", (filename,))
+        if self.use_vectors:
+            self.collection.delete(where={"filename": filename})
+
+    def sync(self) -> int:
+        """
+        Index the new & modified reports of the directory, and drop the deleted ones.
+
+        Returns:
+            int: The number of reports (re)indexed.
+        """
+        with self._connect() as conn:
+            known = {
+                filename: (modified_at, size, bool(vectors) or not self.use_vectors)
+                for filename, modified_at, size, vectors in conn.execute("SELECT filename, modified_at, size, vectors FROM reports")
+            }
+        present = set()
+        count = 0
+        for entry in os.scandir(self.directory):
+            if not entry.is_file() or entry.name.startswith(".") or not entry.name.endswith(".md"):
+                continue
+            present.add(entry.name)
+            stat = entry.stat()
+            # Also reindex the reports that were indexed without vectors, if vectors are now used.
+            if known.get(entry.name) != (stat.st_mtime, stat.st_size, True):
+                self.add(entry.path)
+                count += 1
+        with self._lock:
+            for filename in set(known) - present:
+                self._remove(filename)
+        return count
+
+    def _fts_search(self, query: str, limit: int) -> List[str]:
+        # Match any of the query's words, so the full-text search ranks rather than filters.
+        words = re.findall(r"\w+", query.lower())
+        if not words:
+            return []
+        match = " OR ".join(f'"{word}"' for word in words)
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT section_texts.section_id FROM section_search JOIN section_texts ON section_texts.id = section_search.rowid "
+                "WHERE section_search MATCH ? ORDER BY bm25(section_search) LIMIT ?",
+                (match, limit),
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def _vector_search(self, query: str, limit: int) -> List[str]:
+        if not self.use_vectors or self.collection.count() == 0:
+            return []
+        result = self.collection.query(query_texts=[query], n_results=min(limit, self.collection.count()))
+        return result["ids"][0]
+
+    def search(self, query: str, k: int = 3, candidates: int = 20) -> List[Dict[str, Any]]:
+        """
+        Find the sections of past reports most relevant to the query.
+
+        Args:
+            query (str): What to search for, e.g. the system being designed.
+            k (int): The number of sections to return.
+            candidates (int): The number of results taken from each of the two indexes before merging them.
+
+        Returns:
+            List[Dict[str, Any]]: The sections, best first, with their report's filename, heading, content & score.
+        """
+        scores: Dict[str, float] = {}
+        for ranking in (self._fts_search(query, candidates), self._vector_search(query, candidates)):
+            for rank, section_id in enumerate(ranking):
+                scores[section_id] = scores.get(section_id, 0.0) + 1.0 / (RRF_K + rank + 1)
+        best = sorted(scores, key=scores.get, reverse=True)[:k]
+        if not best:
+            return []
+
+        with self._connect() as conn:
+            rows = conn.execute(
+                f"SELECT section_id, filename, heading, content FROM section_texts WHERE section_id IN ({', '.join('?' * len(best))})",
+                best,
+            ).fetchall()
+        sections = {row[0]: {"filename": row[1], "heading": row[2], "content": row[3]} for row in rows}
+        return [{**sections[id], "score": scores[id]} for id in best if id in sections]
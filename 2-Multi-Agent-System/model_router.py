@@ -0,0 +1,368 @@
+import os
+import json
+import time
+import warnings
+from dataclasses import asdict, dataclass
+from typing import Any, AsyncGenerator, Callable, Dict, List, Mapping, Optional, Sequence, Tuple, Union
+
+from autogen_core import CancellationToken
+from autogen_core.models import (
+    ChatCompletionClient,
+    CreateResult,
+    FunctionExecutionResultMessage,
+    LLMMessage,
+    ModelCapabilities,
+    ModelInfo,
+    RequestUsage,
+)
+from autogen_core.tools import Tool, ToolSchema
+
+
+# The model tiers, from the cheapest to the largest, as "<tier>=<model>" pairs.
+DEFAULT_TIERS = "small=gpt-4o-mini,large=gpt-4o"
+
+# The handoff tools of a Swarm are named "transfer_to_<agent>".
+HANDOFF_PREFIX = "transfer_to_"
+
+
+def model_tiers(spec: Optional[str] = None) -> List[Tuple[str, str]]:
+    """
+    The model tiers, from the cheapest to the largest, from the `MODEL_TIERS` environment variable
+    (e.g. "small=gpt-4o-mini,large=gpt-4o").
+
+    Returns:
+        List[Tuple[str, str]]: The (tier, model) pairs.
+    """
+    spec = spec or os.getenv("MODEL_TIERS") or DEFAULT_TIERS
+    tiers = []
+    for entry in spec.split(","):
+        if entry.strip():
+            tier, _, model = entry.partition("=")
+            tiers.append((tier.strip(), model.strip() or tier.strip()))
+    return tiers
+
+
+def parse_routes(spec: str) -> Dict[str, str]:
+    """Parse routes like "report_writer=large,*:tool_result=large" into a mapping."""
+    routes = {}
+    for entry in spec.split(","):
+        if "=" in entry:
+            route, _, tier = entry.partition("=")
+            routes[route.strip()] = tier.strip()
+    return routes
+
+
+@dataclass
+class TierStats:
+    """The calls served by one model tier."""
+
+    calls: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    latency_seconds: float = 0.0
+    max_latency_seconds: float = 0.0
+    # Calls whose result failed validation (and were escalated to the next tier, if any).
+    failed_validations: int = 0
+    # Calls this tier received because a smaller tier's result failed validation.
+    escalated_calls: int = 0
+
+    @property
+    def mean_latency_seconds(self) -> float:
+        return self.latency_seconds / self.calls if self.calls else 0.0
+
+
+@dataclass
+class RouteStats:
+    """The calls of one agent & call type, by tier."""
+
+    calls: int = 0
+    escalations: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    latency_seconds: float = 0.0
+
+
+class ModelRouter:
+    """
+    Routes the model calls of each agent to a model tier, by agent and by call type, so that a small model
+    serves the light calls (speaker selection, handoffs, tool arguments) and a larger one only the calls that need it.
+
+    The call types are:
+    - "tool_call": the agent has tools, and decides whether to call them (and with which arguments).
+    - "handoff": the agent's only tools are handoffs to other agents.
+    - "tool_result": the agent replies from the results of its tool calls.
+    - "json": the reply must be a JSON object.
+    - "reply": any other reply.
+
+    A route is "<agent>:<call_type>", "<agent>" or "*:<call_type>", and the most specific route wins;
+    calls without a route go to the default tier. The `MODEL_ROUTES` environment variable adds to (or overrides) the routes,
+    e.g. "report_writer=large,*:handoff=small".
+
+    Every result is validated: a reply that is empty, JSON that doesn't parse, a call to an unknown tool or with malformed
+    arguments, or a reply that the agent's validator rejects is escalated to the next tier. A streamed reply that was already
+    shown can't be taken back, so then (or when the caller drops the stream, e.g. after finding the streamed JSON malformed)
+    the agent's next call is escalated instead, e.g. its repair.
+
+    Args:
+        tiers (Sequence[Tuple[str, ChatCompletionClient]]): The (tier, client) pairs, from the cheapest to the largest.
+        routes (Mapping[str, str]): The tier of each route.
+        default_tier (str, optional): The tier of the calls without a route. Defaults to the cheapest.
+        validators (Mapping[str, Callable[[CreateResult], bool]]): Extra checks of the results of each agent.
+            A validator that raises rejects the result.
+    """
+
+    def __init__(
+        self,
+        tiers: Sequence[Tuple[str, ChatCompletionClient]],
+        routes: Mapping[str, str] = {},
+        default_tier: Optional[str] = None,
+        validators: Mapping[str, Callable[[CreateResult], bool]] = {},
+    ):
+        if not tiers:
+            raise ValueError("At least one model tier is required.")
+        self.tier_names = [name for name, _ in tiers]
+        self.clients = dict(tiers)
+        self.routes = {**routes, **parse_routes(os.getenv("MODEL_ROUTES", ""))}
+        for route, tier in self.routes.items():
+            if tier not in self.clients:
+                raise ValueError(f"Unknown model tier '{tier}' for route '{route}' (tiers: {', '.join(self.tier_names)}).")
+        self.default_tier = default_tier or self.tier_names[0]
+        self.validators = dict(validators)
+        self.tier_stats = {name: TierStats() for name in self.tier_names}
+        self.route_stats: Dict[str, RouteStats] = {}
+        self._closed = False
+
+    @classmethod
+    def from_env(cls, make_client: Callable[[str], ChatCompletionClient], **kwargs: Any) -> "ModelRouter":
+        """A router over the tiers of the `MODEL_TIERS` environment variable, with a client made for each model."""
+        return cls([(tier, make_client(model)) for tier, model in model_tiers()], **kwargs)
+
+    def client(self, agent: str) -> "RoutedChatCompletionClient":
+        """The model client of an agent (or of a group chat's speaker selection, e.g. "selector")."""
+        return RoutedChatCompletionClient(self, agent)
+
+    def tier_for(self, agent: str, call_type: str) -> str:
+        for route in (f"{agent}:{call_type}", agent, f"*:{call_type}"):
+            if route in self.routes:
+                return self.routes[route]
+        return self.default_tier
+
+    def next_tier(self, tier: str) -> Optional[str]:
+        index = self.tier_names.index(tier)
+        return self.tier_names[index + 1] if index + 1 < len(self.tier_names) else None
+
+    def validate(self, agent: str, result: CreateResult, tools: Sequence[Tool | ToolSchema], json_output: Optional[bool]) -> bool:
+        """Whether a result is usable, or should be escalated to a larger model."""
+        try:
+            if isinstance(result.content, str):
+                if not result.content.strip():
+                    return False
+                if json_output:
+                    json.loads(result.content)
+            else:
+                names = {tool.name if isinstance(tool, Tool) else tool["name"] for tool in tools}
+                for call in result.content:
+                    if call.name not in names or not isinstance(json.loads(call.arguments or "{}"), dict):
+                        return False
+            validator = self.validators.get(agent)
+            return validator is None or bool(validator(result))
+        except Exception:
+            return False
+
+    def record(self, agent: str, call_type: str, tier: str, result: Optional[CreateResult], latency: float, escalated: bool) -> None:
+        tier_stats = self.tier_stats[tier]
+        route_stats = self.route_stats.setdefault(f"{agent}:{call_type}:{tier}", RouteStats())
+        tier_stats.calls += 1
+        tier_stats.latency_seconds += latency
+        tier_stats.max_latency_seconds = max(tier_stats.max_latency_seconds, latency)
+        route_stats.calls += 1
+        route_stats.latency_seconds += latency
+        if escalated:
+            tier_stats.escalated_calls += 1
+            route_stats.escalations += 1
+        if result is not None:
+            tier_stats.prompt_tokens += result.usage.prompt_tokens
+            tier_stats.completion_tokens += result.usage.completion_tokens
+            route_stats.prompt_tokens += result.usage.prompt_tokens
+            route_stats.completion_tokens += result.usage.completion_tokens
+
+    def report(self) -> str:
+        lines = ["Model tiers:"]
+        for name in self.tier_names:
+            stats = self.tier_stats[name]
+            lines.append(
+                f"- {name}: {stats.calls} call(s), {stats.prompt_tokens} prompt & {stats.completion_tokens} completion tokens, "
+                f"{stats.mean_latency_seconds:.2f} s mean latency (max {stats.max_latency_seconds:.2f} s), "
+                f"{stats.failed_validations} failed validation(s), {stats.escalated_calls} escalated call(s)"
+            )
+        return "\n".join(lines)
+
+    def export(self, path: Optional[str] = None) -> str:
+        """
+        Append the statistics of the run, per tier and per route ("<agent>:<call_type>:<tier>"), to a JSON Lines file,
+        to tune the routes over several runs.
+
+        Args:
+            path (str, optional): The file. Defaults to the `MODEL_ROUTER_STATS` environment variable, or "model_router_stats.jsonl".
+
+        Returns:
+            str: The path of the file.
+        """
+        path = path or os.getenv("MODEL_ROUTER_STATS", "model_router_stats.jsonl")
+        record = {
+            "time": time.time(),
+            "routes_config": self.routes,
+            "tiers": {name: {**asdict(stats), "mean_latency_seconds": stats.mean_latency_seconds} for name, stats in self.tier_stats.items()},
+            "routes": {route: asdict(stats) for route, stats in self.route_stats.items()},
+        }
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+        return path
+
+    async def close(self) -> None:
+        if not self._closed:
+            self._closed = True
+            for client in self.clients.values():
+                await client.close()
+
+
+def call_type(messages: Sequence[LLMMessage], tools: Sequence[Tool | ToolSchema], json_output: Optional[bool]) -> str:
+    """The type of a model call (see `ModelRouter`)."""
+    if json_output:
+        return "json"
+    if messages and isinstance(messages[-1], FunctionExecutionResultMessage):
+        return "tool_result"
+    names = [tool.name if isinstance(tool, Tool) else tool["name"] for tool in tools]
+    if names:
+        return "handoff" if all(name.startswith(HANDOFF_PREFIX) for name in names) else "tool_call"
+    return "reply"
+
+
+class RoutedChatCompletionClient(ChatCompletionClient):
+    """
+    The model client of one agent, which sends each call to the tier its route maps to (see `ModelRouter`).
+
+    Args:
+        router (ModelRouter): The router.
+        agent (str): The name of the agent.
+    """
+
+    def __init__(self, router: ModelRouter, agent: str):
+        self.router = router
+        self.agent = agent
+        self._escalate_next = False
+
+    def _first_tier(self, kind: str) -> str:
+        tier = self.router.tier_for(self.agent, kind)
+        if self._escalate_next:
+            self._escalate_next = False
+            tier = self.router.next_tier(tier) or tier
+        return tier
+
+    async def create(
+        self,
+        messages: Sequence[LLMMessage],
+        *,
+        tools: Sequence[Tool | ToolSchema] = [],
+        json_output: Optional[bool] = None,
+        extra_create_args: Mapping[str, Any] = {},
+        cancellation_token: Optional[CancellationToken] = None,
+    ) -> CreateResult:
+        kind = call_type(messages, tools, json_output)
+        tier: Optional[str] = self._first_tier(kind)
+        escalated = False
+        while True:
+            started = time.monotonic()
+            result = await self.router.clients[tier].create(
+                messages,
+                tools=tools,
+                json_output=json_output,
+                extra_create_args=extra_create_args,
+                cancellation_token=cancellation_token,
+            )
+            self.router.record(self.agent, kind, tier, result, time.monotonic() - started, escalated)
+            if self.router.validate(self.agent, result, tools, json_output):
+                return result
+            self.router.tier_stats[tier].failed_validations += 1
+            tier, escalated = self.router.next_tier(tier), True
+            if tier is None:
+                # The largest model's result is used as it is.
+                return result
+
+    async def create_stream(
+        self,
+        messages: Sequence[LLMMessage],
+        *,
+        tools: Sequence[Tool | ToolSchema] = [],
+        json_output: Optional[bool] = None,
+        extra_create_args: Mapping[str, Any] = {},
+        cancellation_token: Optional[CancellationToken] = None,
+    ) -> AsyncGenerator[Union[str, CreateResult], None]:
+        kind = call_type(messages, tools, json_output)
+        tier: Optional[str] = self._first_tier(kind)
+        escalated = False
+        while True:
+            started = time.monotonic()
+            streamed = False
+            result: Optional[CreateResult] = None
+            stream = self.router.clients[tier].create_stream(
+                messages,
+                tools=tools,
+                json_output=json_output,
+                extra_create_args=extra_create_args,
+                cancellation_token=cancellation_token,
+            )
+            try:
+                async for chunk in stream:
+                    if isinstance(chunk, CreateResult):
+                        result = chunk
+                    else:
+                        streamed = True
+                        yield chunk
+            except GeneratorExit:
+                # The caller dropped the reply while it streamed: its retry goes to a larger model.
+                self._escalate_next = True
+                raise
+            finally:
+                await stream.aclose()
+                self.router.record(self.agent, kind, tier, result, time.monotonic() - started, escalated)
+
+            if result is None:
+                return
+            if self.router.validate(self.agent, result, tools, json_output):
+                yield result
+                return
+            self.router.tier_stats[tier].failed_validations += 1
+            next_tier = self.router.next_tier(tier)
+            if streamed or next_tier is None:
+                # The chunks were already shown, so the result can't be replaced: escalate the agent's next call.
+                self._escalate_next = next_tier is not None
+                yield result
+                return
+            tier, escalated = next_tier, True
+
+    def count_tokens(self, messages: Sequence[LLMMessage], *, tools: Sequence[Tool | ToolSchema] = []) -> int:
+        return self.router.clients[self.router.default_tier].count_tokens(messages, tools=tools)
+
+    def remaining_tokens(self, messages: Sequence[LLMMessage], *, tools: Sequence[Tool | ToolSchema] = []) -> int:
+        return self.router.clients[self.router.default_tier].remaining_tokens(messages, tools=tools)
+
+    async def close(self) -> None:
+        await self.router.close()
+
+    def actual_usage(self) -> RequestUsage:
+        usages = [client.actual_usage() for client in self.router.clients.values()]
+        return RequestUsage(prompt_tokens=sum(u.prompt_tokens for u in usages), completion_tokens=sum(u.completion_tokens for u in usages))
+
+    def total_usage(self) -> RequestUsage:
+        usages = [client.total_usage() for client in self.router.clients.values()]
+        return RequestUsage(prompt_tokens=sum(u.prompt_tokens for u in usages), completion_tokens=sum(u.completion_tokens for u in usages))
+
+    @property
+    def capabilities(self) -> ModelCapabilities:  # type: ignore
+        warnings.warn("capabilities is deprecated, use model_info instead", DeprecationWarning, stacklevel=2)
+        return self.router.clients[self.router.default_tier].capabilities
+
+    @property
+    def model_info(self) -> ModelInfo:
+        return self.router.clients[self.router.default_tier].model_info
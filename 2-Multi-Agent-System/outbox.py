@@ -0,0 +1,192 @@
+import os
+import json
+import time
+import random
+import sqlite3
+import asyncio
+import hashlib
+import contextlib
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import aiohttp
+
+
+TYPEFULLY_DRAFTS_URL = "https://api.typefully.com/v1/drafts/"
+
+
+class TypefullyOutbox:
+    """
+    A durable local outbox for Typefully drafts.
+
+    Tools only `enqueue()` a draft, which is a single local SQLite write, and return immediately.
+    The `dispatch_forever()` coroutine delivers the queued drafts in the background, over a pooled
+    HTTP session, retrying failures with exponential backoff. Its SQLite calls run on worker threads,
+    so they never block the event loop.
+
+    Each draft is keyed by a hash of its payload, so enqueuing the same plan twice (e.g. when an agent
+    retries a tool call) queues it only once, and the key is sent as the `Idempotency-Key` of the request.
+
+    Args:
+        path (str): The path of the SQLite database that holds the outbox.
+        api_url (str): The Typefully drafts endpoint.
+        max_attempts (int): Attempts after which a draft is marked as failed.
+        base_delay (float): The delay in seconds before the first retry; it doubles with each attempt.
+        max_concurrency (int): The maximum number of drafts delivered at once.
+        timeout (float): The timeout in seconds of each delivery request.
+        lease (float): Seconds after which a draft stuck in "sending" (e.g. after a crash) is retried.
+    """
+
+    def __init__(
+        self,
+        path: str = "typefully_outbox.sqlite3",
+        api_url: str = TYPEFULLY_DRAFTS_URL,
+        max_attempts: int = 5,
+        base_delay: float = 2,
+        max_concurrency: int = 4,
+        timeout: float = 30,
+        lease: float = 300,
+    ):
+        self.path = path
+        self.api_url = api_url
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.lease = lease
+        with self._connect() as conn:
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS drafts (
+                    idempotency_key TEXT PRIMARY KEY,
+                    payload TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    next_attempt_at REAL NOT NULL,
+                    lease_until REAL,
+                    response TEXT,
+                    last_error TEXT,
+                    created_at REAL NOT NULL
+                )"""
+            )
+
+    @contextlib.contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # One connection per operation: its transaction is committed (or rolled back on error), then it is closed.
+        with contextlib.closing(sqlite3.connect(self.path, timeout=30)) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            with conn:
+                yield conn
+
+    def enqueue(self, payload: Dict[str, Any]) -> Tuple[str, bool]:
+        """
+        Queue a draft for delivery.
+
+        Args:
+            payload (Dict[str, Any]): The request body of the Typefully draft.
+
+        Returns:
+            Tuple[str, bool]: The idempotency key of the draft, and whether it was newly queued.
+        """
+        body = json.dumps(payload, sort_keys=True)
+        key = hashlib.sha256(body.encode("utf-8")).hexdigest()
+        now = time.time()
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO drafts (idempotency_key, payload, next_attempt_at, created_at) VALUES (?, ?, ?, ?)",
+                (key, body, now, now),
+            )
+            queued = cursor.rowcount == 1
+        return key, queued
+
+    def status(self, key: str) -> Optional[Dict[str, Any]]:
+        """Get the delivery status of a draft, or None if it was never queued."""
+        with self._connect() as conn:
+            conn.row_factory = sqlite3.Row
+            row = conn.execute("SELECT * FROM drafts WHERE idempotency_key = ?", (key,)).fetchone()
+        return dict(row) if row is not None else None
+
+    def pending_count(self) -> int:
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM drafts WHERE status IN ('pending', 'sending')").fetchone()[0]
+
+    def _claim_due(self, limit: int) -> List[Tuple[str, str, int]]:
+        # A draft is claimed by moving it to "sending" in the same statement that checks its status,
+        # so two dispatchers (or two processes) can never send the same draft at the same time.
+        now = time.time()
+        claimed = []
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT idempotency_key, payload, attempts FROM drafts "
+                "WHERE (status = 'pending' AND next_attempt_at <= ?) OR (status = 'sending' AND lease_until < ?) "
+                "ORDER BY created_at LIMIT ?",
+                (now, now, limit),
+            ).fetchall()
+            for key, payload, attempts in rows:
+                cursor = conn.execute(
+                    "UPDATE drafts SET status = 'sending', lease_until = ? "
+                    "WHERE idempotency_key = ? AND (status = 'pending' OR (status = 'sending' AND lease_until < ?))",
+                    (now + self.lease, key, now),
+                )
+                if cursor.rowcount == 1:
+                    claimed.append((key, payload, attempts))
+        return claimed
+
+    def _mark_sent(self, key: str, response: str) -> None:
+        with self._connect() as conn:
+            conn.execute("UPDATE drafts SET status = 'sent', response = ?, lease_until = NULL WHERE idempotency_key = ?", (response, key))
+
+    def _mark_failed_attempt(self, key: str, attempts: int, error: str, retryable: bool) -> None:
+        attempts += 1
+        if retryable and attempts < self.max_attempts:
+            # Exponential backoff with jitter, so retries of many drafts don't arrive in lockstep.
+            delay = self.base_delay * (2 ** (attempts - 1)) * (1 + random.random())
+            status, next_attempt_at = "pending", time.time() + delay
+        else:
+            status, next_attempt_at = "failed", time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE drafts SET status = ?, attempts = ?, next_attempt_at = ?, last_error = ?, lease_until = NULL WHERE idempotency_key = ?",
+                (status, attempts, next_attempt_at, error, key),
+            )
+
+    async def _deliver(self, session: aiohttp.ClientSession, key: str, payload: str, attempts: int) -> None:
+        headers = {
+            "X-API-KEY": f"Bearer {os.getenv('TYPEFULLY_API_KEY')}",
+            "Content-Type": "application/json",
+            "Idempotency-Key": key,
+        }
+        try:
+            async with session.post(self.api_url, data=payload, headers=headers) as response:
+                text = await response.text()
+                if response.status < 300:
+                    await asyncio.to_thread(self._mark_sent, key, text)
+                else:
+                    # Client errors won't succeed on a retry, except for timeouts and rate limits.
+                    retryable = response.status >= 500 or response.status in (408, 429)
+                    await asyncio.to_thread(self._mark_failed_attempt, key, attempts, f"{response.status} - {text}", retryable)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            await asyncio.to_thread(self._mark_failed_attempt, key, attempts, repr(e), True)
+
+    async def dispatch_forever(self, poll_interval: float = 1) -> None:
+        """Deliver queued drafts until cancelled."""
+        connector = aiohttp.TCPConnector(limit=self.max_concurrency)
+        async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=self.timeout)) as session:
+            while True:
+                claimed = await asyncio.to_thread(self._claim_due, self.max_concurrency)
+                if claimed:
+                    await asyncio.gather(*(self._deliver(session, *draft) for draft in claimed))
+                else:
+                    await asyncio.sleep(poll_interval)
+
+    async def drain(self, timeout: float = 60, poll_interval: float = 0.5) -> bool:
+        """
+        Wait until no drafts are waiting for delivery (while a dispatcher runs).
+
+        Returns:
+            bool: True if the outbox was drained before the timeout.
+        """
+        deadline = time.monotonic() + timeout
+        while await asyncio.to_thread(self.pending_count) > 0:
+            if time.monotonic() >= deadline:
+                return False
+            await asyncio.sleep(poll_interval)
+        return True
@@ -0,0 +1,151 @@
+import time
+import asyncio
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Iterable, List, Optional
+
+
+# Marks the end of the input of a stage.
+_DONE = object()
+
+
+@dataclass
+class StageMetrics:
+    """Throughput & backpressure metrics of a pipeline stage."""
+
+    name: str
+    workers: int
+    items: int = 0
+    errors: int = 0
+    busy_seconds: float = 0.0
+    # Time the workers spent waiting for room in the next stage's queue, i.e. how much the next stage held this one back.
+    blocked_seconds: float = 0.0
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+    @property
+    def elapsed_seconds(self) -> float:
+        if self.started_at is None:
+            return 0.0
+        return (self.finished_at or time.monotonic()) - self.started_at
+
+    @property
+    def throughput(self) -> float:
+        """Items completed per minute."""
+        return 60 * self.items / self.elapsed_seconds if self.elapsed_seconds else 0.0
+
+    @property
+    def utilization(self) -> float:
+        """Fraction of the workers' time spent processing items."""
+        return self.busy_seconds / (self.elapsed_seconds * self.workers) if self.elapsed_seconds else 0.0
+
+
+@dataclass
+class PipelineItem:
+    """An input item as it flows through the pipeline, with the result of the last stage it completed."""
+
+    index: int
+    input: Any
+    value: Any = None
+    error: Optional[str] = None
+    failed_stage: Optional[str] = None
+    timings: dict = field(default_factory=dict)
+
+
+class Stage:
+    """
+    A pipeline stage: a pool of workers that each process one item at a time.
+
+    Args:
+        name (str): The name of the stage, used in the metrics.
+        make_handler (Callable): Called once per worker, and returns that worker's handler.
+            The handler takes the output of the previous stage (or the input item, for the first stage)
+            and returns the output of this stage. Use it to give each worker its own agents.
+        workers (int): The number of workers.
+    """
+
+    def __init__(self, name: str, make_handler: Callable[[], Callable[[Any], Awaitable[Any]]], workers: int = 1):
+        self.name = name
+        self.make_handler = make_handler
+        self.workers = workers
+        self.metrics = StageMetrics(name=name, workers=workers)
+
+
+class Pipeline:
+    """
+    Runs items through a sequence of stages joined by bounded queues.
+
+    All stages work at the same time, each on a different item, so a batch finishes in roughly the
+    time of the slowest stage rather than the sum of all stages. When a stage falls behind, its
+    input queue fills up and the stage before it blocks (backpressure), so no stage runs ahead unboundedly.
+
+    Args:
+        stages (List[Stage]): The stages, in order.
+        queue_size (int): The capacity of the queue in front of each stage.
+    """
+
+    def __init__(self, stages: List[Stage], queue_size: int = 4):
+        self.stages = stages
+        self.queue_size = queue_size
+
+    async def run(self, inputs: Iterable[Any]) -> List[PipelineItem]:
+        """
+        Run the inputs through all stages.
+
+        Returns:
+            List[PipelineItem]: One item per input, in input order, with either the output of the last stage or the error.
+        """
+        queues = [asyncio.Queue(maxsize=self.queue_size) for _ in self.stages]
+        items: List[PipelineItem] = []
+
+        async def feed() -> None:
+            for index, value in enumerate(inputs):
+                item = PipelineItem(index=index, input=value, value=value)
+                items.append(item)
+                await queues[0].put(item)
+            for _ in range(self.stages[0].workers):
+                await queues[0].put(_DONE)
+
+        async def work(position: int, stage: Stage) -> None:
+            handler = stage.make_handler()
+            next_queue = queues[position + 1] if position + 1 < len(queues) else None
+            while True:
+                item = await queues[position].get()
+                if item is _DONE:
+                    return
+                if stage.metrics.started_at is None:
+                    stage.metrics.started_at = time.monotonic()
+
+                started = time.monotonic()
+                try:
+                    item.value = await handler(item.value)
+                    stage.metrics.items += 1
+                except Exception as e:
+                    item.error, item.failed_stage = f"{type(e).__name__}: {e}", stage.name
+                    stage.metrics.errors += 1
+                finished = time.monotonic()
+                stage.metrics.busy_seconds += finished - started
+                item.timings[stage.name] = finished - started
+
+                if next_queue is not None and item.error is None:
+                    await next_queue.put(item)
+                    stage.metrics.blocked_seconds += time.monotonic() - finished
+
+        async def run_stage(position: int, stage: Stage) -> None:
+            await asyncio.gather(*(work(position, stage) for _ in range(stage.workers)))
+            stage.metrics.finished_at = time.monotonic()
+            if position + 1 < len(self.stages):
+                for _ in range(self.stages[position + 1].workers):
+                    await queues[position + 1].put(_DONE)
+
+        await asyncio.gather(feed(), *(run_stage(position, stage) for position, stage in enumerate(self.stages)))
+        return items
+
+    def report(self) -> str:
+        """A table of the per-stage metrics."""
+        lines = [f"{'stage':<20}{'workers':>8}{'items':>8}{'errors':>8}{'items/min':>11}{'busy %':>8}{'blocked s':>11}"]
+        for stage in self.stages:
+            m = stage.metrics
+            lines.append(
+                f"{m.name:<20}{m.workers:>8}{m.items:>8}{m.errors:>8}{m.throughput:>11.1f}{100 * m.utilization:>8.0f}{m.blocked_seconds:>11.1f}"
+            )
+        return "\n".join(lines)
@@ -0,0 +1,212 @@
+import re
+import warnings
+from dataclasses import dataclass
+from typing import Any, AsyncGenerator, List, Mapping, Optional, Sequence, Union
+
+from autogen_agentchat.messages import AgentEvent, BaseAgentEvent, ChatMessage
+from autogen_core import CancellationToken
+from autogen_core.models import ChatCompletionClient, CreateResult, LLMMessage, ModelCapabilities, ModelInfo, RequestUsage, SystemMessage, UserMessage
+from autogen_core.tools import Tool, ToolSchema
+
+
+# Matches the planner's task assignments, e.g. "1. senior_software_architect : Design the architecture".
+ASSIGNMENT_PATTERN = re.compile(r"^\s*\d+\.\s*[*`]*\s*([A-Za-z_][\w]*)\s*[*`]*\s*:", re.MULTILINE)
+
+# Rough number of characters per token, to estimate the prompts that were never sent.
+CHARS_PER_TOKEN = 4
+
+
+@dataclass
+class SelectorStats:
+    """How the speakers of a run were selected, and what the rules saved."""
+
+    rule_turns: int = 0
+    model_turns: int = 0
+    model_calls: int = 0
+    model_prompt_tokens: int = 0
+    model_completion_tokens: int = 0
+    # Estimated prompt tokens of the model calls that the rules made unnecessary.
+    saved_prompt_tokens: int = 0
+
+    def report(self) -> str:
+        return (
+            f"Speaker selection: {self.rule_turns} turn(s) by rules, {self.model_turns} by the model "
+            f"({self.model_calls} model call(s), {self.model_prompt_tokens} prompt & {self.model_completion_tokens} completion tokens).\n"
+            f"Saved: at least {self.rule_turns} selector call(s) and ~{self.saved_prompt_tokens} prompt tokens."
+        )
+
+
+class PlanFollowingSelector:
+    """
+    A `selector_func` for `SelectorGroupChat` that picks the next speaker with cheap, deterministic rules:
+
+    1. The planner speaks first.
+    2. Then, the agents assigned in the planner's latest plan ("1. <agent> : <task>") speak in the order of the plan.
+    3. Once all of them have spoken, the finisher (e.g. the report writer) speaks.
+    4. The same agent never speaks twice in a row.
+
+    When none of the rules applies (e.g. the plan can't be parsed), it returns None,
+    and the group chat falls back to asking the model.
+
+    Args:
+        participants (Sequence[str]): The names of the agents in the group chat.
+        planner (str): The name of the planning agent.
+        finisher (str): The name of the agent that speaks last.
+    """
+
+    def __init__(self, participants: Sequence[str], planner: str = "planning_agent", finisher: str = "report_writer"):
+        self.participants = list(participants)
+        self.planner = planner
+        self.finisher = finisher
+        self.stats = SelectorStats()
+
+    def __call__(self, thread: Sequence[AgentEvent | ChatMessage]) -> Optional[str]:
+        messages = [message for message in thread if not isinstance(message, BaseAgentEvent)]
+        speaker = self.select(messages)
+        if speaker is None:
+            self.stats.model_turns += 1
+        else:
+            self.stats.rule_turns += 1
+            self.stats.saved_prompt_tokens += sum(len(str(message.content)) for message in messages) // CHARS_PER_TOKEN
+        return speaker
+
+    def select(self, messages: List[ChatMessage]) -> Optional[str]:
+        last_speaker = messages[-1].source if messages else None
+        plan_index = next((i for i in range(len(messages) - 1, -1, -1) if messages[i].source == self.planner), None)
+        if plan_index is None:
+            return self.planner if last_speaker != self.planner else None
+
+        plan = messages[plan_index].content if isinstance(messages[plan_index].content, str) else ""
+        assignments = []
+        for name in ASSIGNMENT_PATTERN.findall(plan):
+            if name in self.participants and name not in (self.planner, self.finisher) and name not in assignments:
+                assignments.append(name)
+        if not assignments:
+            return None
+
+        spoken = {message.source for message in messages[plan_index + 1:]}
+        for name in assignments:
+            if name not in spoken:
+                return name if name != last_speaker else None
+        if self.finisher not in spoken and self.finisher != last_speaker:
+            return self.finisher
+        return None
+
+
+class SelectorModelClient(ChatCompletionClient):
+    """
+    Wraps the model client of the selector: counts its calls & tokens, and only sends
+    a window of the conversation history instead of the whole of it.
+
+    The history is found between `history_start` and `history_end` in the selector prompt.
+    The first message (the task) is always kept, followed by as many of the latest messages as fit in `max_history_chars`.
+
+    Args:
+        client (ChatCompletionClient): The model client to wrap.
+        stats (SelectorStats): The stats to record the calls in.
+        max_history_chars (int): The size of the history window, in characters.
+        history_start (str): The text right before the history in the selector prompt.
+        history_end (str): The text right after the history in the selector prompt.
+    """
+
+    def __init__(
+        self,
+        client: ChatCompletionClient,
+        stats: SelectorStats,
+        max_history_chars: int = 8000,
+        history_start: str = "Current conversation context:\n",
+        history_end: str = "\nRead the above conversation",
+    ):
+        self.client = client
+        self.stats = stats
+        self.max_history_chars = max_history_chars
+        self.history_start = history_start
+        self.history_end = history_end
+
+    def truncate_history(self, prompt: str) -> str:
+        start = prompt.find(self.history_start)
+        end = prompt.find(self.history_end, start + 1)
+        if start < 0 or end < 0:
+            return prompt
+        start += len(self.history_start)
+
+        # The selector separates the messages in the history with blank lines.
+        entries = prompt[start:end].strip().split("\n\n\n")
+        kept: List[str] = []
+        size = len(entries[0])
+        for entry in reversed(entries[1:]):
+            if size + len(entry) > self.max_history_chars:
+                break
+            kept.insert(0, entry)
+            size += len(entry)
+        omitted = len(entries) - 1 - len(kept)
+        window = [entries[0]] + ([f"[... {omitted} earlier message(s) omitted ...]"] if omitted else []) + kept
+        return prompt[:start] + "\n\n\n".join(window) + "\n\n" + prompt[end:]
+
+    async def create(
+        self,
+        messages: Sequence[LLMMessage],
+        *,
+        tools: Sequence[Tool | ToolSchema] = [],
+        json_output: Optional[bool] = None,
+        extra_create_args: Mapping[str, Any] = {},
+        cancellation_token: Optional[CancellationToken] = None,
+    ) -> CreateResult:
+        messages = [
+            message.model_copy(update={"content": self.truncate_history(message.content)})
+            if isinstance(message, (SystemMessage, UserMessage)) and isinstance(message.content, str)
+            else message
+            for message in messages
+        ]
+        result = await self.client.create(
+            messages,
+            tools=tools,
+            json_output=json_output,
+            extra_create_args=extra_create_args,
+            cancellation_token=cancellation_token,
+        )
+        self.stats.model_calls += 1
+        self.stats.model_prompt_tokens += result.usage.prompt_tokens
+        self.stats.model_completion_tokens += result.usage.completion_tokens
+        return result
+
+    def create_stream(
+        self,
+        messages: Sequence[LLMMessage],
+        *,
+        tools: Sequence[Tool | ToolSchema] = [],
+        json_output: Optional[bool] = None,
+        extra_create_args: Mapping[str, Any] = {},
+        cancellation_token: Optional[CancellationToken] = None,
+    ) -> AsyncGenerator[Union[str, CreateResult], None]:
+        return self.client.create_stream(
+            messages,
+            tools=tools,
+            json_output=json_output,
+            extra_create_args=extra_create_args,
+            cancellation_token=cancellation_token,
+        )
+
+    async def close(self) -> None:
+        await self.client.close()
+
+    def actual_usage(self) -> RequestUsage:
+        return self.client.actual_usage()
+
+    def total_usage(self) -> RequestUsage:
+        return self.client.total_usage()
+
+    def count_tokens(self, messages: Sequence[LLMMessage], *, tools: Sequence[Tool | ToolSchema] = []) -> int:
+        return self.client.count_tokens(messages, tools=tools)
+
+    def remaining_tokens(self, messages: Sequence[LLMMessage], *, tools: Sequence[Tool | ToolSchema] = []) -> int:
+        return self.client.remaining_tokens(messages, tools=tools)
+
+    @property
+    def capabilities(self) -> ModelCapabilities:  # type: ignore
+        warnings.warn("capabilities is deprecated, use model_info instead", DeprecationWarning, stacklevel=2)
+        return self.client.capabilities
+
+    @property
+    def model_info(self) -> ModelInfo:
+        return self.client.model_info
@@ -0,0 +1,87 @@
+import time
+import asyncio
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Generic, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+@dataclass
+class SpeculationStats:
+    """What the speculative work cost, and what it saved."""
+
+    started: bool = False
+    finished: bool = False
+    kept: bool = False
+    # The time the work ran before its result was needed, and the time it was then waited for.
+    ahead_seconds: float = 0.0
+    waited_seconds: float = 0.0
+    error: str = ""
+
+    def report(self) -> str:
+        if not self.started:
+            return "Speculation: not started."
+        if self.error:
+            return f"Speculation: failed ({self.error})."
+        outcome = "kept" if self.kept else "discarded"
+        return (
+            f"Speculation: {outcome}, after running {self.ahead_seconds:.1f} s ahead of time "
+            f"(then waited for {self.waited_seconds:.1f} s)."
+            + (f" Time saved: ~{self.ahead_seconds:.1f} s." if self.kept else "")
+        )
+
+
+class Speculation(Generic[T]):
+    """
+    Runs work ahead of time on a guess, while waiting on something slower (e.g. the user's answers),
+    and keeps its result only if the guess turns out to hold.
+
+    Args:
+        work (Callable[[], Awaitable[T]]): The speculative work.
+    """
+
+    def __init__(self, work: Callable[[], Awaitable[T]]):
+        self.work = work
+        self.stats = SpeculationStats()
+        self._task: Optional[asyncio.Task] = None
+        self._started_at = 0.0
+        self._finished_at = 0.0
+
+    def start(self) -> None:
+        """Start the work in the background (only the first call does)."""
+        if self._task is None:
+            self._started_at = time.monotonic()
+            self._task = asyncio.create_task(self.work())
+            self._task.add_done_callback(lambda _: setattr(self, "_finished_at", time.monotonic()))
+            self.stats.started = True
+
+    async def resolve(self, keep: Callable[[T], Awaitable[bool]]) -> Optional[T]:
+        """
+        Wait for the work (if it was started), and check whether its result still holds.
+
+        Args:
+            keep (Callable[[T], Awaitable[bool]]): Whether to keep the result, now that the guess can be checked.
+
+        Returns:
+            Optional[T]: The result, or None if it wasn't started, failed, or was discarded.
+        """
+        if self._task is None:
+            return None
+        resolving = time.monotonic()
+        try:
+            result = await self._task
+        except Exception as e:
+            self.stats.error = f"{type(e).__name__}: {e}"
+            return None
+        finally:
+            self.stats.waited_seconds = time.monotonic() - resolving
+            self.stats.ahead_seconds = min(resolving, self._finished_at or resolving) - self._started_at
+        self.stats.finished = True
+        self.stats.kept = bool(await keep(result))
+        return result if self.stats.kept else None
+
+    async def cancel(self) -> None:
+        """Cancel the work, if it is still running."""
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
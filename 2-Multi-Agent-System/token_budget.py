@@ -0,0 +1,245 @@
+import os
+import inspect
+import functools
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional, Sequence
+
+from autogen_agentchat.base import TerminationCondition
+from autogen_agentchat.messages import AgentEvent, ChatMessage, StopMessage
+from autogen_core.models import ChatCompletionClient, RequestUsage, SystemMessage, UserMessage
+
+
+# Prices in USD per million tokens (gpt-4o-mini by default), to estimate the cost of a run.
+PROMPT_PRICE_PER_MILLION = float(os.getenv("PROMPT_PRICE_PER_MILLION", "0.15"))
+COMPLETION_PRICE_PER_MILLION = float(os.getenv("COMPLETION_PRICE_PER_MILLION", "0.60"))
+
+
+@dataclass
+class AgentUsage:
+    """The tokens used by one agent."""
+
+    calls: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+
+class TokenBudget:
+    """
+    The token & cost budget of a run, and what each agent has used of it.
+
+    Usage is recorded from the `models_usage` of the agents' messages (see `TokenBudgetTermination`).
+    As the budget runs out, the tools wrapped with `limit_output()` return shorter outputs,
+    and once it is exhausted, the run is stopped.
+
+    Args:
+        max_tokens (int, optional): The maximum prompt + completion tokens of the run.
+        max_cost (float, optional): The maximum cost of the run, in USD.
+        reserve (float): The fraction of the budget kept for a final summary: the run stops when only this is left.
+        tool_output_chars (int): The size of a tool output while the budget is plentiful, in characters.
+        min_tool_output_chars (int): The size of a tool output when the budget is nearly exhausted.
+        shrink_from (float): The fraction of the budget used from which tool outputs start to shrink.
+    """
+
+    def __init__(
+        self,
+        max_tokens: Optional[int] = None,
+        max_cost: Optional[float] = None,
+        reserve: float = 0.1,
+        tool_output_chars: int = 20000,
+        min_tool_output_chars: int = 2000,
+        shrink_from: float = 0.5,
+    ):
+        self.max_tokens = max_tokens
+        self.max_cost = max_cost
+        self.reserve = reserve
+        self.tool_output_chars = tool_output_chars
+        self.min_tool_output_chars = min_tool_output_chars
+        self.shrink_from = shrink_from
+        self.agents: Dict[str, AgentUsage] = {}
+        self.truncated_tool_chars = 0
+
+    @classmethod
+    def from_env(cls, max_tokens: Optional[int] = None, max_cost: Optional[float] = None, **kwargs: Any) -> "TokenBudget":
+        """A budget with the given defaults, overridden by the `TOKEN_BUDGET` & `COST_BUDGET` (USD) environment variables."""
+        if os.getenv("TOKEN_BUDGET"):
+            max_tokens = int(os.environ["TOKEN_BUDGET"]) or None
+        if os.getenv("COST_BUDGET"):
+            max_cost = float(os.environ["COST_BUDGET"]) or None
+        return cls(max_tokens=max_tokens, max_cost=max_cost, **kwargs)
+
+    def record(self, agent: str, usage: RequestUsage) -> None:
+        """Record the usage of a model call made by an agent."""
+        agent_usage = self.agents.setdefault(agent, AgentUsage())
+        agent_usage.calls += 1
+        agent_usage.prompt_tokens += usage.prompt_tokens
+        agent_usage.completion_tokens += usage.completion_tokens
+
+    def record_messages(self, messages: Sequence[AgentEvent | ChatMessage]) -> None:
+        """Record the usage of the model calls behind the messages of a run."""
+        for message in messages:
+            if message.models_usage is not None:
+                self.record(message.source, message.models_usage)
+
+    @property
+    def prompt_tokens(self) -> int:
+        return sum(usage.prompt_tokens for usage in self.agents.values())
+
+    @property
+    def completion_tokens(self) -> int:
+        return sum(usage.completion_tokens for usage in self.agents.values())
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+    @property
+    def cost(self) -> float:
+        return (self.prompt_tokens * PROMPT_PRICE_PER_MILLION + self.completion_tokens * COMPLETION_PRICE_PER_MILLION) / 1_000_000
+
+    @property
+    def used(self) -> float:
+        """The fraction of the budget used: the largest of the token & cost fractions."""
+        fractions = [0.0]
+        if self.max_tokens:
+            fractions.append(self.total_tokens / self.max_tokens)
+        if self.max_cost:
+            fractions.append(self.cost / self.max_cost)
+        return max(fractions)
+
+    @property
+    def exhausted(self) -> bool:
+        """Whether only the reserve is left."""
+        return self.used >= 1 - self.reserve
+
+    def tool_output_limit(self) -> int:
+        """
+        The number of characters a tool output may have now: the full size until `shrink_from` of the budget is used,
+        then shrinking linearly down to `min_tool_output_chars` when the budget (minus the reserve) is exhausted.
+        """
+        end = 1 - self.reserve
+        if self.used <= self.shrink_from or end <= self.shrink_from:
+            return self.tool_output_chars
+        left = max(0.0, (end - self.used) / (end - self.shrink_from))
+        return int(self.min_tool_output_chars + left * (self.tool_output_chars - self.min_tool_output_chars))
+
+    def truncate(self, output: str) -> str:
+        limit = self.tool_output_limit()
+        if len(output) <= limit:
+            return output
+        self.truncated_tool_chars += len(output) - limit
+        return output[:limit] + f"\n\n[Truncated to {limit} characters to stay within the token budget.]"
+
+    def limit_output(self, tool: Callable[..., Any]) -> Callable[..., Any]:
+        """
+        Wrap a tool function (sync or async) so its string output is truncated to `tool_output_limit()`.
+        The wrapper keeps the tool's name, signature & docstring, which the model sees.
+        """
+        if inspect.iscoroutinefunction(tool):
+
+            @functools.wraps(tool)
+            async def async_wrapper(*args: Any, **kwargs: Any) -> Any:
+                output = await tool(*args, **kwargs)
+                return self.truncate(output) if isinstance(output, str) else output
+
+            return async_wrapper
+
+        @functools.wraps(tool)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            output = tool(*args, **kwargs)
+            return self.truncate(output) if isinstance(output, str) else output
+
+        return wrapper
+
+    def report(self) -> str:
+        """A table of the usage per agent, and the totals against the budget."""
+        lines = [f"{'agent':<28}{'calls':>7}{'prompt':>10}{'completion':>12}{'total':>10}"]
+        for agent, usage in sorted(self.agents.items(), key=lambda item: item[1].total_tokens, reverse=True):
+            lines.append(f"{agent:<28}{usage.calls:>7}{usage.prompt_tokens:>10}{usage.completion_tokens:>12}{usage.total_tokens:>10}")
+        limits = []
+        if self.max_tokens:
+            limits.append(f"{self.max_tokens} tokens")
+        if self.max_cost:
+            limits.append(f"${self.max_cost:.4f}")
+        lines.append(
+            f"Total: {self.total_tokens} tokens, ~${self.cost:.4f}"
+            + (f" of a budget of {' / '.join(limits)} ({100 * self.used:.0f}% used)" if limits else "")
+            + (f". Tool outputs truncated by {self.truncated_tool_chars} characters." if self.truncated_tool_chars else ".")
+        )
+        return "\n".join(lines)
+
+
+class TokenBudgetTermination(TerminationCondition):
+    """
+    Terminate the conversation when the token or cost budget is exhausted (apart from its reserve),
+    recording each agent's usage in the budget as its messages come in.
+
+    Unlike the message-count conditions, resetting it doesn't reset the budget:
+    a budget shared by several teams (or runs) limits all of them together.
+
+    Args:
+        budget (TokenBudget): The budget to record the usage in & check.
+    """
+
+    def __init__(self, budget: TokenBudget):
+        self.budget = budget
+        self._terminated = False
+
+    @property
+    def terminated(self) -> bool:
+        return self._terminated
+
+    async def __call__(self, messages: Sequence[AgentEvent | ChatMessage]) -> StopMessage | None:
+        self.budget.record_messages(messages)
+        if self.budget.exhausted:
+            self._terminated = True
+            return StopMessage(
+                content=f"Token budget reached: {self.budget.total_tokens} tokens used (~${self.budget.cost:.4f}).",
+                source="TokenBudgetTermination",
+            )
+        return None
+
+    async def reset(self) -> None:
+        self._terminated = False
+
+
+def stopped_by_budget(stop_reason: Optional[str]) -> bool:
+    return bool(stop_reason) and "Token budget reached" in stop_reason
+
+
+async def summarize_run(
+    model_client: ChatCompletionClient,
+    task: str,
+    messages: Sequence[AgentEvent | ChatMessage],
+    budget: TokenBudget,
+    instruction: str = "Consolidate the work done so far into the best possible final answer to the task.",
+    max_chars: int = 24000,
+) -> str:
+    """
+    Make a single model call (paid from the budget's reserve) to turn a run that was cut short into a final answer.
+
+    Args:
+        model_client (ChatCompletionClient): The model client.
+        task (str): The task of the run.
+        messages: The messages of the run.
+        budget (TokenBudget): The budget, in which the call is recorded.
+        instruction (str): What to do with the work done so far.
+        max_chars (int): The size of the transcript sent, in characters (the latest messages are kept).
+
+    Returns:
+        str: The summary.
+    """
+    transcript = "\n\n".join(
+        f"[{message.source}]\n{message.content}" for message in messages if isinstance(message.content, str) and message.source != "user"
+    )
+    result = await model_client.create(
+        [
+            SystemMessage(content=f"The team working on the task below ran out of budget before finishing. {instruction} Do not mention the budget."),
+            UserMessage(content=f"Task:\n{task}\n\nWork done so far:\n{transcript[-max_chars:]}", source="user"),
+        ]
+    )
+    budget.record("budget_summary", result.usage)
+    return result.content if isinstance(result.content, str) else str(result.content)
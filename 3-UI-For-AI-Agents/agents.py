@@ -1,19 +1,31 @@
-from autogen_agentchat.agents import AssistantAgent
-from autogen_agentchat.conditions import TextMentionTermination, MaxMessageTermination
-from autogen_agentchat.teams import Swarm
-from autogen_ext.models.azure import AzureAIChatCompletionClient
-from azure.core.credentials import AzureKeyCredential
-
+from lazy_imports import lazy_from
+from session_store import SQLiteCacheStore
 from tools import *
 
-def create_agents_for_group_chat() -> Swarm:
+# The heavy dependencies are only imported when first used (see `preload` in app.py), so the app starts up quickly.
+# Equivalent to `from <module> import <name>`.
+AssistantAgent = lazy_from("autogen_agentchat.agents", "AssistantAgent")
+TextMentionTermination = lazy_from("autogen_agentchat.conditions", "TextMentionTermination")
+MaxMessageTermination = lazy_from("autogen_agentchat.conditions", "MaxMessageTermination")
+Swarm = lazy_from("autogen_agentchat.teams", "Swarm")
+AzureAIChatCompletionClient = lazy_from("autogen_ext.models.azure", "AzureAIChatCompletionClient")
+ChatCompletionCache = lazy_from("autogen_ext.models.cache", "ChatCompletionCache")
+AzureKeyCredential = lazy_from("azure.core.credentials", "AzureKeyCredential")
+PrefixCachingChatCompletionClient = lazy_from("prompt_cache", "PrefixCachingChatCompletionClient")
+
+# The model endpoint (MODEL_ENDPOINT points the agents to another one, e.g. the mock model of load_test.py).
+MODEL_ENDPOINT = os.getenv("MODEL_ENDPOINT", "https://models.inference.ai.azure.com")
+# Seconds for which model responses are cached in the shared store (LLM_CACHE_TTL). Off by default: a cached
+# response is replayed for any identical conversation, e.g. a user asking again for fresh campaign ideas.
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", "0"))
+
+def create_model_client() -> "ChatCompletionClient":
     """
-    Create a group chat with agents for the given task.
+    Create the model client of a turn's agents. The caller closes it once the turn is over.
     """
-    # Create the Client
     model_client = AzureAIChatCompletionClient(
         model="gpt-4o-mini",
-        endpoint="https://models.inference.ai.azure.com",
+        endpoint=MODEL_ENDPOINT,
         # To authenticate with the model you will need to generate a personal access token (PAT) in your GitHub settings.
         credential=AzureKeyCredential(os.getenv("GITHUB_TOKEN")),
         model_info={
@@ -24,6 +36,23 @@ def create_agents_for_group_chat() -> Swarm:
         },
     )
 
+    # The requests are sent unchanged; their static prefix is hashed (and sent as a prefix-cache hint, if PROMPT_CACHE_HINT
+    # names the provider's parameter), and its token count is kept locally.
+    model_client = PrefixCachingChatCompletionClient(model_client)
+
+    # Cache model responses in the shared store, so every worker process benefits from them.
+    if LLM_CACHE_TTL > 0:
+        model_client = ChatCompletionCache(model_client, SQLiteCacheStore(ttl=LLM_CACHE_TTL))
+    return model_client
+
+
+def create_agents_for_group_chat(model_client: "ChatCompletionClient") -> "Swarm":
+    """
+    Create a group chat with agents for the given task.
+
+    Args:
+        model_client (ChatCompletionClient): The model client of the agents (see `create_model_client`).
+    """
     # Create the agents
     lead_marketing_analyst = AssistantAgent(
         name="lead_marketing_analyst",
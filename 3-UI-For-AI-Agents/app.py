@@ -1,22 +1,173 @@
-from typing import List, cast
+import os
+import json
+import math
+import time
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Dict, List, Tuple
 import chainlit as cl
 
 from autogen_agentchat.base import TaskResult
 from autogen_agentchat.messages import TextMessage, ToolCallRequestEvent
 from autogen_agentchat.teams import Swarm
 from autogen_core import CancellationToken
+from autogen_core.models import ChatCompletionClient
 
-from agents import create_agents_for_group_chat
+from agents import (
+    AssistantAgent,
+    AzureAIChatCompletionClient,
+    ChatCompletionCache,
+    create_agents_for_group_chat,
+    create_model_client,
+)
+import diagnostics
+from lazy_imports import LazyObject, preload
+from semantic_cache import SemanticCache
+from session_store import SharedStore, TeamStateStore
+from streaming import StreamBroadcaster, Subscription
+from tools import aiohttp, start_prefetching
 
 
+logger = logging.getLogger(__name__)
 
-@cl.on_chat_start  # type: ignore
-async def start_chat() -> None:
-    group_chat = create_agents_for_group_chat()
+# The team state lives in the shared store rather than in `cl.user_session`,
+# so that any worker process behind the router can pick up any session.
+team_states = TeamStateStore()
 
-    # Set the assistant agent in the user session.
-    cl.user_session.set("prompt_history", "")  # type: ignore
-    cl.user_session.set("team", group_chat)  # type: ignore
+# Answers to earlier campaign briefs, looked up by meaning, so near-identical briefs are answered from the cache.
+semantic_cache = LazyObject(lambda: SemanticCache(collection_name="marketing_campaigns"))
+# The answers served from the cache to each session, which its team never saw.
+served_answers = SharedStore(namespace="served_answers")
+
+# Import the agents' heavy dependencies, and load the semantic cache, in the background while the UI starts up.
+preload(AssistantAgent, AzureAIChatCompletionClient, ChatCompletionCache, semantic_cache, aiohttp)
+
+
+@dataclass
+class ActiveRun:
+    """The run in flight of a session: its cancellation token, and the task handling the message."""
+
+    cancellation_token: CancellationToken
+    task: asyncio.Task
+
+
+# The runs in flight on this worker, by session. Sticky routing sends every message of a session to the same worker.
+active_runs: Dict[str, ActiveRun] = {}
+
+# How long to wait for a cancelled run to wind down (it only has to notice the cancellation).
+CANCEL_GRACE_SECONDS = 5.0
+
+# Admin commands in the chat (DIAGNOSTICS_COMMANDS=1): "/lag" reports how long sync calls blocked this worker's loop,
+# and "/profile [seconds]" profiles the worker, and sends the folded stacks for a flame graph.
+DIAGNOSTICS_COMMANDS = os.getenv("DIAGNOSTICS_COMMANDS", "0") == "1"
+# The identifiers of the authenticated users allowed to run them (comma-separated): nobody, unless set.
+DIAGNOSTICS_ADMINS = {user.strip() for user in os.getenv("DIAGNOSTICS_ADMINS", "").split(",") if user.strip()}
+# The longest profile "/profile" runs, in seconds.
+MAX_PROFILE_SECONDS = 300.0
+
+
+def get_session_id() -> str:
+    # Every new chat gets a new thread id, and it survives reconnects, even when the client lands on a different worker.
+    return cl.context.session.thread_id
+
+
+async def cancel_active_run(session_id: str) -> bool:
+    """
+    Cancel the run in flight of a session, if any: the cancellation token stops the agents' model & tool calls
+    (closing their HTTP requests), and the message's task is cancelled, so the team stops reading the run.
+
+    Returns:
+        bool: Whether a run was cancelled.
+    """
+    run = active_runs.pop(session_id, None)
+    if run is None:
+        return False
+    run.cancellation_token.cancel()
+    if not run.task.done() and run.task is not asyncio.current_task():
+        run.task.cancel()
+        await asyncio.wait([run.task], timeout=CANCEL_GRACE_SECONDS)
+    logger.info("Cancelled the run in flight of session %s", session_id)
+    return True
+
+
+def is_diagnostics_admin() -> bool:
+    # Only authenticated users have an identity: without authentication, nobody is an admin.
+    user = cl.user_session.get("user")
+    return user is not None and user.identifier in DIAGNOSTICS_ADMINS
+
+
+async def run_diagnostics_command(text: str) -> bool:
+    """Run the admin command in a message, if it is one. Returns whether it was."""
+    command, _, arg = text.strip().partition(" ")
+    if command not in ("/lag", "/profile"):
+        return False
+    if not is_diagnostics_admin():
+        await cl.Message(content=f"{command} is only available to admins.").send()
+    elif command == "/lag":
+        await cl.Message(content=diagnostics.monitor.stats.report()).send()
+    else:
+        try:
+            seconds = float(arg or 30)
+            if not math.isfinite(seconds) or seconds <= 0:
+                raise ValueError(f"expected a positive number of seconds, got {arg!r}")
+            seconds = min(seconds, MAX_PROFILE_SECONDS)
+            await cl.Message(content=f"Profiling this worker for {seconds:g} s...").send()
+            profiler = await diagnostics.profile_for(seconds)
+        except (ValueError, RuntimeError) as e:
+            await cl.Message(content=f"Can't profile: {e}").send()
+        else:
+            await cl.Message(
+                content=profiler.report(),
+                elements=[cl.File(name=os.path.basename(profiler.path), path=profiler.path)],
+            ).send()
+    return True
+
+
+async def load_team(model_client: ChatCompletionClient) -> Tuple[Swarm, bool]:
+    """Returns the team of this session, with the given model client, and whether it is a new one."""
+    team = create_agents_for_group_chat(model_client)
+    state = team_states.load(get_session_id())
+    if state is not None:
+        await team.load_state(state)
+    return team, state is None
+
+
+async def send_to_ui(subscription: Subscription) -> None:
+    try:
+        async for msg in subscription:
+            if isinstance(msg, TextMessage):
+                # Send the message to the user.
+                await cl.Message(
+                    content=f"[{msg.source}]\n{msg.content}", 
+                    author=msg.source
+                ).send()    
+            elif isinstance(msg, TaskResult):
+                # Send the task termination message.
+                final_message = "Task terminated. "
+                if msg.stop_reason:
+                    final_message += msg.stop_reason
+                await cl.Message(content=final_message).send()
+            elif isinstance(msg, ToolCallRequestEvent):
+                # Send the tool call request message.
+                await cl.Message(
+                    content=f"[{msg.source}]\n **Tool calls requested:**\n- " + "\n- ".join(f"{tool.name}: {tool.arguments}" for tool in msg.content),
+                    author=msg.source,
+                ).send()
+            else:
+                # Skip all other message types.
+                pass
+    finally:
+        # E.g. the browser went away: stop buffering for it.
+        await subscription.close()
+
+
+async def log_messages(subscription: Subscription) -> None:
+    try:
+        async for msg in subscription:
+            logger.debug("%s: %s", type(msg).__name__, getattr(msg, "source", ""))
+    finally:
+        await subscription.close()
 
 
 @cl.set_starters  # type: ignore
@@ -39,30 +190,93 @@ async def set_starts() -> List[cl.Starter]:
 
 @cl.on_message  # type: ignore
 async def chat(message: cl.Message) -> None:
-    # Get the team from the user session.
-    team = cast(Swarm, cl.user_session.get("team"))  # type: ignore
-    async for msg in team.run_stream(
-        task=[TextMessage(content=message.content, source="user")],
-        cancellation_token=CancellationToken(),
-    ):
-        if isinstance(msg, TextMessage):
-            # Send the message to the user.
-            await cl.Message(
-                content=f"[{msg.source}]\n{msg.content}", 
-                author=msg.source
-            ).send()    
-        elif isinstance(msg, TaskResult):
-            # Send the task termination message.
-            final_message = "Task terminated. "
-            if msg.stop_reason:
-                final_message += msg.stop_reason
-            await cl.Message(content=final_message).send()
-        elif isinstance(msg, ToolCallRequestEvent):
-            # Send the tool call request message.
-            await cl.Message(
-                content=f"[{msg.source}]\n **Tool calls requested:**\n- " + "\n- ".join(f"{tool.name}: {tool.arguments}" for tool in msg.content),
-                author=msg.source,
-            ).send()
-        else:
-            # Skip all other message types.
-            pass
\ No newline at end of file
+    # Chainlit has no start-up hook: the diagnostics start with the first message the worker gets.
+    diagnostics.start()
+    if DIAGNOSTICS_COMMANDS and await run_diagnostics_command(message.content):
+        return
+    session_id = get_session_id()
+    # A new message supersedes the run in flight: cancel it before starting the new one.
+    # The team state is only saved when a run completes, so the new run starts from the last complete one.
+    await cancel_active_run(session_id)
+    run = ActiveRun(cancellation_token=CancellationToken(), task=asyncio.current_task())
+    active_runs[session_id] = run
+    try:
+        await run_turn(message, run.cancellation_token)
+    finally:
+        if active_runs.get(session_id) is run:
+            del active_runs[session_id]
+
+
+@cl.on_stop  # type: ignore
+async def stop_chat() -> None:
+    # Chainlit cancels the message's task, but the agents run in the team's runtime: cancel their calls too.
+    await cancel_active_run(get_session_id())
+
+
+@cl.on_chat_end  # type: ignore
+async def end_chat() -> None:
+    # The user went away: stop spending model & tool calls on a run nobody will see.
+    await cancel_active_run(get_session_id())
+
+
+async def run_turn(message: cl.Message, cancellation_token: CancellationToken) -> None:
+    # The agents' model client lives for the turn: close it (and its HTTP session) once the turn is over.
+    model_client = create_model_client()
+    try:
+        # Get the team of this session from the shared store.
+        team, is_new = await load_team(model_client)
+        task = message.content
+        # Only the first brief of a session is looked up in (and added to) the cache: it doesn't depend on the conversation.
+        cacheable = False
+        if is_new:
+            served = served_answers.get_text(get_session_id())
+            if served is not None:
+                # A follow-up to an answer served from the cache: pass the answer along, since the team never saw it.
+                served = json.loads(served)
+                task = semantic_cache.follow_up(task, served["task"], served["messages"])
+                served_answers.delete(get_session_id())
+            else:
+                cacheable = True
+                hit = await asyncio.to_thread(semantic_cache.lookup, task)
+                if hit is not None and hit.similarity >= semantic_cache.threshold:
+                    for source, content in hit.messages:
+                        await cl.Message(content=f"[{source}]\n{content}", author=source).send()
+                    await cl.Message(content=f"Answered from the cache (similarity {hit.similarity:.2f} to an earlier brief).").send()
+                    served_answers.set_text(get_session_id(), json.dumps({"task": task, "messages": hit.messages}), ttl=team_states.ttl)
+                    return
+                if hit is not None:
+                    task = semantic_cache.seed(task, hit)
+
+        started = time.monotonic()
+        # Read the run as fast as the agents produce messages, and let each consumer catch up at its own pace,
+        # so a slow browser no longer holds the agents back.
+        broadcaster = StreamBroadcaster(
+            team.run_stream(
+                task=[TextMessage(content=task, source="user")],
+                cancellation_token=cancellation_token,
+            )
+        )
+        consumers = [
+            asyncio.create_task(send_to_ui(broadcaster.subscribe("ui", maxsize=64, policy="coalesce"))),
+            asyncio.create_task(log_messages(broadcaster.subscribe("log", maxsize=256, policy="drop"))),
+        ]
+        # Set before the run starts, so the team's tools see it.
+        prefetcher = start_prefetching()
+        try:
+            result = await broadcaster.run()
+        except BaseException:
+            await asyncio.gather(*consumers, return_exceptions=True)
+            raise
+        finally:
+            # Cancel the speculative scrapes that the turn didn't use.
+            await prefetcher.cancel()
+
+        # Persist the team state, so that the next message can be served by any worker.
+        team_states.save(get_session_id(), await team.save_state())
+        if cacheable and result is not None:
+            await asyncio.to_thread(semantic_cache.store_result, message.content, result, time.monotonic() - started)
+
+        await asyncio.gather(*consumers)
+        logger.debug("Stream consumers:\n%s", broadcaster.report())
+    finally:
+        await model_client.close()
@@ -0,0 +1,262 @@
+import re
+import math
+import hashlib
+import threading
+from collections import Counter, OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Set
+from urllib.parse import urlparse
+
+
+# Rough number of characters per token, to fill a token budget.
+CHARS_PER_TOKEN = 4
+
+LINK_PATTERN = re.compile(r"!?\[([^\]]*)\]\([^)]*\)")
+BARE_URL_PATTERN = re.compile(r"https?://\S+")
+HEADING_PATTERN = re.compile(r"^#{1,6}\s")
+FENCE_PATTERN = re.compile(r"^\s*(```|~~~)")
+WORD_PATTERN = re.compile(r"[a-z0-9]+")
+
+# Lines of site chrome: call-to-action buttons, cookie banners, footers & skip links. A block is only dropped when
+# each of its lines is one of them, so content that mentions e.g. a newsletter or cookies is kept.
+CHROME_LINE_PATTERN = re.compile(
+    r"(subscribe( now| for free| to (our|the) newsletter)?|sign (in|up)( for free)?|log ?in|log ?out|register|"
+    r"(accept|reject|allow|decline|manage) (all )?cookies|accept all|cookie (policy|settings|preferences)|"
+    r"we use cookies\b.{0,200}|privacy policy|terms of (use|service)|(©|copyright (©|\(c\)|\d{4})).{0,80}|all rights reserved\.?|"
+    r"skip to (main )?content|back to top|follow us( on .{1,40})?|share (this( post| article)?|on .{1,40})|"
+    r"powered by .{1,40}|(please )?enable javascript.{0,80})[.!]?",
+    re.IGNORECASE,
+)
+# Blocks repeated on several pages of a site (menus, footers) are only looked for among blocks up to this size.
+BOILERPLATE_MAX_CHARS = 400
+
+# A block whose text is mostly links (a menu, a footer, a tag cloud) is collapsed into one line.
+LINK_DENSITY_THRESHOLD = 0.6
+COLLAPSED_LINKS = 5
+
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or that the this to was were will with what who how "
+    "about their they our your you we us i".split()
+)
+
+
+@dataclass
+class Block:
+    """A paragraph, list, table, heading or code block of a page."""
+
+    text: str
+    position: int
+    kind: str = "text"
+    heading: str = ""
+
+
+def _fingerprint(text: str) -> str:
+    normalized = " ".join(WORD_PATTERN.findall(text.lower()))
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+
+
+def _link_density(text: str) -> float:
+    stripped = BARE_URL_PATTERN.sub("", text)
+    link_text = sum(len(match.group(0)) for match in LINK_PATTERN.finditer(stripped))
+    return link_text / max(len(stripped.strip()), 1)
+
+
+def split_blocks(markdown: str) -> List[Block]:
+    """Split markdown into blocks at blank lines and headings, keeping fenced code blocks whole."""
+    blocks: List[Block] = []
+    current: List[str] = []
+    in_fence = False
+    heading = ""
+
+    def flush(kind: str = "text") -> None:
+        text = "\n".join(current).strip()
+        if text:
+            blocks.append(Block(text=text, position=len(blocks), kind=kind, heading=heading))
+        current.clear()
+
+    for line in markdown.splitlines():
+        if FENCE_PATTERN.match(line):
+            if in_fence:
+                current.append(line)
+                flush("code")
+            else:
+                flush()
+                current.append(line)
+            in_fence = not in_fence
+        elif in_fence:
+            current.append(line)
+        elif HEADING_PATTERN.match(line):
+            flush()
+            heading = line.lstrip("#").strip()
+            current.append(line)
+            flush("heading")
+        elif not line.strip():
+            flush()
+        else:
+            current.append(line)
+    flush("code" if in_fence else "text")
+    return blocks
+
+
+class SiteBoilerplate:
+    """
+    Remembers the blocks seen on the pages of each site, so that blocks repeated on several pages
+    of the same site (menus, footers, sidebars) are recognized as boilerplate.
+
+    Args:
+        max_sites (int): The number of sites remembered (the least recently scraped are forgotten).
+    """
+
+    def __init__(self, max_sites: int = 256):
+        self.max_sites = max_sites
+        self._sites: "OrderedDict[str, Dict[str, Set[str]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def observe(self, url: str, blocks: List[Block]) -> Set[str]:
+        """
+        Record the blocks of a page.
+
+        Returns:
+            Set[str]: The fingerprints of its blocks that were also seen on another page of the site.
+        """
+        site, page = urlparse(url).netloc, url.split("#")[0]
+        with self._lock:
+            pages_by_block = self._sites.pop(site, {})
+            self._sites[site] = pages_by_block
+            while len(self._sites) > self.max_sites:
+                self._sites.popitem(last=False)
+            repeated = set()
+            for block in blocks:
+                if block.kind != "text" or len(block.text) > BOILERPLATE_MAX_CHARS * 2:
+                    continue
+                fingerprint = _fingerprint(block.text)
+                pages = pages_by_block.setdefault(fingerprint, set())
+                pages.add(page)
+                if len(pages) > 1:
+                    repeated.add(fingerprint)
+            return repeated
+
+
+site_boilerplate = SiteBoilerplate()
+
+
+def _is_chrome(text: str) -> bool:
+    """Whether each line of a block is site chrome (e.g. "Subscribe", "Accept all cookies", "© 2025 Acme")."""
+    for line in text.splitlines():
+        # Judge the text of the line, without its markdown: list markers, emphasis, table pipes, link targets.
+        line = LINK_PATTERN.sub(lambda match: match.group(1), line)
+        line = re.sub(r"^\s*([-*+>]|\d+\.)\s+|[*_|`#]", " ", line)
+        line = " ".join(line.split())
+        if line and not CHROME_LINE_PATTERN.fullmatch(line):
+            return False
+    return True
+
+
+def _collapse_links(text: str) -> str:
+    labels = [label.strip() for label in LINK_PATTERN.findall(text) if label.strip()]
+    if not labels:
+        return ""
+    more = f" (+{len(labels) - COLLAPSED_LINKS} more)" if len(labels) > COLLAPSED_LINKS else ""
+    return "Links: " + " · ".join(labels[:COLLAPSED_LINKS]) + more
+
+
+def clean_markdown(markdown: str, url: Optional[str] = None) -> str:
+    """
+    Remove the boilerplate of a scraped page: site chrome (cookie banners, sign-up buttons, footers),
+    blocks repeated on other pages of the same site, and duplicated paragraphs. Link lists are collapsed into one line.
+
+    Args:
+        markdown (str): The markdown of the page.
+        url (str, optional): The URL of the page, to recognize the blocks it shares with other pages of its site.
+
+    Returns:
+        str: The cleaned markdown.
+    """
+    blocks = split_blocks(markdown)
+    repeated = site_boilerplate.observe(url, blocks) if url else set()
+    seen: Set[str] = set()
+    kept = []
+    for block in blocks:
+        text = block.text
+        if block.kind == "text":
+            fingerprint = _fingerprint(text)
+            if fingerprint in seen or fingerprint in repeated:
+                continue
+            seen.add(fingerprint)
+            if _is_chrome(text):
+                continue
+            if _link_density(text) >= LINK_DENSITY_THRESHOLD:
+                text = _collapse_links(text)
+                if not text:
+                    continue
+        kept.append(text)
+    return "\n\n".join(kept)
+
+
+def _terms(text: str) -> List[str]:
+    return [word for word in WORD_PATTERN.findall(text.lower()) if word not in STOPWORDS]
+
+
+def extract_content(
+    markdown: str, query: str = "", max_tokens: int = 3000, url: Optional[str] = None, clean: bool = True
+) -> str:
+    """
+    Keep the most useful text of a scraped page within a token budget.
+
+    The page is cleaned (see `clean_markdown`), its blocks are ranked by relevance to the query (BM25),
+    with a slight preference for the start of the page and for prose over collapsed links,
+    and the best blocks are kept, in their original order, until the budget is full.
+
+    Args:
+        markdown (str): The markdown of the page.
+        query (str): What the agent is looking for on the page. Without it, the start of the page is kept.
+        max_tokens (int): The budget, in (estimated) tokens.
+        url (str, optional): The URL of the page.
+        clean (bool): Whether to clean the page first. Pass False for a page already cleaned with `clean_markdown`.
+
+    Returns:
+        str: The extracted content, with "[…]" where blocks were left out.
+    """
+    cleaned = clean_markdown(markdown, url) if clean else markdown
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    if len(cleaned) <= max_chars:
+        return cleaned
+
+    blocks = split_blocks(cleaned)
+    query_terms = set(_terms(query))
+    block_terms = [Counter(_terms(block.text + " " + block.heading)) for block in blocks]
+    average_length = sum(sum(terms.values()) for terms in block_terms) / max(len(blocks), 1)
+    document_frequency = Counter(term for terms in block_terms for term in terms if term in query_terms)
+
+    def score(index: int) -> float:
+        block, terms = blocks[index], block_terms[index]
+        length = sum(terms.values())
+        relevance = 0.0
+        for term in query_terms:
+            frequency = terms.get(term, 0)
+            if frequency:
+                idf = math.log(1 + (len(blocks) - document_frequency[term] + 0.5) / (document_frequency[term] + 0.5))
+                relevance += idf * frequency * 2.2 / (frequency + 1.2 * (0.25 + 0.75 * length / max(average_length, 1)))
+        position = 1 / (1 + block.position / 10)
+        prose = 0.2 if block.kind == "heading" or block.text.startswith("Links: ") else 1.0
+        return (relevance + 0.5 * position) * prose
+
+    selected: Dict[int, str] = {}
+    used = 0
+    for index in sorted(range(len(blocks)), key=score, reverse=True):
+        text = blocks[index].text
+        if used + len(text) + 2 > max_chars:
+            # A block larger than what is left is cut, if enough is left for it to be useful.
+            if max_chars - used < 400 or blocks[index].kind == "code":
+                continue
+            text = text[: max_chars - used - 4].rsplit(" ", 1)[0] + " …"
+        selected[index] = text
+        used += len(text) + 2
+
+    parts = []
+    for index in range(len(blocks)):
+        if index in selected:
+            parts.append(selected[index])
+        elif not parts or parts[-1] != "[…]":
+            parts.append("[…]")
+    return "\n\n".join(parts)
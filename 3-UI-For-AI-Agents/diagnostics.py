@@ -0,0 +1,291 @@
+import os
+import sys
+import time
+import asyncio
+import logging
+import threading
+from collections import Counter, deque
+from dataclasses import dataclass, field
+from types import FrameType
+from typing import Deque, List, Optional
+
+
+logger = logging.getLogger(__name__)
+
+# The lag monitor is cheap enough to leave on (LOOP_LAG_MONITOR=0 disables it).
+LAG_MONITOR = os.getenv("LOOP_LAG_MONITOR", "1") == "1"
+# A tick of the loop later than this is reported as a stall, with the stack of what blocked the loop.
+LAG_THRESHOLD = float(os.getenv("LOOP_LAG_THRESHOLD_MS", "250")) / 1000
+# Profile the first N seconds of each worker (0 to only profile on demand).
+PROFILE_SECONDS = float(os.getenv("PROFILE_SECONDS", "0"))
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL_MS", "10")) / 1000
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+
+
+def _frame_name(frame: FrameType) -> str:
+    code = frame.f_code
+    # No ';' in a frame name: it separates the frames of a folded stack.
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})".replace(";", ":")
+
+
+def _stack(frame: Optional[FrameType], limit: int = 200) -> List[str]:
+    """The names of the frames of a stack, from the outermost one."""
+    names = []
+    while frame is not None and len(names) < limit:
+        names.append(_frame_name(frame))
+        frame = frame.f_back
+    return names[::-1]
+
+
+def _format_stack(frame: Optional[FrameType], limit: int = 12) -> str:
+    # The innermost frames, with the line being run: what was blocking the loop.
+    lines = []
+    while frame is not None and len(lines) < limit:
+        code = frame.f_code
+        lines.append(f"  {os.path.basename(code.co_filename)}:{frame.f_lineno} in {code.co_name}")
+        frame = frame.f_back
+    return "\n".join(lines[::-1])
+
+
+@dataclass
+class Stall:
+    """A tick of the loop that came in late, and the stack of the loop's thread while it was blocked (if caught)."""
+
+    at: float
+    lag_seconds: float
+    stack: str = ""
+
+
+@dataclass
+class LagStats:
+    """How late the loop's ticks came in."""
+
+    ticks: int = 0
+    stalls: int = 0
+    max_lag_seconds: float = 0.0
+    total_lag_seconds: float = 0.0
+    recent_lags: Deque[float] = field(default_factory=lambda: deque(maxlen=600))
+    recent_stalls: Deque[Stall] = field(default_factory=lambda: deque(maxlen=10))
+
+    def report(self) -> str:
+        if not self.ticks:
+            return "Event loop lag: not measured yet."
+        lags = sorted(self.recent_lags)
+        p50, p99 = lags[len(lags) // 2], lags[min(int(len(lags) * 0.99), len(lags) - 1)]
+        report = (
+            f"Event loop lag: {self.ticks} ticks, {self.stalls} stall(s). "
+            f"Recent p50 {p50 * 1000:.0f} ms, p99 {p99 * 1000:.0f} ms; max {self.max_lag_seconds * 1000:.0f} ms."
+        )
+        for stall in self.recent_stalls:
+            report += (
+                f"\n- {time.strftime('%H:%M:%S', time.localtime(stall.at))}: blocked for {stall.lag_seconds * 1000:.0f} ms"
+                + (f" in:\n{stall.stack}" if stall.stack else " (too short for the watchdog to catch it)")
+            )
+        return report
+
+
+class LoopLagMonitor:
+    """
+    Measures how late the event loop wakes up a task that sleeps for `interval`: a sync call on the loop
+    (e.g. a SQLite read, or cleaning a scraped page) delays every other session by as much.
+
+    A watchdog thread checks that the loop keeps ticking, and when it falls behind by more than `threshold`,
+    it captures the stack of the loop's thread while it is still blocked, so the stall is logged with the call
+    that caused it. Its cost is one wake-up of the loop per `interval`, and a few of the watchdog per `threshold`.
+
+    Args:
+        interval (float): The time between ticks, in seconds.
+        threshold (float): The lag reported as a stall, in seconds.
+    """
+
+    def __init__(self, interval: float = 0.1, threshold: float = LAG_THRESHOLD):
+        self.interval = interval
+        self.threshold = threshold
+        self.stats = LagStats()
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+        self._loop_thread = 0
+        self._tick_at = 0.0
+        # The stack captured by the watchdog, and the tick it was captured in.
+        self._stack = ""
+        self._stack_tick = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self) -> None:
+        """Start monitoring the running loop (only the first call does)."""
+        if self.running:
+            return
+        self._loop_thread = threading.get_ident()
+        self._tick_at = time.monotonic()
+        self._stopped.clear()
+        self._task = asyncio.get_running_loop().create_task(self._tick())
+        self._watchdog = threading.Thread(target=self._watch, name="loop-lag-watchdog", daemon=True)
+        self._watchdog.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._task is not None:
+            self._task.cancel()
+
+    async def _tick(self) -> None:
+        while True:
+            tick_at = self._tick_at = time.monotonic()
+            await asyncio.sleep(self.interval)
+            self._record(tick_at, max(time.monotonic() - tick_at - self.interval, 0.0))
+
+    def _record(self, tick_at: float, lag: float) -> None:
+        stats = self.stats
+        stats.ticks += 1
+        stats.total_lag_seconds += lag
+        stats.max_lag_seconds = max(stats.max_lag_seconds, lag)
+        stats.recent_lags.append(lag)
+        if lag < self.threshold:
+            return
+        stack = self._stack if self._stack_tick == tick_at else ""
+        stats.stalls += 1
+        stats.recent_stalls.append(Stall(at=time.time(), lag_seconds=lag, stack=stack))
+        logger.warning("The event loop was blocked for %.0f ms%s", lag * 1000, f" in:\n{stack}" if stack else "")
+
+    def _watch(self) -> None:
+        while not self._stopped.wait(self.threshold / 4):
+            tick_at = self._tick_at
+            if self._stack_tick != tick_at and time.monotonic() - tick_at - self.interval > self.threshold:
+                # The loop is still blocked: this is the call that blocks it.
+                self._stack = _format_stack(sys._current_frames().get(self._loop_thread))
+                self._stack_tick = tick_at
+
+
+class SamplingProfiler:
+    """
+    A sampling profiler: a thread samples the stack of the loop's thread (or of all threads) every `interval`,
+    and the samples are written as folded stacks ("outer;...;inner count" per line), which flamegraph.pl,
+    speedscope or inferno turn into a flame graph. The profiled code runs unchanged, which keeps the overhead low
+    (a few percent at the default 10 ms), unlike cProfile's.
+
+    A sample is taken when the sampled thread releases the GIL: during blocking I/O (e.g. `requests`), and at least
+    every 5 ms of Python code, so short bursts of Python between two awaits are under-counted.
+
+    Args:
+        interval (float): The time between samples, in seconds.
+        all_threads (bool): Whether to sample all threads (e.g. the `asyncio.to_thread` workers) rather than the loop's.
+        idle (bool): Whether to keep the samples of an idle loop (waiting in `select`).
+    """
+
+    def __init__(self, interval: float = PROFILE_INTERVAL, all_threads: bool = False, idle: bool = False):
+        self.interval = interval
+        self.all_threads = all_threads
+        self.idle = idle
+        self.samples: Counter = Counter()
+        # The folded stacks, once written.
+        self.path: Optional[str] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+        self._target = 0
+        self._started_at = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        """Start sampling the calling thread (the loop's), or all threads."""
+        if self.running:
+            return
+        self._target = threading.get_ident()
+        self._started_at = time.monotonic()
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._sample, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def _sample(self) -> None:
+        me = threading.get_ident()
+        names = {}
+        while not self._stopped.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == me or (not self.all_threads and thread_id != self._target):
+                    continue
+                if not self.idle and frame.f_code.co_name == "select" and frame.f_code.co_filename.endswith("selectors.py"):
+                    continue
+                stack = _stack(frame)
+                if self.all_threads:
+                    if thread_id not in names:
+                        names = {thread.ident: thread.name for thread in threading.enumerate()}
+                    stack.insert(0, names.get(thread_id, str(thread_id)))
+                self.samples[";".join(stack)] += 1
+
+    def stop(self, path: Optional[str] = None) -> str:
+        """
+        Stop sampling, and write the folded stacks.
+
+        Args:
+            path (str, optional): The file to write. Defaults to a new file in PROFILE_DIR.
+
+        Returns:
+            str: The path of the file.
+        """
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+        if path is None:
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            path = os.path.join(PROFILE_DIR, f"profile-{os.getpid()}-{time.strftime('%Y%m%d-%H%M%S')}.folded")
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+        self.path = path
+        logger.info(
+            "Profiled %.1f s (%d samples) into %s", time.monotonic() - self._started_at, sum(self.samples.values()), path
+        )
+        return path
+
+    def report(self, top: int = 10) -> str:
+        """The functions most often on top of the stack (where the time is spent), as a share of the samples."""
+        total = sum(self.samples.values())
+        if not total:
+            return "Profile: no samples (the loop was idle)."
+        leaves: Counter = Counter()
+        for stack, count in self.samples.items():
+            leaves[stack.rsplit(";", 1)[-1]] += count
+        return f"Profile: {total} samples. Top functions:\n" + "\n".join(
+            f"- {count / total:5.1%} {name}" for name, count in leaves.most_common(top)
+        )
+
+
+monitor = LoopLagMonitor()
+_profiler: Optional[SamplingProfiler] = None
+_started = False
+
+
+async def profile_for(seconds: float, all_threads: bool = False) -> SamplingProfiler:
+    """
+    Profile this worker for a while (one profile at a time), and write its folded stacks to PROFILE_DIR.
+
+    Returns:
+        SamplingProfiler: The profiler, with the `path` of its folded stacks, and its `report()`.
+    """
+    global _profiler
+    if _profiler is not None and _profiler.running:
+        raise RuntimeError("A profile is already running.")
+    _profiler = profiler = SamplingProfiler(all_threads=all_threads)
+    profiler.start()
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        await asyncio.to_thread(profiler.stop)
+    return profiler
+
+
+def start() -> None:
+    """Start the diagnostics set up by the environment, on the running loop (only the first call does)."""
+    global _started
+    if _started:
+        return
+    _started = True
+    if LAG_MONITOR:
+        monitor.start()
+    if PROFILE_SECONDS > 0:
+        asyncio.get_running_loop().create_task(profile_for(PROFILE_SECONDS))
@@ -0,0 +1,155 @@
+"""
+A load test of the app's worker processes, against a mock model server.
+
+Each worker process runs chat turns like app.py does: it loads the session's team from the shared store, runs it,
+and saves its state back. The model is a local mock of the chat completions API, which answers after `--latency`
+seconds, so the test measures the workers rather than the model. Between turns, the sessions are dealt out to the
+workers again, so most turns are served by another worker than the session's previous one, and a turn that doesn't
+find its session's state counts as an error.
+
+It reports the throughput (turns per second) for 1, 2, 4, ... workers, up to `--workers`. The workers share nothing
+but the SQLite store, so the throughput should grow nearly linearly with the workers, up to the number of CPU cores.
+
+Usage:
+    python load_test.py --workers 4 --sessions 32 --turns 3
+"""
+
+import os
+import time
+import asyncio
+import argparse
+import tempfile
+import multiprocessing
+from typing import List, Tuple
+
+from aiohttp import web
+
+
+# A reply of the size of a typical agent message, so the team state grows like in a real chat.
+MOCK_REPLY = "Here is my analysis of the market, the competitors and the audience. " * 30
+
+
+def run_mock_model(port: int, latency: float) -> None:
+    """Serve a mock of the chat completions API, which answers every request with `MOCK_REPLY` after `latency` seconds."""
+
+    async def complete(request: web.Request) -> web.Response:
+        body = await request.json()
+        await asyncio.sleep(latency)
+        return web.json_response({
+            "id": "mock",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "mock"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": MOCK_REPLY}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 1000, "completion_tokens": 200, "total_tokens": 1200},
+        })
+
+    app = web.Application()
+    app.router.add_post("/{path:.*}chat/completions", complete)
+    web.run_app(app, host="127.0.0.1", port=port, print=None)
+
+
+def init_worker(endpoint: str, store_path: str) -> None:
+    # Set before the app's modules are imported, since they read them at import time.
+    os.environ.update(MODEL_ENDPOINT=endpoint, AGENT_STORE_PATH=store_path, LLM_CACHE_TTL="0")
+    os.environ.setdefault("GITHUB_TOKEN", "mock")
+    import agents  # noqa: F401 (imported once per worker, not once per turn)
+
+
+def run_turns(job: Tuple[List[str], int]) -> Tuple[int, int, int]:
+    """
+    Run one turn of each of the given sessions, concurrently, on this worker.
+
+    Returns:
+        Tuple[int, int, int]: This worker's pid, the number of turns run, and the number of turns that failed.
+    """
+    from agents import create_agents_for_group_chat, create_model_client
+    from session_store import TeamStateStore
+    from autogen_agentchat.messages import TextMessage
+
+    session_ids, turn = job
+    team_states = TeamStateStore()
+
+    async def run_turn(session_id: str) -> bool:
+        # Like the app: a model client per turn, closed at its end.
+        model_client = create_model_client()
+        try:
+            team = create_agents_for_group_chat(model_client)
+            state = team_states.load(session_id)
+            if turn > 0 and state is None:
+                return False
+            if state is not None:
+                await team.load_state(state)
+            task = "Plan a campaign for our new running shoes." if turn == 0 else f"Follow-up #{turn}: make it more playful."
+            await team.run(task=[TextMessage(content=task, source="user")])
+            team_states.save(session_id, await team.save_state())
+            return True
+        finally:
+            await model_client.close()
+
+    async def main() -> List[bool]:
+        return await asyncio.gather(*(run_turn(session_id) for session_id in session_ids))
+
+    results = asyncio.run(main())
+    return os.getpid(), len(results), results.count(False)
+
+
+def measure(workers: int, sessions: int, turns: int, endpoint: str) -> Tuple[float, int, int]:
+    """
+    Run `turns` turns of `sessions` sessions on `workers` worker processes.
+
+    Returns:
+        Tuple[float, int, int]: The throughput in turns per second, the number of failed turns, and the number
+        of sessions served by more than one worker.
+    """
+    store_path = os.path.join(tempfile.mkdtemp(prefix="load_test_"), "store.sqlite3")
+    session_ids = [f"session-{i}" for i in range(sessions)]
+    served_by = {session_id: set() for session_id in session_ids}
+    failed = 0
+    with multiprocessing.Pool(workers, initializer=init_worker, initargs=(endpoint, store_path)) as pool:
+        # Warm up every worker (imports, connections) before the clock starts.
+        pool.map(time.sleep, [0.5] * workers)
+        started = time.monotonic()
+        for turn in range(turns):
+            # Deal the sessions out again at every turn, shifted by one, so they change workers.
+            jobs = [([s for i, s in enumerate(session_ids) if (i + turn) % workers == w], turn) for w in range(workers)]
+            for (job_sessions, _), (pid, _, errors) in zip(jobs, pool.map(run_turns, jobs, chunksize=1)):
+                failed += errors
+                for session_id in job_sessions:
+                    served_by[session_id].add(pid)
+        elapsed = time.monotonic() - started
+    moved = sum(len(pids) > 1 for pids in served_by.values())
+    return sessions * turns / elapsed, failed, moved
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Load test the app's workers against a mock model server.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="The largest number of worker processes.")
+    parser.add_argument("--sessions", type=int, default=32, help="The number of chat sessions.")
+    parser.add_argument("--turns", type=int, default=3, help="The number of turns per session.")
+    parser.add_argument("--latency", type=float, default=0.05, help="The mock model's latency, in seconds.")
+    parser.add_argument("--port", type=int, default=8900, help="The port of the mock model server.")
+    args = parser.parse_args()
+
+    model = multiprocessing.Process(target=run_mock_model, args=(args.port, args.latency), daemon=True)
+    model.start()
+    time.sleep(1)
+    endpoint = f"http://127.0.0.1:{args.port}"
+    try:
+        print(f"{args.sessions} sessions x {args.turns} turns, mock model latency {args.latency * 1000:.0f} ms, {os.cpu_count()} CPU core(s)")
+        baseline = None
+        workers = 1
+        while workers <= args.workers:
+            throughput, failed, moved = measure(workers, args.sessions, args.turns, endpoint)
+            baseline = baseline or throughput
+            print(
+                f"{workers:3} worker(s): {throughput:6.1f} turns/s, x{throughput / baseline:.2f} "
+                f"({failed} failed, {moved}/{args.sessions} sessions served by several workers)"
+            )
+            workers *= 2
+    finally:
+        model.terminate()
+
+
+if __name__ == "__main__":
+    main()
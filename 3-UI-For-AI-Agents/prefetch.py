@@ -0,0 +1,166 @@
+import json
+import time
+import asyncio
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+
+
+@dataclass
+class PrefetchStats:
+    """What the prefetcher fetched, and how much of it was used."""
+
+    started: int = 0
+    # Scrapes answered by a finished prefetch, or by one still in flight.
+    hits: int = 0
+    joined: int = 0
+    misses: int = 0
+    failed: int = 0
+    cancelled: int = 0
+    unused: int = 0
+    skipped: int = 0
+    bytes_fetched: int = 0
+    saved_seconds: float = 0.0
+
+    def report(self) -> str:
+        return (
+            f"Prefetch: {self.started} page(s) prefetched ({self.bytes_fetched / 1024:.0f} KB), "
+            f"{self.hits} used when ready, {self.joined} used in flight, {self.misses} scrape(s) not prefetched.\n"
+            f"{self.unused} unused, {self.cancelled} cancelled, {self.failed} failed, {self.skipped} skipped (budget). "
+            f"Scrape latency saved: {self.saved_seconds:.1f} s."
+        )
+
+
+class ScrapePrefetcher:
+    """
+    Speculatively scrapes the top results of a web search in the background, while the model reads the results
+    and decides which pages to scrape, so that the scrapes it then asks for are already done (or under way).
+
+    - At most `max_concurrency` pages are fetched at once, and at most `max_bytes` of pages are kept.
+    - `cancel()`, at the end of a turn, cancels the prefetches still in flight and drops the unused pages.
+      When several turns run at once (e.g. the sessions of a web app), give each turn its own prefetcher,
+      so a turn neither uses up the budget of the others, nor has its prefetches cancelled by them.
+
+    Args:
+        fetch (Callable[[str], Awaitable[str]]): Fetches a page, e.g. its markdown through Firecrawl.
+        top_n (int): The number of organic results prefetched per search.
+        max_concurrency (int): The number of pages fetched at the same time.
+        max_bytes (int): The total size of the prefetched pages kept.
+        enabled (bool): Whether to prefetch at all. When disabled, `get()` always misses.
+    """
+
+    def __init__(
+        self,
+        fetch: Callable[[str], Awaitable[str]],
+        top_n: int = 3,
+        max_concurrency: int = 3,
+        max_bytes: int = 2_000_000,
+        enabled: bool = True,
+    ):
+        self.fetch = fetch
+        self.top_n = top_n
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self.stats = PrefetchStats()
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._started_at: Dict[str, float] = {}
+        self._durations: Dict[str, float] = {}
+        self._used: Set[str] = set()
+        self._bytes = 0
+
+    def prefetch_from_search(self, results: str) -> List[str]:
+        """
+        Start prefetching the top organic links of a Serper search response.
+
+        Returns:
+            List[str]: The URLs whose prefetch was started.
+        """
+        try:
+            organic = json.loads(results).get("organic", [])
+        except (ValueError, AttributeError):
+            return []
+        urls = [result["link"] for result in organic if isinstance(result, dict) and result.get("link")]
+        return self.prefetch(urls[: self.top_n])
+
+    def prefetch(self, urls: List[str]) -> List[str]:
+        """Start prefetching the pages, unless they are already prefetched, or the byte budget is used up."""
+        if not self.enabled:
+            return []
+        started = []
+        for url in urls:
+            if url in self._tasks:
+                continue
+            if self._bytes >= self.max_bytes:
+                self.stats.skipped += 1
+                continue
+            self._started_at[url] = time.monotonic()
+            self._tasks[url] = asyncio.create_task(self._prefetch(url))
+            self.stats.started += 1
+            started.append(url)
+        return started
+
+    async def _prefetch(self, url: str) -> Optional[str]:
+        async with self._semaphore:
+            started = time.monotonic()
+            try:
+                page = await self.fetch(url)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                self.stats.failed += 1
+                return None
+        self._durations[url] = time.monotonic() - started
+        size = len(page.encode("utf-8"))
+        self.stats.bytes_fetched += size
+        if self._bytes + size > self.max_bytes:
+            self.stats.skipped += 1
+            return None
+        self._bytes += size
+        return page
+
+    async def get(self, url: str) -> Optional[str]:
+        """
+        The prefetched page, waiting for it if its prefetch is still in flight.
+
+        Returns:
+            Optional[str]: The page, or None if it wasn't prefetched (or its prefetch failed): then, fetch it as usual.
+        """
+        task = self._tasks.get(url)
+        if task is None:
+            self.stats.misses += 1
+            return None
+        waited = time.monotonic()
+        in_flight = not task.done()
+        try:
+            # Shielded, so a cancelled tool call doesn't cancel the prefetch, which another call may use.
+            page = await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if task.cancelled():
+                return None
+            raise
+        if page is None:
+            return None
+        if in_flight:
+            self.stats.joined += 1
+            # The time the page had already been fetching when it was asked for.
+            self.stats.saved_seconds += max(waited - self._started_at[url], 0.0)
+        else:
+            self.stats.hits += 1
+            self.stats.saved_seconds += self._durations.get(url, 0.0)
+        self._used.add(url)
+        return page
+
+    async def cancel(self) -> None:
+        """End of the turn: cancel the prefetches still in flight, and drop the pages that weren't used."""
+        tasks, self._tasks = self._tasks, {}
+        for url, task in tasks.items():
+            if not task.done():
+                task.cancel()
+                self.stats.cancelled += 1
+            elif url not in self._used and not task.cancelled() and task.result() is not None:
+                self.stats.unused += 1
+        await asyncio.gather(*tasks.values(), return_exceptions=True)
+        self._started_at.clear()
+        self._durations.clear()
+        self._used.clear()
+        self._bytes = 0
@@ -0,0 +1,416 @@
+"""
+A model client wrapper for the long system messages that every call of an agent repeats, and a benchmark of it.
+
+Usage (benchmark, against a local mock of a provider with prefix caching):
+    python prompt_cache.py --calls 60 --replicas 4
+"""
+
+import os
+import json
+import time
+import random
+import asyncio
+import hashlib
+import argparse
+import warnings
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, AsyncGenerator, Callable, Dict, List, Mapping, Optional, Sequence, Tuple, Union
+
+from autogen_core import CancellationToken
+from autogen_core.models import (
+    ChatCompletionClient,
+    CreateResult,
+    LLMMessage,
+    ModelCapabilities,
+    ModelInfo,
+    RequestUsage,
+    SystemMessage,
+    UserMessage,
+)
+from autogen_core.tools import Tool, ToolSchema
+
+
+# The request parameter that carries the prefix-cache key (e.g. "prompt_cache_key"), for the providers that route
+# requests by it. Unset by default: the Azure AI inference endpoint of GitHub Models caches long prefixes on its own.
+PROMPT_CACHE_HINT = os.getenv("PROMPT_CACHE_HINT") or None
+
+# The tokens of the chat format around each message, and before the reply (as counted for OpenAI's chat models).
+TOKENS_PER_MESSAGE = 3
+TOKENS_PER_REPLY = 3
+
+
+@lru_cache(maxsize=None)
+def _encoding(name: str) -> Any:
+    import tiktoken
+
+    return tiktoken.get_encoding(name)
+
+
+def count_text_tokens(text: str) -> int:
+    """The number of tokens of a text, with the tokenizer of the gpt-4o models (o200k_base)."""
+    return len(_encoding("o200k_base").encode(text, disallowed_special=()))
+
+
+def message_text(message: LLMMessage) -> str:
+    """The text of a message, as it is tokenized."""
+    if isinstance(message.content, str):
+        return message.content
+    return json.dumps(message.content, default=str)
+
+
+def static_prefix(messages: Sequence[LLMMessage]) -> List[LLMMessage]:
+    """The leading system messages of a request: the part an agent sends, unchanged, on every call."""
+    prefix = []
+    for message in messages:
+        if not isinstance(message, SystemMessage):
+            break
+        prefix.append(message)
+    return prefix
+
+
+def prefix_hash(messages: Sequence[LLMMessage], tools: Sequence[Tool | ToolSchema] = []) -> str:
+    """The hash of a request's static prefix: its leading system messages, and its tool schemas."""
+    data = json.dumps(
+        {
+            "messages": [message.content for message in static_prefix(messages)],
+            "tools": [tool.schema if isinstance(tool, Tool) else tool for tool in tools],
+        },
+        sort_keys=True,
+    )
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class PrefixStats:
+    """How often the requests repeated a static prefix, and how many token counts were answered from the cache."""
+
+    calls: int = 0
+    repeated: int = 0
+    prefixes: int = 0
+    counts: int = 0
+    counted_from_cache: int = 0
+
+    def report(self) -> str:
+        repeated = 100 * self.repeated / self.calls if self.calls else 0.0
+        return (
+            f"Prompt prefixes: {self.calls} call(s), {self.prefixes} distinct static prefix(es), "
+            f"{self.repeated} call(s) ({repeated:.0f}%) repeating a prefix already sent. "
+            f"Token counts: {self.counts}, {self.counted_from_cache} with the prefix's count cached."
+        )
+
+
+class PrefixCachingChatCompletionClient(ChatCompletionClient):
+    """
+    Wraps a model client, to make the most of the provider's prompt cache for the static prefix of the requests
+    (the leading system messages & the tool schemas, which an agent sends first, and unchanged, on every call).
+    The requests are sent as they are: nothing is reordered or rewritten.
+
+    - The prefix is hashed. With `cache_hint_arg`, the hash is sent as that request parameter (in the `model_extras`
+      of an `AzureAIChatCompletionClient`), so a provider that routes by it (e.g. OpenAI's `prompt_cache_key`) sends
+      the calls that share the prefix to the same cache.
+    - `count_tokens` counts locally (the Azure AI client doesn't), and keeps the count of each prefix, and of the
+      messages after it (the history, which every call resends), so only the new messages are tokenized.
+    - The stats show how many calls repeated a prefix, i.e. could reuse the provider's cache.
+
+    Args:
+        client (ChatCompletionClient): The model client to wrap.
+        cache_hint_arg (str, optional): The request parameter that takes the prefix-cache key. Leave it unset for the
+            providers that reject unknown parameters.
+        count (Callable[[str], int]): Counts the tokens of a text.
+        stats (PrefixStats, optional): The stats to add to, e.g. shared by the clients of all the model tiers.
+        max_prefixes (int): The number of prefixes whose token count is kept.
+        max_messages (int): The number of other messages whose token count is kept.
+    """
+
+    def __init__(
+        self,
+        client: ChatCompletionClient,
+        cache_hint_arg: Optional[str] = PROMPT_CACHE_HINT,
+        count: Callable[[str], int] = count_text_tokens,
+        stats: Optional[PrefixStats] = None,
+        max_prefixes: int = 256,
+        max_messages: int = 1024,
+    ):
+        self.client = client
+        self.cache_hint_arg = cache_hint_arg
+        self.count = count
+        self.stats = stats or PrefixStats()
+        self.max_prefixes = max_prefixes
+        self.max_messages = max_messages
+        self._prefix_tokens: "OrderedDict[str, int]" = OrderedDict()
+        self._sent: "OrderedDict[str, None]" = OrderedDict()
+        self._message_tokens: "OrderedDict[str, int]" = OrderedDict()
+
+    def _record(self, key: str) -> None:
+        self.stats.calls += 1
+        if key in self._sent:
+            self.stats.repeated += 1
+            self._sent.move_to_end(key)
+            return
+        self.stats.prefixes += 1
+        self._sent[key] = None
+        if len(self._sent) > self.max_prefixes:
+            self._sent.popitem(last=False)
+
+    def _create_args(self, key: str, extra_create_args: Mapping[str, Any]) -> Mapping[str, Any]:
+        if not self.cache_hint_arg:
+            return extra_create_args
+        model_extras = {self.cache_hint_arg: key, **extra_create_args.get("model_extras", {})}
+        return {**extra_create_args, "model_extras": model_extras}
+
+    async def create(
+        self,
+        messages: Sequence[LLMMessage],
+        *,
+        tools: Sequence[Tool | ToolSchema] = [],
+        json_output: Optional[bool] = None,
+        extra_create_args: Mapping[str, Any] = {},
+        cancellation_token: Optional[CancellationToken] = None,
+    ) -> CreateResult:
+        key = prefix_hash(messages, tools)
+        self._record(key)
+        return await self.client.create(
+            messages,
+            tools=tools,
+            json_output=json_output,
+            extra_create_args=self._create_args(key, extra_create_args),
+            cancellation_token=cancellation_token,
+        )
+
+    def create_stream(
+        self,
+        messages: Sequence[LLMMessage],
+        *,
+        tools: Sequence[Tool | ToolSchema] = [],
+        json_output: Optional[bool] = None,
+        extra_create_args: Mapping[str, Any] = {},
+        cancellation_token: Optional[CancellationToken] = None,
+    ) -> AsyncGenerator[Union[str, CreateResult], None]:
+        key = prefix_hash(messages, tools)
+        self._record(key)
+        return self.client.create_stream(
+            messages,
+            tools=tools,
+            json_output=json_output,
+            extra_create_args=self._create_args(key, extra_create_args),
+            cancellation_token=cancellation_token,
+        )
+
+    def _count_messages(self, messages: Sequence[LLMMessage]) -> int:
+        return sum(TOKENS_PER_MESSAGE + self.count(message_text(message)) for message in messages)
+
+    def _count_history(self, messages: Sequence[LLMMessage]) -> int:
+        tokens = 0
+        for message in messages:
+            text = message_text(message)
+            message_tokens = self._message_tokens.get(text)
+            if message_tokens is None:
+                message_tokens = TOKENS_PER_MESSAGE + self.count(text)
+                self._message_tokens[text] = message_tokens
+                if len(self._message_tokens) > self.max_messages:
+                    self._message_tokens.popitem(last=False)
+            else:
+                self._message_tokens.move_to_end(text)
+            tokens += message_tokens
+        return tokens
+
+    def count_tokens(self, messages: Sequence[LLMMessage], *, tools: Sequence[Tool | ToolSchema] = []) -> int:
+        self.stats.counts += 1
+        prefix = static_prefix(messages)
+        key = prefix_hash(messages, tools)
+        prefix_tokens = self._prefix_tokens.get(key)
+        if prefix_tokens is None:
+            tool_schemas = [tool.schema if isinstance(tool, Tool) else tool for tool in tools]
+            prefix_tokens = self._count_messages(prefix) + sum(self.count(json.dumps(schema)) for schema in tool_schemas)
+            self._prefix_tokens[key] = prefix_tokens
+            if len(self._prefix_tokens) > self.max_prefixes:
+                self._prefix_tokens.popitem(last=False)
+        else:
+            self.stats.counted_from_cache += 1
+            self._prefix_tokens.move_to_end(key)
+        return prefix_tokens + self._count_history(messages[len(prefix):]) + TOKENS_PER_REPLY
+
+    def remaining_tokens(self, messages: Sequence[LLMMessage], *, tools: Sequence[Tool | ToolSchema] = []) -> int:
+        return self.client.remaining_tokens(messages, tools=tools)
+
+    async def close(self) -> None:
+        await self.client.close()
+
+    def actual_usage(self) -> RequestUsage:
+        return self.client.actual_usage()
+
+    def total_usage(self) -> RequestUsage:
+        return self.client.total_usage()
+
+    @property
+    def capabilities(self) -> ModelCapabilities:  # type: ignore
+        warnings.warn("capabilities is deprecated, use model_info instead", DeprecationWarning, stacklevel=2)
+        return self.client.capabilities
+
+    @property
+    def model_info(self) -> ModelInfo:
+        return self.client.model_info
+
+
+# The benchmark: a mock of a provider that caches prompt prefixes, with several replicas, each with its own cache.
+# Like OpenAI's, the cache holds the prompt in blocks of 128 tokens, from 1024 tokens on, and a request is routed
+# to a replica by its prefix-cache key when it has one (and at random otherwise).
+
+CACHE_MIN_TOKENS = 1024
+CACHE_BLOCK_TOKENS = 128
+
+
+def run_mock_provider(port: int, replicas: int, base_latency: float, seconds_per_token: float) -> None:
+    """Serve a mock of the chat completions API, whose time to first token grows with the uncached prompt tokens."""
+    from aiohttp import web
+
+    caches: List[set] = [set() for _ in range(replicas)]
+
+    async def complete(request: web.Request) -> web.Response:
+        body = await request.json()
+        key = body.get("prompt_cache_key")
+        replica = caches[int(hashlib.sha256(key.encode()).hexdigest(), 16) % replicas if key else random.randrange(replicas)]
+        # The prompt, as the provider tokenizes it (~4 characters per token).
+        prompt = json.dumps([body.get("tools"), body["messages"]], sort_keys=True)
+        tokens = len(prompt) // 4
+        blocks = [
+            hashlib.sha256(prompt[: end * 4].encode()).hexdigest()
+            for end in range(CACHE_MIN_TOKENS, tokens + 1, CACHE_BLOCK_TOKENS)
+        ]
+        cached = 0
+        for end, block in zip(range(CACHE_MIN_TOKENS, tokens + 1, CACHE_BLOCK_TOKENS), blocks):
+            if block not in replica:
+                break
+            cached = end
+        replica.update(blocks)
+        await asyncio.sleep(base_latency + (tokens - cached) * seconds_per_token)
+        return web.json_response({
+            "id": "mock",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "mock"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": "OK."}, "finish_reason": "stop"}],
+            "usage": {
+                "prompt_tokens": tokens,
+                "completion_tokens": 2,
+                "total_tokens": tokens + 2,
+                "prompt_tokens_details": {"cached_tokens": cached},
+            },
+        })
+
+    app = web.Application()
+    app.router.add_post("/{path:.*}chat/completions", complete)
+    web.run_app(app, host="127.0.0.1", port=port, print=None)
+
+
+# Stand-ins for the agents' system messages: a few paragraphs each, like the specialists of 2.3.
+AGENT_ROLES = ["system_analyst", "planning_agent", "architect", "security_expert", "devops_engineer", "report_writer"]
+
+
+def agent_system_message(agent: str) -> str:
+    paragraph = (
+        f"As the {agent.replace('_', ' ')} of a software design team, you review the requirements, the constraints "
+        "and the decisions taken so far, and you write your part of the design: the components, their interfaces, "
+        "the data they own, the failure modes they must handle, and the trade-offs you made, with their reasons. "
+    )
+    return "\n\n".join(f"{i + 1}. {paragraph * 4}" for i in range(6))
+
+
+async def run_calls(endpoint: str, calls: int, cache_hint_arg: Optional[str]) -> Tuple[float, PrefixStats]:
+    """
+    Make `calls` calls, round-robin over the agents, each with its system message and a growing history.
+
+    Returns:
+        Tuple[float, PrefixStats]: The average latency of a call, and the client's prefix stats.
+    """
+    from autogen_ext.models.azure import AzureAIChatCompletionClient
+    from azure.core.credentials import AzureKeyCredential
+
+    client = PrefixCachingChatCompletionClient(
+        AzureAIChatCompletionClient(
+            model="gpt-4o-mini",
+            endpoint=endpoint,
+            credential=AzureKeyCredential("mock"),
+            model_info={"json_output": True, "function_calling": True, "vision": False, "family": "unknown"},
+        ),
+        cache_hint_arg=cache_hint_arg,
+    )
+    history: List[LLMMessage] = [UserMessage(content="Design a URL shortener for 100M links a day.", source="user")]
+    latencies = []
+    try:
+        for i in range(calls):
+            agent = AGENT_ROLES[i % len(AGENT_ROLES)]
+            started = time.monotonic()
+            result = await client.create([SystemMessage(content=agent_system_message(agent))] + history)
+            latencies.append(time.monotonic() - started)
+            history.append(UserMessage(content=f"[{agent}] {result.content} " + "Details of this step. " * 20, source=agent))
+    finally:
+        await client.close()
+    return sum(latencies) / len(latencies), client.stats
+
+
+def measure_token_counts(calls: int, count: Callable[[str], int] = count_text_tokens) -> Tuple[float, float]:
+    """
+    The average time of `count_tokens` on the benchmark's requests, with the token counts cached, and without.
+
+    Returns:
+        Tuple[float, float]: The average time with the cache, and without it, in seconds.
+    """
+    history: List[LLMMessage] = [UserMessage(content="Design a URL shortener for 100M links a day.", source="user")]
+    requests = []
+    for i in range(calls):
+        agent = AGENT_ROLES[i % len(AGENT_ROLES)]
+        requests.append([SystemMessage(content=agent_system_message(agent))] + list(history))
+        history.append(UserMessage(content=f"[{agent}] OK. " + "Details of this step. " * 20, source=agent))
+    timings = []
+    from autogen_ext.models.replay import ReplayChatCompletionClient
+
+    for cached in (True, False):
+        client = PrefixCachingChatCompletionClient(
+            ReplayChatCompletionClient([]), count=count, max_prefixes=256 if cached else 0, max_messages=1024 if cached else 0
+        )
+        started = time.perf_counter()
+        for messages in requests:
+            client.count_tokens(messages)
+        timings.append((time.perf_counter() - started) / calls)
+    return timings[0], timings[1]
+
+
+def main() -> None:
+    import multiprocessing
+
+    parser = argparse.ArgumentParser(description="Benchmark the prefix-cache hint against a mock provider with prefix caching.")
+    parser.add_argument("--calls", type=int, default=60, help="The number of calls per run.")
+    parser.add_argument("--replicas", type=int, default=4, help="The number of replicas of the mock provider, each with its own cache.")
+    parser.add_argument("--base-latency", type=float, default=0.05, help="The mock's time to first token of a fully cached prompt, in seconds.")
+    parser.add_argument("--ms-per-1k-tokens", type=float, default=40, help="The mock's extra time per 1000 uncached prompt tokens, in ms.")
+    parser.add_argument("--port", type=int, default=8920, help="The port of the mock provider.")
+    args = parser.parse_args()
+
+    endpoint = f"http://127.0.0.1:{args.port}"
+    print(f"{args.calls} calls, {len(AGENT_ROLES)} agents, mock provider with {args.replicas} replica(s)")
+    for label, hint in (("without the cache hint", None), ("with the cache hint", "prompt_cache_key")):
+        # A fresh provider (with empty caches) for each run.
+        provider = multiprocessing.Process(
+            target=run_mock_provider, args=(args.port, args.replicas, args.base_latency, args.ms_per_1k_tokens / 1e6), daemon=True
+        )
+        provider.start()
+        time.sleep(1)
+        try:
+            latency, stats = asyncio.run(run_calls(endpoint, args.calls, hint))
+        finally:
+            provider.terminate()
+            provider.join()
+        print(f"{label:>24}: {1000 * latency:6.1f} ms per call. {stats.report()}")
+    try:
+        cached, uncached = measure_token_counts(args.calls)
+    except Exception as e:
+        print(f"Token counts not measured: {type(e).__name__}: {e}")
+    else:
+        print(f"count_tokens: {1e6 * cached:.0f} us per call with the token counts cached, {1e6 * uncached:.0f} us without.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""
+Runs the Chainlit app on several worker processes behind a local router.
+
+Each browser session is pinned to one worker with a cookie (sticky routing), so its
+websocket and polling requests keep landing on the same process. The team state and
+the model & tool caches live in the shared store (see `session_store.py`), so if a
+worker goes away, any other worker can pick the session up.
+
+Usage:
+    python router.py --workers 4 --port 8000
+"""
+
+import os
+import sys
+import random
+import asyncio
+import argparse
+import subprocess
+from typing import List
+
+import aiohttp
+from aiohttp import web
+
+
+WORKER_COOKIE = "agent_worker"
+
+# Headers that only make sense for a single hop, and must not be forwarded by a proxy.
+HOP_BY_HOP_HEADERS = {
+    "connection", "keep-alive", "proxy-authenticate", "proxy-authorization",
+    "te", "trailers", "transfer-encoding", "upgrade", "content-length", "host",
+}
+
+
+def start_workers(count: int, base_port: int) -> List[subprocess.Popen]:
+    """
+    Start the Chainlit app on `count` worker processes, listening on consecutive ports.
+
+    Args:
+        count (int): The number of worker processes.
+        base_port (int): The port of the first worker.
+
+    Returns:
+        List[subprocess.Popen]: The worker processes.
+    """
+    workers = []
+    for i in range(count):
+        env = dict(os.environ, AGENT_WORKER_ID=str(i))
+        workers.append(subprocess.Popen(
+            [sys.executable, "-m", "chainlit", "run", "app.py", "--headless", "--host", "127.0.0.1", "--port", str(base_port + i)],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            env=env,
+        ))
+    return workers
+
+
+class Router:
+    """
+    A sticky reverse proxy for HTTP and websocket traffic in front of the workers.
+
+    Args:
+        worker_urls (List[str]): The base URLs of the workers.
+    """
+
+    def __init__(self, worker_urls: List[str]):
+        self.worker_urls = worker_urls
+        self.session: aiohttp.ClientSession = None
+
+    async def start(self, app: web.Application) -> None:
+        # One pooled client session is shared by all proxied requests.
+        self.session = aiohttp.ClientSession(auto_decompress=False, timeout=aiohttp.ClientTimeout(total=None))
+
+    async def stop(self, app: web.Application) -> None:
+        await self.session.close()
+
+    def pick_worker(self, request: web.Request) -> int:
+        try:
+            index = int(request.cookies.get(WORKER_COOKIE, ""))
+            if 0 <= index < len(self.worker_urls):
+                return index
+        except ValueError:
+            pass
+        return random.randrange(len(self.worker_urls))
+
+    async def handle(self, request: web.Request) -> web.StreamResponse:
+        index = self.pick_worker(request)
+        # Try the sticky worker first; any other worker can serve the session if it is down.
+        candidates = [index] + [i for i in range(len(self.worker_urls)) if i != index]
+        for i in candidates:
+            try:
+                if request.headers.get("Upgrade", "").lower() == "websocket":
+                    return await self.proxy_websocket(request, i)
+                return await self.proxy_http(request, i)
+            except aiohttp.ClientConnectionError:
+                continue
+        return web.Response(status=502, text="No worker available")
+
+    def forward_headers(self, headers) -> dict:
+        return {k: v for k, v in headers.items() if k.lower() not in HOP_BY_HOP_HEADERS}
+
+    async def proxy_http(self, request: web.Request, index: int) -> web.Response:
+        url = self.worker_urls[index] + request.rel_url.path_qs
+        async with self.session.request(
+            request.method,
+            url,
+            headers=self.forward_headers(request.headers),
+            data=await request.read(),
+            allow_redirects=False,
+        ) as upstream:
+            body = await upstream.read()
+            response = web.Response(status=upstream.status, body=body, headers=self.forward_headers(upstream.headers))
+        if request.cookies.get(WORKER_COOKIE) != str(index):
+            response.set_cookie(WORKER_COOKIE, str(index), httponly=True, samesite="Lax")
+        return response
+
+    async def proxy_websocket(self, request: web.Request, index: int) -> web.WebSocketResponse:
+        url = self.worker_urls[index].replace("http", "ws", 1) + request.rel_url.path_qs
+        headers = {k: v for k, v in self.forward_headers(request.headers).items() if not k.lower().startswith("sec-websocket")}
+        # Connect upstream first, so that a dead worker falls through to the next candidate.
+        upstream = await self.session.ws_connect(url, headers=headers)
+        downstream = web.WebSocketResponse()
+        await downstream.prepare(request)
+
+        async def pump(source, sink) -> None:
+            async for msg in source:
+                if msg.type == aiohttp.WSMsgType.TEXT:
+                    await sink.send_str(msg.data)
+                elif msg.type == aiohttp.WSMsgType.BINARY:
+                    await sink.send_bytes(msg.data)
+                else:
+                    break
+
+        tasks = [asyncio.create_task(pump(upstream, downstream)), asyncio.create_task(pump(downstream, upstream))]
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in tasks:
+            task.cancel()
+        await upstream.close()
+        await downstream.close()
+        return downstream
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run the Chainlit app on several workers behind a sticky router.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Number of worker processes.")
+    parser.add_argument("--port", type=int, default=8000, help="Port of the router.")
+    parser.add_argument("--worker-base-port", type=int, default=8100, help="Port of the first worker.")
+    args = parser.parse_args()
+
+    workers = start_workers(args.workers, args.worker_base_port)
+    router = Router([f"http://127.0.0.1:{args.worker_base_port + i}" for i in range(args.workers)])
+
+    app = web.Application(client_max_size=100 * 1024 * 1024)
+    app.router.add_route("*", "/{path:.*}", router.handle)
+    app.on_startup.append(router.start)
+    app.on_cleanup.append(router.stop)
+
+    try:
+        web.run_app(app, host="127.0.0.1", port=args.port)
+    finally:
+        for worker in workers:
+            worker.terminate()
+        for worker in workers:
+            worker.wait()
+
+
+if __name__ == "__main__":
+    main()
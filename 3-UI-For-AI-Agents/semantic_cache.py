@@ -0,0 +1,339 @@
+import os
+import re
+import json
+import time
+import uuid
+import asyncio
+import argparse
+import datetime
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, List, Optional, Sequence, Tuple
+
+from lazy_imports import lazy_import
+
+if TYPE_CHECKING:
+    from autogen_agentchat.base import TaskResult
+
+# Imported on first use, so importing this module doesn't slow down the startup.
+chromadb = lazy_import("chromadb")
+agentchat_messages = lazy_import("autogen_agentchat.messages")
+
+
+DEFAULT_CACHE_PATH = os.getenv("SEMANTIC_CACHE_PATH", ".semantic_cache")
+
+# Words that ask for up-to-date information. Answers to such tasks that were based on tool calls (e.g. a web search)
+# are only reused for a short while.
+FRESHNESS_PATTERN = re.compile(
+    r"\b(latest|current|currently|today|now|recent|recently|news|trending|upcoming|this (week|month|quarter|year))\b",
+    re.IGNORECASE,
+)
+
+
+def needs_fresh_data(task: str) -> bool:
+    """Whether the task asks for up-to-date information, e.g. "latest trends" or "jobs in <this year>"."""
+    if FRESHNESS_PATTERN.search(task):
+        return True
+    return any(int(year) >= datetime.date.today().year for year in re.findall(r"\b(20\d\d)\b", task))
+
+
+@dataclass
+class CacheHit:
+    """A cached answer to a task similar to the one looked up."""
+
+    id: str
+    task: str
+    messages: List[Tuple[str, str]]
+    similarity: float
+    latency: float
+    tools: List[str]
+
+
+@dataclass
+class CacheStats:
+    """Hits, misses & the latency saved by the cache."""
+
+    lookups: int = 0
+    served: int = 0
+    seeded: int = 0
+    misses: int = 0
+    stale: int = 0
+    lookup_seconds: float = 0.0
+    saved_seconds: float = 0.0
+
+    @property
+    def hit_rate(self) -> float:
+        return self.served / self.lookups if self.lookups else 0.0
+
+    def report(self) -> str:
+        average_lookup = 1000 * self.lookup_seconds / self.lookups if self.lookups else 0.0
+        return (
+            f"Semantic cache: {self.lookups} lookup(s), {self.served} served ({100 * self.hit_rate:.0f}% hit rate), "
+            f"{self.seeded} seeded, {self.misses} missed, {self.stale} stale.\n"
+            f"Average lookup: {average_lookup:.1f} ms. Latency saved: {self.saved_seconds:.1f} s."
+        )
+
+
+class SemanticCache:
+    """
+    A cache of answers, looked up by the meaning of the task rather than its exact text, so that near-identical
+    questions ("latest tech trends 2025", "tech industry trends this year") share an answer.
+
+    Tasks are embedded with Chroma's default embedding model (all-MiniLM-L6-v2, run locally with ONNX),
+    and kept in a persistent Chroma collection, with the answer & an expiry time.
+
+    - A task whose closest cached task is at least `threshold` similar is answered from the cache.
+    - A task that is at least `seed_threshold` similar is run as usual, but with the cached answer as a starting point.
+    - An answer based on tool calls, to a task that asks for up-to-date information, is only served for `fresh_ttl` seconds.
+    - An answer that depends on more than the task (e.g. on the memories retrieved for it) is stored with a `context`,
+      a fingerprint of the rest, and only looked up with the same one.
+
+    Args:
+        path (str): The directory of the persistent Chroma collection.
+        threshold (float): The cosine similarity from which a cached answer is served.
+        seed_threshold (float): The cosine similarity from which a cached answer is used to seed the run.
+        ttl (float): Seconds after which a cached answer expires.
+        fresh_ttl (float): Seconds after which a tool-based answer to a task that needs fresh data is stale.
+        collection_name (str): The name of the collection, to keep the caches of different agents apart.
+        embedding_function (optional): The Chroma embedding function; Chroma's default if not given.
+    """
+
+    def __init__(
+        self,
+        path: str = DEFAULT_CACHE_PATH,
+        threshold: float = 0.9,
+        seed_threshold: float = 0.8,
+        ttl: float = 7 * 24 * 60 * 60,
+        fresh_ttl: float = 60 * 60,
+        collection_name: str = "answers",
+        embedding_function: Optional[Any] = None,
+    ):
+        self.threshold = threshold
+        self.seed_threshold = seed_threshold
+        self.ttl = ttl
+        self.fresh_ttl = fresh_ttl
+        self.stats = CacheStats()
+        client = chromadb.PersistentClient(path=path)
+        kwargs = {"embedding_function": embedding_function} if embedding_function is not None else {}
+        self.collection = client.get_or_create_collection(collection_name, metadata={"hnsw:space": "cosine"}, **kwargs)
+
+    def lookup(self, task: str, context: str = "") -> Optional[CacheHit]:
+        """
+        Find the cached answer to the most similar task, if it is similar enough to serve or to seed the run.
+
+        Args:
+            task (str): The task.
+            context (str): The fingerprint of what else the answer depends on, if anything.
+
+        Returns:
+            Optional[CacheHit]: The cached answer, or None on a miss.
+        """
+        started = time.monotonic()
+        self.stats.lookups += 1
+        hit = self._lookup(task, context)
+        lookup_seconds = time.monotonic() - started
+        self.stats.lookup_seconds += lookup_seconds
+
+        if hit is None:
+            self.stats.misses += 1
+        elif hit.similarity >= self.threshold:
+            self.stats.served += 1
+            self.stats.saved_seconds += max(hit.latency - lookup_seconds, 0.0)
+        else:
+            self.stats.seeded += 1
+        return hit
+
+    def _lookup(self, task: str, context: str) -> Optional[CacheHit]:
+        now = time.time()
+        where = {"expires_at": {"$gt": now}}
+        if context:
+            where = {"$and": [where, {"context": context}]}
+        result = self.collection.query(
+            query_texts=[task],
+            n_results=1,
+            where=where,
+            include=["documents", "metadatas", "distances"],
+        )
+        if not result["ids"][0]:
+            return None
+
+        metadata = result["metadatas"][0][0]
+        hit = CacheHit(
+            id=result["ids"][0][0],
+            task=result["documents"][0][0],
+            messages=[tuple(message) for message in json.loads(metadata["messages"])],
+            similarity=1 - result["distances"][0][0],
+            latency=metadata["latency"],
+            tools=[tool for tool in metadata["tools"].split(",") if tool],
+        )
+        if hit.similarity < self.seed_threshold:
+            return None
+        if hit.tools and needs_fresh_data(task) and now - metadata["created_at"] > self.fresh_ttl:
+            # The answer was based on data that is too old for this task: drop it, so it is refreshed.
+            self.stats.stale += 1
+            self.collection.delete(ids=[hit.id])
+            return None
+        return hit
+
+    def seed(self, task: str, hit: CacheHit) -> str:
+        """The task, with a cached answer to a similar task as a starting point."""
+        answer = "\n\n".join(content for _, content in hit.messages)
+        return (
+            f"{task}\n\n"
+            f"(For reference, this is an earlier answer to a similar question, \"{hit.task}\". "
+            f"Reuse what still applies, and update or complete the rest.)\n{answer}"
+        )
+
+    def follow_up(self, task: str, previous_task: str, messages: Sequence[Tuple[str, str]]) -> str:
+        """
+        A follow-up task, with the exchange that was answered from the cache, which the agents never saw.
+        """
+        answer = "\n\n".join(content for _, content in messages)
+        return f"Earlier, I asked: {previous_task}\nThe answer was:\n{answer}\n\nNow: {task}"
+
+    def store(
+        self, task: str, messages: Sequence[Tuple[str, str]], tools: Sequence[str] = (), latency: float = 0.0, context: str = ""
+    ) -> None:
+        """
+        Cache the answer to a task.
+
+        Args:
+            task (str): The task.
+            messages (Sequence[Tuple[str, str]]): The (source, content) of the messages that answer it.
+            tools (Sequence[str]): The names of the tools called to answer it.
+            latency (float): Seconds it took to answer it, i.e. what a hit saves.
+            context (str): The fingerprint of what else the answer depends on, if anything.
+        """
+        if not messages:
+            return
+        now = time.time()
+        self.collection.add(
+            ids=[str(uuid.uuid4())],
+            documents=[task],
+            metadatas=[
+                {
+                    "messages": json.dumps(list(messages)),
+                    "tools": ",".join(sorted(set(tools))),
+                    "latency": latency,
+                    "created_at": now,
+                    "expires_at": now + self.ttl,
+                    "context": context,
+                }
+            ],
+        )
+        # Drop the expired answers along the way.
+        self.collection.delete(where={"expires_at": {"$lt": now}})
+
+    def store_result(
+        self,
+        task: str,
+        result: "TaskResult",
+        latency: float,
+        side_effect_tools: Sequence[str] = ("write_report",),
+        context: str = "",
+    ) -> bool:
+        """
+        Cache the answer of an agent's or team's run, unless it called a tool with side effects
+        (e.g. writing a file), which serving it from the cache would skip.
+
+        Returns:
+            bool: Whether the answer was cached.
+        """
+        tools = [call.name for message in result.messages if isinstance(message, agentchat_messages.ToolCallRequestEvent) for call in message.content]
+        if any(tool in side_effect_tools for tool in tools):
+            return False
+        messages = [(message.source, message.content) for message in result.messages if isinstance(message, agentchat_messages.TextMessage) and message.source != "user"]
+        self.store(task, messages, tools, latency, context)
+        return bool(messages)
+
+
+async def run_cached(
+    cache: SemanticCache, task: str, run: Callable[[str], Awaitable["TaskResult"]], context: str = ""
+) -> "TaskResult | CacheHit":
+    """
+    Answer a task from the cache, or run it (seeded with a similar cached answer, if any) and cache its answer.
+
+    Args:
+        cache (SemanticCache): The cache.
+        task (str): The task.
+        run (Callable): Runs the task and returns its result, e.g. `lambda task: Console(agent.run_stream(task=task))`.
+        context (str): The fingerprint of what else the answer depends on, if anything (see `SemanticCache`).
+
+    Returns:
+        TaskResult | CacheHit: The result of the run, or the cached answer if it was served from the cache.
+    """
+    hit = await asyncio.to_thread(cache.lookup, task, context)
+    if hit is not None and hit.similarity >= cache.threshold:
+        print(f"---------- cached answer (similarity {hit.similarity:.2f} to \"{hit.task}\") ----------")
+        for source, content in hit.messages:
+            print(f"[{source}]\n{content}")
+        return hit
+
+    started = time.monotonic()
+    result = await run(cache.seed(task, hit) if hit is not None else task)
+    await asyncio.to_thread(cache.store_result, task, result, time.monotonic() - started, context=context)
+    return result
+
+
+def replay(cache: SemanticCache, seeds: Sequence[Tuple[str, str]], queries: Sequence[str], latency: float) -> CacheStats:
+    """
+    Replay a log of queries against the cache, in two passes: first the answers of the `seeds` are stored, as the
+    agents would have after running them, then the `queries` are looked up. The answers stored here are removed at
+    the end, so the cache is left as it was.
+
+    Args:
+        cache (SemanticCache): The cache.
+        seeds (Sequence[Tuple[str, str]]): The (task, answer) stored in the first pass.
+        queries (Sequence[str]): The tasks looked up in the second pass.
+        latency (float): Seconds it takes the agents to answer a task, i.e. what a hit saves.
+
+    Returns:
+        CacheStats: The hits, misses & latency saved of the lookups.
+    """
+    existing = set(cache.collection.get(include=[])["ids"])
+    for task, answer in seeds:
+        cache.store(task, [("assistant", answer)], latency=latency)
+
+    cache.stats = CacheStats()
+    try:
+        for query in queries:
+            hit = cache.lookup(query)
+            outcome = "miss" if hit is None else ("served" if hit.similarity >= cache.threshold else "seeded")
+            similar = f" <- \"{hit.task}\" ({hit.similarity:.2f})" if hit is not None else ""
+            print(f"{outcome:>7}: {query}{similar}")
+    finally:
+        seeded = [answer_id for answer_id in cache.collection.get(include=[])["ids"] if answer_id not in existing]
+        if seeded:
+            cache.collection.delete(ids=seeded)
+    return cache.stats
+
+
+def read_log(path: str) -> List[Tuple[str, str]]:
+    """The (query, answer) of each line of a log: `query`, or `query<TAB>answer`."""
+    with open(path, encoding="utf-8") as f:
+        lines = [line.rstrip("\n").split("\t", 1) for line in f if line.strip()]
+    return [(line[0].strip(), line[1].strip() if len(line) > 1 else f"(The answer to: {line[0].strip()})") for line in lines]
+
+
+if __name__ == "__main__":
+    # Replay a log of queries against the cache, and report the hit rate & the latency saved.
+    parser = argparse.ArgumentParser(description="Replay a query log against the semantic cache.")
+    parser.add_argument("query_log", help="A file with one query per line, looked up in the cache.")
+    parser.add_argument(
+        "--seed",
+        help="A file with one query (or query<TAB>answer) per line, whose answers are stored before the lookups. "
+        "By default, the first half of the query log is stored, and the second half looked up.",
+    )
+    parser.add_argument("--path", default=DEFAULT_CACHE_PATH, help="The directory of the cache.")
+    parser.add_argument("--collection", default="replay", help="The collection of the cache, e.g. that of an agent.")
+    parser.add_argument("--threshold", type=float, default=0.9, help="The similarity from which an answer is served.")
+    parser.add_argument("--latency", type=float, default=30.0, help="Seconds it takes the agents to answer a query.")
+    args = parser.parse_args()
+
+    cache = SemanticCache(path=args.path, threshold=args.threshold, collection_name=args.collection)
+    log = read_log(args.query_log)
+    if args.seed:
+        seeds, queries = read_log(args.seed), [query for query, _ in log]
+    else:
+        seeds, queries = log[: len(log) // 2], [query for query, _ in log[len(log) // 2 :]]
+    print(f"Stored {len(seeds)} answer(s), looking up {len(queries)} task(s) in \"{args.collection}\".")
+    print(replay(cache, seeds, queries, args.latency).report())
@@ -0,0 +1,131 @@
+import os
+import json
+import time
+import pickle
+import sqlite3
+import threading
+from typing import Any, Mapping, Optional, TypeVar
+
+from autogen_core import CacheStore
+
+T = TypeVar("T")
+
+# All worker processes point at the same file, so any of them can pick up any session.
+# This is a local stand-in for Redis: one SQLite database in WAL mode, shared by every worker on the host.
+DEFAULT_STORE_PATH = os.getenv("AGENT_STORE_PATH", os.path.join(os.path.dirname(__file__), ".agent_store.sqlite3"))
+
+
+class SharedStore:
+    """
+    A small key-value store with optional expiry, backed by SQLite.
+
+    Every process opens its own connection; SQLite's write-ahead log lets readers and
+    a writer work concurrently, so the store can be shared across worker processes.
+
+    Args:
+        path (str): The path of the SQLite database file.
+        namespace (str): A prefix that separates this store's keys from others in the same file.
+    """
+
+    def __init__(self, path: str = DEFAULT_STORE_PATH, namespace: str = "default"):
+        self.path = path
+        self.namespace = namespace
+        self._local = threading.local()
+        with self._connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS kv ("
+                "key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL)"
+            )
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite3 connections must not be shared between threads, and the store is used from several: the event loop's,
+        # and the threads of `asyncio.to_thread` (e.g. the tools' cache calls).
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _key(self, key: str) -> str:
+        return f"{self.namespace}:{key}"
+
+    def get_bytes(self, key: str) -> Optional[bytes]:
+        row = self._connection().execute(
+            "SELECT value, expires_at FROM kv WHERE key = ?", (self._key(key),)
+        ).fetchone()
+        if row is None:
+            return None
+        value, expires_at = row
+        if expires_at is not None and expires_at < time.time():
+            self.delete(key)
+            return None
+        return value
+
+    def set_bytes(self, key: str, value: bytes, ttl: Optional[float] = None) -> None:
+        expires_at = time.time() + ttl if ttl else None
+        self._connection().execute(
+            "INSERT OR REPLACE INTO kv (key, value, expires_at) VALUES (?, ?, ?)",
+            (self._key(key), value, expires_at),
+        )
+
+    def delete(self, key: str) -> None:
+        self._connection().execute("DELETE FROM kv WHERE key = ?", (self._key(key),))
+
+    def get_text(self, key: str) -> Optional[str]:
+        value = self.get_bytes(key)
+        return value.decode("utf-8") if value is not None else None
+
+    def set_text(self, key: str, value: str, ttl: Optional[float] = None) -> None:
+        self.set_bytes(key, value.encode("utf-8"), ttl)
+
+
+class TeamStateStore:
+    """
+    Keeps the state of each chat session's team in the shared store, instead of in process memory.
+
+    Args:
+        store (SharedStore): The store to keep the team states in.
+        ttl (float): Seconds after which an idle session's state is dropped.
+    """
+
+    def __init__(self, store: Optional[SharedStore] = None, ttl: float = 24 * 60 * 60):
+        self.store = store or SharedStore(namespace="team_state")
+        self.ttl = ttl
+
+    def load(self, session_id: str) -> Optional[Mapping[str, Any]]:
+        value = self.store.get_text(session_id)
+        return json.loads(value) if value is not None else None
+
+    def save(self, session_id: str, state: Mapping[str, Any]) -> None:
+        self.store.set_text(session_id, json.dumps(state, default=str), self.ttl)
+
+    def delete(self, session_id: str) -> None:
+        self.store.delete(session_id)
+
+
+class SQLiteCacheStore(CacheStore[T]):
+    """
+    A CacheStore for `ChatCompletionCache` that keeps model responses in the shared store,
+    so a response cached by one worker is a hit on every other worker.
+
+    Args:
+        store (SharedStore): The store to keep the cached responses in.
+        ttl (float, optional): Seconds after which a cached response expires.
+    """
+
+    def __init__(self, store: Optional[SharedStore] = None, ttl: Optional[float] = None):
+        self.store = store or SharedStore(namespace="llm_cache")
+        self.ttl = ttl
+
+    def get(self, key: str, default: Optional[T] = None) -> Optional[T]:
+        value = self.store.get_bytes(key)
+        return pickle.loads(value) if value is not None else default
+
+    def set(self, key: str, value: T) -> None:
+        # `ChatCompletionCache.create_stream` stores an empty list up front and fills it in place as chunks arrive,
+        # which only works for in-memory stores. Skip it, rather than caching an empty response.
+        if isinstance(value, list) and not value:
+            return
+        self.store.set_bytes(key, pickle.dumps(value), self.ttl)
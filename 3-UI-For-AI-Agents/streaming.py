@@ -0,0 +1,186 @@
+import time
+import asyncio
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, AsyncGenerator, AsyncIterator, Deque, List, Literal, Optional
+
+from autogen_agentchat.base import TaskResult
+from autogen_agentchat.messages import BaseAgentEvent, ModelClientStreamingChunkEvent
+
+
+# What a subscription does when its buffer is full:
+# - "block": the run waits for the consumer (nothing is lost, but a slow consumer slows the agents down).
+# - "drop": the oldest intermediate event (e.g. a tool call event) is dropped; chat messages & the result are always kept.
+# - "coalesce": like "drop", but streamed chunks of the same message are first merged into one.
+OverflowPolicy = Literal["block", "drop", "coalesce"]
+
+# Marks the end of the stream.
+_END = object()
+
+
+@dataclass
+class SubscriptionStats:
+    """What a subscription received, and what it lost because its consumer fell behind."""
+
+    delivered: int = 0
+    dropped: int = 0
+    coalesced: int = 0
+    max_depth: int = 0
+    blocked_seconds: float = 0.0
+
+
+class Subscription:
+    """
+    One consumer's view of a run: a bounded buffer, with its own overflow policy. Iterate over it to get the messages.
+
+    Args:
+        name (str): The name of the consumer, for the stats.
+        maxsize (int): The number of items buffered before the overflow policy applies.
+        policy (OverflowPolicy): What to do when the buffer is full.
+    """
+
+    def __init__(self, name: str, maxsize: int = 100, policy: OverflowPolicy = "drop"):
+        self.name = name
+        self.maxsize = maxsize
+        self.policy = policy
+        self.stats = SubscriptionStats()
+        self._items: Deque[Any] = deque()
+        self._changed = asyncio.Condition()
+        self._closed = False
+        self._error: Optional[BaseException] = None
+
+    @staticmethod
+    def _is_droppable(item: Any) -> bool:
+        return isinstance(item, BaseAgentEvent)
+
+    def _coalesce(self, item: Any) -> bool:
+        last = self._items[-1] if self._items else None
+        if (
+            isinstance(item, ModelClientStreamingChunkEvent)
+            and isinstance(last, ModelClientStreamingChunkEvent)
+            and last.source == item.source
+        ):
+            self._items[-1] = last.model_copy(update={"content": last.content + item.content})
+            self.stats.coalesced += 1
+            return True
+        return False
+
+    def _drop_oldest_event(self) -> bool:
+        for index, buffered in enumerate(self._items):
+            if self._is_droppable(buffered):
+                del self._items[index]
+                self.stats.dropped += 1
+                return True
+        return False
+
+    async def put(self, item: Any) -> None:
+        async with self._changed:
+            if self._closed:
+                return
+            if len(self._items) >= self.maxsize and item is not _END:
+                if self.policy == "block":
+                    started = time.monotonic()
+                    await self._changed.wait_for(lambda: len(self._items) < self.maxsize or self._closed)
+                    self.stats.blocked_seconds += time.monotonic() - started
+                    if self._closed:
+                        return
+                else:
+                    if self.policy == "coalesce" and self._coalesce(item):
+                        self._changed.notify_all()
+                        return
+                    if not self._drop_oldest_event() and self._is_droppable(item):
+                        # The buffer only holds messages that must be kept: drop the new event instead.
+                        self.stats.dropped += 1
+                        return
+            elif self.policy == "coalesce" and self._coalesce(item):
+                self._changed.notify_all()
+                return
+            self._items.append(item)
+            self.stats.max_depth = max(self.stats.max_depth, len(self._items))
+            self._changed.notify_all()
+
+    async def fail(self, error: BaseException) -> None:
+        async with self._changed:
+            self._error = error
+            self._items.append(_END)
+            self._changed.notify_all()
+
+    async def close(self) -> None:
+        """Stop receiving messages, e.g. when the consumer goes away."""
+        async with self._changed:
+            self._closed = True
+            self._items.clear()
+            self._changed.notify_all()
+
+    def __aiter__(self) -> AsyncIterator[Any]:
+        return self._iterate()
+
+    async def _iterate(self) -> AsyncIterator[Any]:
+        while True:
+            async with self._changed:
+                await self._changed.wait_for(lambda: bool(self._items) or self._closed)
+                if self._closed:
+                    return
+                item = self._items.popleft()
+                self._changed.notify_all()
+            if item is _END:
+                if self._error is not None:
+                    raise self._error
+                return
+            self.stats.delivered += 1
+            yield item
+
+
+class StreamBroadcaster:
+    """
+    Decouples a team's `run_stream()` from its consumers: the run is read as fast as it produces messages,
+    and each message is put into the bounded buffer of every subscription (e.g. the UI, a logger, metrics).
+
+    A slow consumer only fills its own buffer, and then loses intermediate events (or, with the "block" policy,
+    holds the run back), so the agents no longer wait on the slowest consumer.
+
+    Args:
+        stream: The stream of `run_stream()`.
+    """
+
+    def __init__(self, stream: AsyncGenerator[Any, None]):
+        self.stream = stream
+        self.subscriptions: List[Subscription] = []
+
+    def subscribe(self, name: str, maxsize: int = 100, policy: OverflowPolicy = "drop") -> Subscription:
+        """Add a consumer. Subscribe before `run()`, to get all the messages."""
+        subscription = Subscription(name, maxsize, policy)
+        self.subscriptions.append(subscription)
+        return subscription
+
+    async def run(self) -> Optional[TaskResult]:
+        """
+        Read the stream to the end, broadcasting every message.
+
+        Returns:
+            Optional[TaskResult]: The result of the run.
+        """
+        result = None
+        try:
+            async for message in self.stream:
+                if isinstance(message, TaskResult):
+                    result = message
+                for subscription in self.subscriptions:
+                    await subscription.put(message)
+        except BaseException as e:
+            for subscription in self.subscriptions:
+                await subscription.fail(e)
+            raise
+        for subscription in self.subscriptions:
+            await subscription.put(_END)
+        return result
+
+    def report(self) -> str:
+        """A table of the per-subscription stats."""
+        lines = [f"{'consumer':<12}{'policy':>10}{'delivered':>11}{'dropped':>9}{'coalesced':>11}{'max depth':>11}{'blocked s':>11}"]
+        for subscription in self.subscriptions:
+            s = subscription.stats
+            lines.append(
+                f"{subscription.name:<12}{subscription.policy:>10}{s.delivered:>11}{s.dropped:>9}{s.coalesced:>11}{s.max_depth:>11}{s.blocked_seconds:>11.1f}"
+            )
+        return "\n".join(lines)
@@ -1,9 +1,76 @@
 import os
 import json
-import requests
-from firecrawl import FirecrawlApp
+import asyncio
+from contextvars import ContextVar
+from typing import Awaitable, Optional, TypeVar
+from autogen_core import CancellationToken
+from lazy_imports import lazy_import
+from session_store import SharedStore
+from content_extraction import clean_markdown, extract_content
+from prefetch import ScrapePrefetcher
 
-def serper_web_search(query: str) -> str:
+aiohttp = lazy_import("aiohttp")
+
+T = TypeVar("T")
+
+SERPER_API_URL = os.getenv("SERPER_API_URL", "https://google.serper.dev")
+FIRECRAWL_API_URL = os.getenv("FIRECRAWL_API_URL", "https://api.firecrawl.dev")
+
+# Search and scrape results are shared by all worker processes, so a page fetched for one session is reused by the others.
+# The store is SQLite, whose calls block (e.g. on another process's write): the tools make them off the event loop.
+tool_cache = SharedStore(namespace="tool_cache")
+TOOL_CACHE_TTL = int(os.getenv("TOOL_CACHE_TTL", 60 * 60))
+
+
+async def load_page(url: str) -> str:
+    """The cleaned markdown of a page, from the cache, or scraped with Firecrawl (and cached)."""
+    content = await asyncio.to_thread(tool_cache.get_text, f"page:{url}")
+    if content is not None:
+        return content
+
+    headers = {"Authorization": f"Bearer {os.getenv('FIRECRAWL_API_KEY', '')}", "Content-Type": "application/json"}
+    payload = {"url": url, "formats": ["markdown"], "removeBase64Images": True}
+    async with aiohttp.ClientSession() as session:
+        async with session.post(f"{FIRECRAWL_API_URL}/v1/scrape", headers=headers, json=payload) as response:
+            if response.status != 200:
+                raise RuntimeError(f"{response.status} - {await response.text()}")
+            data = await response.json()
+    if not data.get("success") or "markdown" not in data.get("data", {}):
+        raise RuntimeError(str(data))
+    content = clean_markdown(data["data"]["markdown"], url)
+    await asyncio.to_thread(tool_cache.set_text, f"page:{url}", content, TOOL_CACHE_TTL)
+    return content
+
+
+async def cancellable(work: Awaitable[T], cancellation_token: Optional[CancellationToken]) -> T:
+    """
+    Run a tool's work as a task linked to the run's cancellation token, so that cancelling the run
+    (e.g. the user sent a new message) closes its HTTP requests, instead of letting them run to the end.
+    (`FunctionTool` only links the calls of sync functions to the token.)
+    """
+    task = asyncio.ensure_future(work)
+    if cancellation_token is not None:
+        cancellation_token.link_future(task)
+    return await task
+
+
+# While the model reads the search results, the top results are scraped into the cache in the background
+# (SCRAPE_PREFETCH=0 disables it). Each turn has its own prefetcher, so the sessions don't share a budget.
+SCRAPE_PREFETCH = os.getenv("SCRAPE_PREFETCH", "1") == "1"
+_prefetcher: ContextVar[Optional[ScrapePrefetcher]] = ContextVar("prefetcher", default=None)
+
+
+def start_prefetching() -> ScrapePrefetcher:
+    """
+    Give the turn being run a prefetcher of its own, used by the tools it calls (from the current task,
+    or the tasks it starts, e.g. the team's runtime). Cancel it at the end of the turn.
+    """
+    prefetcher = ScrapePrefetcher(load_page, top_n=3, enabled=SCRAPE_PREFETCH)
+    _prefetcher.set(prefetcher)
+    return prefetcher
+
+
+async def serper_web_search(query: str, cancellation_token: Optional[CancellationToken] = None) -> str:
     """
     Perform a web search using the Serper API and return the results.
 
@@ -13,34 +80,59 @@ def serper_web_search(query: str) -> str:
     Returns:
         str: The search results in JSON format.
     """
-    url = "https://google.serper.dev/search"
+    return await cancellable(_search(query), cancellation_token)
+
+
+async def _search(query: str) -> str:
+    prefetcher = _prefetcher.get()
+    cached = await asyncio.to_thread(tool_cache.get_text, f"search:{query}")
+    if cached is not None:
+        if prefetcher is not None:
+            prefetcher.prefetch_from_search(cached)
+        return cached
+
+    url = f"{SERPER_API_URL}/search"
     payload = json.dumps({
         "q": query,
         "gl": "in"
     })
     headers = {
-    'X-API-KEY': os.getenv("SERPER_API_KEY"),
+    'X-API-KEY': os.getenv("SERPER_API_KEY", ""),
     'Content-Type': 'application/json'
     }
-    response = requests.request("POST", url, headers=headers, data=payload)
-    if response.status_code != 200:
-        return f"Error: {response.status_code} - {response.text}"
-    return response.text
+    async with aiohttp.ClientSession() as session:
+        async with session.post(url, headers=headers, data=payload) as response:
+            text = await response.text()
+            if response.status != 200:
+                return f"Error: {response.status} - {text}"
+    await asyncio.to_thread(tool_cache.set_text, f"search:{query}", text, TOOL_CACHE_TTL)
+    if prefetcher is not None:
+        prefetcher.prefetch_from_search(text)
+    return text
 
 
-def scrape_website(url: str) -> str:
+async def scrape_website(url: str, query: str = "", cancellation_token: Optional[CancellationToken] = None) -> str:
     """
     Scrape the website content from the given URL.
 
     Args:
         url (str): The URL of the website to scrape.
+        query (str): What you are looking for on the page (e.g. "pricing plans and target audience"), to get its most relevant parts.
 
     Returns:
-        str: The scraped content from the website as markdown
-    """
-    app = FirecrawlApp(api_key=os.getenv("FIRECRAWL_API_KEY"))
-    response = app.scrape_url(url=url, params={'formats': [ 'markdown' ], 'removeBase64Images': True})
-    try:
-        return response["markdown"][:20000]
-    except KeyError:
-        return f"Error: {response}"
\ No newline at end of file
+        str: The main content of the website as markdown, without menus, banners & footers
+    """
+    return await cancellable(_scrape(url, query), cancellation_token)
+
+
+async def _scrape(url: str, query: str) -> str:
+    # The cleaned page is cached (or being prefetched), and the parts relevant to each query are extracted from it.
+    prefetcher = _prefetcher.get()
+    content = await prefetcher.get(url) if prefetcher is not None else None
+    if content is None:
+        try:
+            content = await load_page(url)
+        except Exception as e:
+            return f"Error: {str(e)}"
+    # Keep the blocks most relevant to the query, within ~3000 tokens.
+    return extract_content(content, query=query, max_tokens=3000, clean=False)